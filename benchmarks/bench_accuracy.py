@@ -0,0 +1,103 @@
+"""Suggestion accuracy of the configured backend on a prompt -> expected command dataset.
+
+Each suggestion is scored as an exact match (same words once quoting and the order of single letter
+flags are normalized) and as a program match (the same programs in the same order).
+--mock answers every prompt with its first expected command to check the harness itself offline.
+
+Usage: python -m benchmarks.bench_accuracy [--llm-api openai] [--concurrency 4] [--min-accuracy 0.6] [--mock]
+"""
+import io
+import os
+import re
+import sys
+import json
+import shlex
+import argparse
+
+from benchmarks.fake_openai import FakeOpenAIServer, scripted_reply
+
+DATASET = os.path.join(os.path.dirname(__file__), 'datasets', 'commands.jsonl')
+
+
+def normalize(command: str) -> list[str] | None:
+    """Words of a command with quoting removed and single letter flags sorted (-la == -al)."""
+    try:
+        words = shlex.split(command.strip().rstrip(';'))
+    except ValueError:
+        return None
+    return [
+        '-' + ''.join(sorted(word[1:])) if re.fullmatch(r'-[A-Za-z]{2,}', word) else word
+        for word in words
+    ]
+
+
+def score(suggestion: str | None, expected: list[str]) -> tuple[bool, bool]:
+    """Returns (exact match, program match) of a suggestion against the accepted commands."""
+    from utils.validator import command_names
+    if not suggestion:
+        return False, False
+    words = normalize(suggestion)
+    exact = words is not None and any(words == normalize(command) for command in expected)
+    try:
+        programs = command_names(suggestion)
+    except ValueError:
+        return exact, False
+    return exact, exact or any(programs == command_names(command) for command in expected)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--llm-api', default='openai', choices=['openai', 'groq', 'local'])
+    parser.add_argument('--dataset', default=DATASET)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--output', default=None, help="JSONL file with every suggestion and its score.")
+    parser.add_argument('--min-accuracy', type=float, default=0.0, help="Exit with status 1 below this exact accuracy.")
+    parser.add_argument('--mock', action='store_true')
+    args = parser.parse_args()
+
+    with open(args.dataset) as f:
+        dataset = [json.loads(line) for line in f if line.strip()]
+    server = None
+    if args.mock:
+        script = [(f"Request: {re.escape(case['prompt'])}$", f"```bash\n{case['expected'][0]}\n```") for case in dataset]
+        server = FakeOpenAIServer(reply=scripted_reply(script)).start()
+        os.environ.update(OPENAI_API_KEY='fake', OPENAI_BASE_URL=server.base_url, SHELLM_VALIDATION_API='')
+        args.llm_api = 'openai'
+
+    from core.batch import BatchRunner
+    from models.registry import LazyModel
+    from models.runtime import runtime
+    from utils.metrics import percentile
+
+    items = [{'id': index, 'line': index + 1, 'type': 'command', 'prompt': case['prompt']}
+             for index, case in enumerate(dataset)]
+    out = io.StringIO()
+    runtime.run(BatchRunner(LazyModel(args.llm_api).get(), args.concurrency, 0).run(items, out))
+    records = [json.loads(line) for line in out.getvalue().splitlines()]
+    if server:
+        server.stop()
+
+    exact_matches = program_matches = 0
+    for record in records:
+        case = dataset[record['id']]
+        record['expected'] = case['expected']
+        record['exact'], record['program'] = score(record.get('suggestion'), case['expected'])
+        exact_matches += record['exact']
+        program_matches += record['program']
+        if not record['exact']:
+            print(f"  {'~' if record['program'] else 'x'} {case['prompt']}: {record.get('suggestion') or record['error']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.writelines(json.dumps(record) + '\n' for record in records)
+
+    accuracy = exact_matches / len(records)
+    latencies = [record['latency_ms'] for record in records if not record['error']]
+    print(f"{args.llm_api}: exact {exact_matches}/{len(records)} ({accuracy:.0%}), "
+          f"same programs {program_matches}/{len(records)} ({program_matches / len(records):.0%}), "
+          f"{sum(bool(record['error']) for record in records)} errors, "
+          f"p50 {percentile(latencies, 0.5) if latencies else 0:.0f} ms")
+    sys.exit(0 if accuracy >= args.min_accuracy else 1)
+
+
+if __name__ == "__main__":
+    main()
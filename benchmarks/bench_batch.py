@@ -0,0 +1,78 @@
+"""Benchmark and checks of batch mode against a fake server with fixed latency.
+
+Measures prompts/s at increasing concurrency, then checks ordered output, the rate limiter and --resume.
+The fake server shares this process, so at high concurrency the numbers are bounded by CPU, not latency.
+
+Usage: python -m benchmarks.bench_batch [prompts] [latency_ms]
+"""
+import io
+import os
+import sys
+import json
+import time
+import tempfile
+
+from benchmarks.fake_openai import FakeOpenAIServer
+
+
+def check(condition, message):
+    print(f"  {'ok' if condition else 'FAIL'}: {message}")
+    return condition
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.1
+    server = FakeOpenAIServer(latency=latency).start()
+    os.environ.update(OPENAI_API_KEY='fake', OPENAI_BASE_URL=server.base_url, SHELLM_VALIDATION_API='',
+                      SHELLM_QA_API='', SHELLM_HEDGE_API='')
+
+    from core.batch import BatchRunner, read_items, run_batch
+    from models.registry import get_backend
+    from models.runtime import runtime
+
+    model = get_backend('openai')
+    workdir = tempfile.mkdtemp(prefix='shellm-batch-')
+    prompts = os.path.join(workdir, 'prompts.txt')
+    with open(prompts, 'w') as f:
+        for i in range(count):
+            f.write(f"## what is in file {i}\n" if i % 4 == 0 else f"list files in directory {i}\n")
+    items = read_items(prompts)
+    ok = True
+
+    print(f"throughput ({count} prompts, {latency * 1000:.0f} ms per request):")
+    throughput = {}
+    for concurrency in (1, 4, 16):
+        out = io.StringIO()
+        stats = runtime.run(BatchRunner(model, concurrency, 0).run(items, out))
+        throughput[concurrency] = stats['done'] / stats['elapsed_s']
+        print(f"  concurrency {concurrency:>2}: {throughput[concurrency]:6.1f} prompts/s  {stats['errors']} errors")
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        ok &= check([record['id'] for record in records] == [item['id'] for item in items],
+                    "results are written in input order")
+    ok &= check(throughput[16] > throughput[1] * 4, "throughput scales with concurrency")
+
+    print("rate limit (10 prompts/s):")
+    started = time.perf_counter()
+    runtime.run(BatchRunner(model, 16, 10).run(items[:30], io.StringIO()))
+    elapsed = time.perf_counter() - started
+    print(f"  30 prompts in {elapsed:.2f}s")
+    ok &= check(elapsed >= 1.8, "requests start no faster than the rate")
+
+    print("resume:")
+    output = os.path.join(workdir, 'results.jsonl')
+    with open(output, 'w') as f:
+        f.write(json.dumps({'id': 1, 'suggestion': 'ls'}) + '\n')
+        f.write(json.dumps({'id': 2, 'error': 'APIConnectionError: failed'}) + '\n')
+    server.requests = 0
+    run_batch('openai', prompts, output, 16, 0, True, resume=True)
+    with open(output) as f:
+        ids = [json.loads(line)['id'] for line in f]
+    ok &= check(server.requests == count - 1, "only prompts without a successful result are sent")
+    ok &= check(sorted(set(ids)) == list(range(1, count + 1)), "every prompt has a result after resuming")
+    server.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Micro-benchmark of pty output capture throughput (MB/s) against the previous read loop, with and without spilling to an artifact.
+
+Usage: python -m benchmarks.bench_capture [size_mb]
+"""
+import os
+import sys
+import pty
+import time
+import select
+import tempfile
+
+from core.commands import OutputCapture, relay_output
+from core.artifacts import ArtifactStore
+
+
+def legacy_read(fd, out):
+    """The original capture loop: 1 KiB reads, per-chunk decode and string concatenation."""
+    output = ""
+    while True:
+        r, _, _ = select.select([fd], [], [])
+        if fd in r:
+            try:
+                data = os.read(fd, 1024)
+                if not data:
+                    break
+                decoded_data = data.decode(errors='replace')
+                out.write(decoded_data)
+                out.flush()
+                output += decoded_data
+            except OSError:
+                break
+    return output
+
+
+def spawn(size_mb):
+    """Starts a pty child that prints size_mb of text."""
+    pid, fd = pty.fork()
+    if pid == 0:
+        os.execvp("/bin/bash", ["/bin/bash", "-c", f"yes $(printf 'x%.0s' {{1..119}}) | head -c {size_mb}M"])
+    return pid, fd
+
+
+def measure(name, size_mb, run):
+    pid, fd = spawn(size_mb)
+    started = time.perf_counter()
+    result = run(fd)
+    elapsed = time.perf_counter() - started
+    os.close(fd)
+    os.waitpid(pid, 0)
+    print(f"{name:>8}: {size_mb / elapsed:8.1f} MB/s ({elapsed:.2f}s for {size_mb} MB)")
+    return result
+
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return (time.perf_counter() - started) * 1000
+
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    with open(os.devnull, 'w') as text_sink, open(os.devnull, 'wb') as byte_sink:
+        legacy_output = measure("legacy", size_mb, lambda fd: legacy_read(fd, text_sink))
+        capture = OutputCapture()
+        measure("capture", size_mb, lambda fd: relay_output(fd, capture, byte_sink))
+        store = ArtifactStore(root=tempfile.mkdtemp(prefix='shellm-artifacts-'))
+        spill = store.writer('bench')
+        measure("spill", size_mb, lambda fd: relay_output(fd, OutputCapture(), byte_sink, spill))
+        artifact = spill.close()
+        print(f"artifact: {artifact.lines} lines, grep of {size_mb} MB in {timed(lambda: artifact.grep('error')):.0f} ms, "
+              f"tail in {timed(lambda: artifact.tail(20)):.2f} ms, range in {timed(lambda: artifact.read_lines(1000, 1020)):.2f} ms")
+    print(f"retained for the context: legacy {len(legacy_output)} characters, "
+          f"capture {len(capture.text())} characters of {capture.total_bytes} bytes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark of TAB completion latency with a huge PATH and a directory of 100k files.
+
+Usage: python -m benchmarks.bench_completion [executables] [files]
+"""
+import os
+import sys
+import time
+import random
+import tempfile
+
+from core.completion import Completer
+from utils.metrics import percentile
+
+
+def populate(directory, count, prefix, executable=False):
+    """Creates count empty files named prefix<random>."""
+    random.seed(count)
+    for i in range(count):
+        path = os.path.join(directory, f"{prefix}{random.choice('abcdefghijklmnopqrstuvwxyz')}{i}")
+        with open(path, 'w'):
+            pass
+        if executable:
+            os.chmod(path, 0o755)
+
+
+def measure(name, call, runs=200):
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        matches = call()
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(f"{name:<40} p50 {percentile(latencies, 0.5):6.3f} ms  p99 {percentile(latencies, 0.99):6.3f} ms  "
+          f"{len(matches)} matches")
+
+
+def main():
+    executables = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    files = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    with tempfile.TemporaryDirectory() as root:
+        bin_dirs = [os.path.join(root, f"bin{i}") for i in range(10)]
+        for index, directory in enumerate(bin_dirs):
+            os.mkdir(directory)
+            populate(directory, executables // len(bin_dirs), f"tool{index}", executable=True)
+        big = os.path.join(root, "big")
+        os.mkdir(big)
+        populate(big, files, "file_")
+        os.environ['PATH'] = os.pathsep.join(bin_dirs + [os.environ.get('PATH', '')])
+        completer = Completer()
+        completer.history.ready = True
+
+        started = time.perf_counter()
+        completer.executables.refresh()
+        print(f"PATH index: {len(completer.executables.trie)} executables in {(time.perf_counter() - started) * 1000:.0f} ms")
+        started = time.perf_counter()
+        completer.directories.listing(big)
+        print(f"directory listing: {files} files in {(time.perf_counter() - started) * 1000:.0f} ms (first TAB only)")
+
+        measure("program 'tool1'", lambda: completer.complete_line("tool1", 0, "tool1"))
+        measure("program 'tool3k1'", lambda: completer.complete_line("tool3k1", 0, "tool3k1"))
+        measure("program 'gi'", lambda: completer.complete_line("gi", 0, "gi"))
+        measure(f"path '{big}/file_q12'", lambda: completer.complete_line(f"ls {big}/file_q12", 3, f"{big}/file_q12"))
+        measure(f"path '{big}/' (capped)", lambda: completer.complete_line(f"ls {big}/", 3, f"{big}/"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Benchmark of the output condensation pipeline: prompt tokens before and after on recorded sessions.
+
+Usage: python -m benchmarks.bench_condense [recording ...]
+Recordings are raw pty output, the ones in benchmarks/sessions are used by default.
+"""
+import os
+import sys
+import glob
+import time
+
+from utils.condense import OutputCondenser, STEPS
+from utils.tokens import estimate_tokens
+
+SESSIONS_DIR = os.path.join(os.path.dirname(__file__), 'sessions')
+
+
+def main():
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(SESSIONS_DIR, '*.log')))
+    condenser = OutputCondenser(STEPS.values())
+    total_raw = total_condensed = 0
+    print(f"{'session':<20} {'raw':>8} {'condensed':>10} {'saved':>7} {'time':>9}")
+    for path in paths:
+        with open(path, 'rb') as f:
+            text = f.read().decode(errors='replace')
+        started = time.perf_counter()
+        condensed = condenser.condense(text)
+        elapsed = (time.perf_counter() - started) * 1000
+        raw_tokens, condensed_tokens = estimate_tokens(text), estimate_tokens(condensed)
+        total_raw += raw_tokens
+        total_condensed += condensed_tokens
+        print(f"{os.path.basename(path):<20} {raw_tokens:>8} {condensed_tokens:>10} "
+              f"{1 - condensed_tokens / max(raw_tokens, 1):>7.1%} {elapsed:>7.2f}ms")
+    print(f"{'total':<20} {total_raw:>8} {total_condensed:>10} {1 - total_condensed / max(total_raw, 1):>7.1%}")
+
+    # NOTE: Contribution of each step, applied cumulatively in pipeline order.
+    print("\ncumulative tokens per step:")
+    texts = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            texts.append(f.read().decode(errors='replace'))
+    names = list(STEPS)
+    for i in range(len(names) + 1):
+        partial = OutputCondenser([STEPS[name] for name in names[:i]])
+        tokens = sum(estimate_tokens(partial.condense(text)) for text in texts)
+        print(f"  {'+'.join(names[:i]) or 'raw':<45} {tokens:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Benchmark of the offline fast path: index build time and lookup latency with a large history.
+
+Usage: python -m benchmarks.bench_fastpath [history_entries]
+"""
+import sys
+import time
+import random
+
+from core.fastpath import FastPath
+from utils.metrics import percentile
+
+WORDS = (
+    "nginx postgres redis backup deploy logs certificate kube pod service volume network cache build release "
+    "tmp home var etc user group cron mount socket tunnel proxy queue worker node python java rust"
+).split()
+REQUESTS = (
+    "list listening ports", "find large files", "find files larger than 1G in /var/log", "show docker disk usage",
+    "find all python files", "top 5 processes by memory", "biggest folders in ~/Downloads", "show last 10 commits",
+    "restart the nginx service", "tail the postgres logs", "list files",
+)
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    random.seed(0)
+    fastpath = FastPath()
+    started = time.perf_counter()
+    fastpath.build()
+    now = time.time()
+    for i in range(entries):
+        prompt = " ".join(random.sample(WORDS, random.randint(2, 5)))
+        fastpath.add(prompt, f"echo {i}", now - random.random() * 90 * 86400)
+    print(f"index: {len(fastpath.history)} requests, {len(fastpath.templates)} template phrases, "
+          f"built in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    latencies = []
+    hits = 0
+    for _ in range(200):
+        for request in REQUESTS:
+            started = time.perf_counter()
+            hits += fastpath.suggest(request) is not None
+            latencies.append((time.perf_counter() - started) * 1000)
+    print(f"lookup: p50 {percentile(latencies, 0.5) * 1000:.0f} us, p99 {percentile(latencies, 0.99) * 1000:.0f} us, "
+          f"max {max(latencies) * 1000:.0f} us, {hits / len(latencies):.0%} answered locally")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark and checks of hedged requests and circuit breakers against fake servers with injected latency.
+
+Scenarios:
+  tail     the primary is slow on 4% of the requests, hedging should cut the tail.
+  ratelimit the primary answers 429, its circuit should open and requests go to the secondary.
+  down     the primary drops connections, the secondary should answer without waiting the hedge delay.
+  halfopen the primary's backoff expired, concurrent requests should send it a single trial request.
+
+Usage: python -m benchmarks.bench_hedging [requests]
+"""
+import os
+import sys
+import time
+import itertools
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from utils.metrics import percentile
+
+
+def run(model, context, count):
+    latencies = []
+    answered = 0
+    for i in range(count):
+        started = time.perf_counter()
+        answered += bool(model.get_command_suggestion(context, f"list files {i}"))
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies, answered
+
+
+def report(name, latencies, answered, extra=""):
+    print(f"{name:<28} p50 {percentile(latencies, 0.5):7.0f} ms  p95 {percentile(latencies, 0.95):7.0f} ms  "
+          f"p99 {percentile(latencies, 0.99):7.0f} ms  max {max(latencies):7.0f} ms  "
+          f"{answered}/{len(latencies)} answered {extra}")
+
+
+def check(condition, message):
+    print(f"  {'ok' if condition else 'FAIL'}: {message}")
+    return condition
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    os.environ.update(SHELLM_HEDGE_DELAY_MS='300', SHELLM_HEDGE_MIN_DELAY_MS='100', OPENAI_API_KEY='fake',
+                      SHELLM_LOCAL_API_KEY='fake', SHELLM_BREAKER_BACKOFF='30', SHELLM_VALIDATION_API='')
+    calls = itertools.count()
+    primary = FakeOpenAIServer(latency=lambda: 2.0 if next(calls) % 25 == 24 else 0.05).start()
+    secondary = FakeOpenAIServer(latency=0.15).start()
+    os.environ['OPENAI_BASE_URL'] = primary.base_url
+    os.environ['SHELLM_LOCAL_BASE_URL'] = secondary.base_url
+
+    from models.registry import get_backend
+    from models.hedging import HedgedModel
+    from models.breaker import breaker_for
+    from utils.schemas import Context
+    from utils.metrics import metrics
+
+    context = Context()
+    openai_model, local_model = get_backend('openai'), get_backend('local')
+    hedged = HedgedModel(openai_model, local_model)
+    ok = True
+
+    print("tail:")
+    latencies, answered = run(openai_model, context, count)
+    report("  primary only", latencies, answered)
+    metrics.counters.clear()
+    latencies_hedged, answered = run(hedged, context, count)
+    report("  hedged", latencies_hedged, answered,
+           f"({metrics.counters['hedge.suggestion.started']} hedged, {metrics.counters['hedge.suggestion.won']} won)")
+    ok &= check(max(latencies_hedged) < 1500, "no request waits out the 2 s primary stall")
+    ok &= check(answered == count, "every request is answered")
+
+    print("ratelimit:")
+    primary.status = 429
+    primary.retry_after = 30
+    primary.requests = 0
+    latencies, answered = run(hedged, context, 20)
+    report("  hedged, primary 429", latencies, answered, f"({primary.requests} requests reached the primary)")
+    ok &= check(breaker_for('openai').state == 'open', "the primary circuit is open")
+    ok &= check(primary.requests <= 3, "the primary is no longer called while its circuit is open")
+    ok &= check(answered == 20, "the secondary answers every request")
+
+    print("down:")
+    primary.status = 0
+    breaker_for('openai').record_success()
+    latencies, answered = run(hedged, context, 10)
+    report("  hedged, primary down", latencies, answered)
+    ok &= check(answered == 10, "the secondary answers every request")
+    ok &= check(percentile(latencies, 0.5) < 300, "failures hedge immediately instead of after the delay")
+
+    print("halfopen:")
+    from models.runtime import runtime
+    primary.status = 200
+    primary.latency = 1.0
+    primary.requests = 0
+    breaker_for('openai').open_until = time.monotonic()
+    futures = [runtime.submit(hedged.aget_command_suggestion(context, f"list files {i}")) for i in range(10)]
+    answered = sum(bool(future.result()) for future in futures)
+    print(f"  {answered}/10 concurrent requests answered, {primary.requests} reached the primary")
+    ok &= check(primary.requests == 1, "a half open circuit lets a single trial request through")
+    ok &= check(answered == 10, "the secondary answers the other requests")
+    ok &= check(breaker_for('openai').state == 'half-open', "a cancelled trial leaves the circuit half open")
+    primary.latency = 0.05
+    run(hedged, context, 1)
+    ok &= check(breaker_for('openai').state == 'closed', "a successful trial closes the circuit")
+    primary.stop()
+    secondary.stop()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Benchmark of prompt prefix stability: how much of each request is identical to the previous one.
+
+Providers cache prompts by exact prefix, so the share of bytes a request has in common with the previous
+request is roughly the share of its prompt that can be served from the cache. Exits with status 1 when
+the system message or history turns of a request differ from the previous one's without a history window
+cut, or when the window is cut more often than its budget allows.
+
+Usage: python -m benchmarks.bench_prompt_prefix [commands]
+"""
+import sys
+import json
+import random
+
+from core import prompts
+from utils.schemas import Context
+
+
+def common_prefix(a: str, b: str) -> int:
+    """Length of the common prefix of two strings."""
+    size = min(len(a), len(b))
+    for i in range(size):
+        if a[i] != b[i]:
+            return i
+    return size
+
+
+def serialize(messages):
+    """Serializes messages the way they go over the wire."""
+    return json.dumps(messages)
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    random.seed(0)
+    context = Context()
+    first = serialize(prompts.generate_validation_messages("ls -la"))
+    second = serialize(prompts.generate_validation_messages("du -sh ."))
+    prefix = serialize(list(prompts.VALIDATION_PREFIX))[:-1]
+    if not (first.startswith(prefix) and second.startswith(prefix)):
+        sys.exit("validation few-shot prefix differs between calls")
+    print(f"validation prefix: {len(prefix)} bytes identical across calls")
+
+    for phase, build in (('suggestion', prompts.generate_shell_messages), ('qa', prompts.generate_qa_messages)):
+        context = Context()
+        previous = previous_stable = window_start = None
+        shared = total = cuts = max_turn_tokens = 0
+        for i in range(commands):
+            command = random.choice(["ls -la", "git status", "df -h", "ps aux", "cat /etc/hosts", "make test"])
+            output = "\n".join(f"{command} line {j} {random.random()}" for j in range(random.randint(1, 60)))
+            context.last_command, context.last_output = command, output
+            context.update_session_history(command, output)
+            max_turn_tokens = max(max_turn_tokens, context.entries[-1].snippet_cost)
+            messages = build(context, f"request number {i} about {command}")
+            window = context.history_window()
+            cut = window_start is not None and (window[0].id if window else None) != window_start
+            window_start = window[0].id if window else None
+            cuts += cut
+            # NOTE: The system message and history turns only grow at the end, except when the window is cut.
+            stable = messages[:-1]
+            if previous_stable is not None and not cut and serialize(stable[:len(previous_stable)]) != serialize(previous_stable):
+                sys.exit(f"{phase}: request {i} changed the system message or history turns without a window cut")
+            previous_stable = stable
+            request = serialize(messages)
+            if previous is not None:
+                shared += common_prefix(previous, request)
+                total += len(request)
+            previous = request
+        # NOTE: A cut leaves half of the window budget, refilling the other half takes this many turns at least.
+        budget = context.token_budget // 2
+        max_cuts = commands // max((budget - budget // 2) // max(max_turn_tokens, 1), 1) + 1
+        if not 1 <= cuts <= max_cuts:
+            sys.exit(f"{phase}: {cuts} history window cuts over {commands} commands, expected 1 to {max_cuts}")
+        print(f"{phase}: {shared / total:.1%} of request bytes shared with the previous request "
+              f"over {commands} commands (average request {total // max(commands - 1, 1)} bytes), "
+              f"{cuts} window cuts")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Check and benchmark of the SSH relay against a local shell: command capture, host label and round-trip latency.
+
+`ssh` is a wrapper script running `bash --norc -i`, so the relay spawns it through a pty exactly like a real
+session. The relay runs in the main thread since it installs a SIGWINCH handler, a feeder thread types the
+commands and a drain thread reads the terminal. Exits with status 1 when a command or its output is missing
+from the context, the host label is wrong, a password typed without echo reaches the context or the SIGWINCH
+handler is not restored.
+
+Usage: python -m benchmarks.bench_ssh_relay [commands]
+"""
+import os
+import sys
+import time
+import signal
+import tempfile
+import threading
+
+from core.ssh import SSHRelay
+from utils.condense import OutputCondenser
+from utils.metrics import percentile
+
+ARGV = ['ssh', '-t', '-p', '2222', '-o', 'StrictHostKeyChecking=no', 'user@example.com', 'tmux', 'attach']
+LABEL = '[ssh user@example.com]'
+SECRET = 'hunter2-not-echoed'
+
+
+class Recorder:
+    """Stands in for SheLLM, keeping what the relay puts in the context."""
+
+    def __init__(self):
+        self.condenser = OutputCondenser()
+        self.ssh_session = None
+        self.context = []
+
+    def update_context(self, command, output, exit_code=None):
+        self.context.append((command, output))
+
+
+class Terminal:
+    """Collects everything the relay writes to the local terminal."""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.output = b''
+        self.changed = threading.Condition()
+        threading.Thread(target=self.drain, name="bench-drain", daemon=True).start()
+
+    def drain(self):
+        while True:
+            data = os.read(self.fd, 65536)
+            if not data:
+                return
+            with self.changed:
+                self.output += data
+                self.changed.notify_all()
+
+    def wait_for(self, marker: bytes, timeout=5.0) -> bool:
+        with self.changed:
+            return self.changed.wait_for(lambda: marker in self.output, timeout)
+
+
+def feed(stdin_fd, terminal, commands, latencies, failures):
+    """Types each command once the previous one printed its marker, then exits the shell."""
+    try:
+        if not terminal.wait_for(b'$ ', 10) and not terminal.wait_for(b'# ', 1):
+            failures.append("the shell prompt never appeared")
+            return
+        for i in range(commands):
+            started = time.perf_counter()
+            os.write(stdin_fd, f"echo relay-{i}-$(({i}*7))\r".encode())
+            if not terminal.wait_for(f"relay-{i}-{i * 7}".encode()):
+                failures.append(f"no output for command {i}")
+                return
+            latencies.append((time.perf_counter() - started) * 1000)
+            if i == commands // 2:
+                os.kill(os.getpid(), signal.SIGWINCH)
+        # NOTE: `read -s` turns the echo off like a password prompt does.
+        os.write(stdin_fd, b"read -rs secret; echo read-${#secret}\r")
+        time.sleep(0.2)
+        os.write(stdin_fd, f"{SECRET}\r".encode())
+        if not terminal.wait_for(f"read-{len(SECRET)}".encode()):
+            failures.append("the password prompt did not finish")
+    finally:
+        os.write(stdin_fd, b"exit\r")
+
+
+def main():
+    commands = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    directory = tempfile.mkdtemp(prefix='shellm-ssh-')
+    with open(os.path.join(directory, 'ssh'), 'w') as f:
+        f.write("#!/bin/sh\nexec bash --norc -i\n")
+    os.chmod(os.path.join(directory, 'ssh'), 0o755)
+    os.environ['PATH'] = f"{directory}{os.pathsep}{os.environ['PATH']}"
+    os.environ['PS1'] = '$ '
+
+    stdin_read, stdin_write = os.pipe()
+    stdout_read, stdout_write = os.pipe()
+    terminal = Terminal(stdout_read)
+    shellm = Recorder()
+    latencies, failures = [], []
+    feeder = threading.Thread(
+        target=feed, args=(stdin_write, terminal, commands, latencies, failures), name="bench-feed", daemon=True
+    )
+    previous_winch = signal.getsignal(signal.SIGWINCH)
+    feeder.start()
+    started = time.perf_counter()
+    SSHRelay(ARGV, shellm, stdin_fd=stdin_read, stdout_fd=stdout_write).run()
+    elapsed = time.perf_counter() - started
+    feeder.join(timeout=5)
+
+    expected = [(f"{LABEL} echo relay-{i}-$(({i}*7))", f"relay-{i}-{i * 7}") for i in range(commands)]
+    captured = {command: output for command, output in shellm.context}
+    for command, output in expected:
+        if command not in captured:
+            failures.append(f"{command!r} is not in the context")
+        elif output not in captured[command]:
+            failures.append(f"the output of {command!r} is not in the context: {captured[command]!r}")
+    if any(SECRET in command or SECRET in output for command, output in shellm.context):
+        failures.append("a line typed without echo is in the context")
+    if signal.getsignal(signal.SIGWINCH) is not previous_winch:
+        failures.append("the SIGWINCH handler was not restored")
+    if shellm.ssh_session is not None:
+        failures.append("the session was not cleared when it ended")
+
+    if latencies:
+        print(f"relay: {len(latencies)} commands in {elapsed:.2f}s, round trip p50 {percentile(latencies, 0.5):.1f} ms, "
+              f"p95 {percentile(latencies, 0.95):.1f} ms, {len(shellm.context)} commands captured")
+    if failures:
+        sys.exit("\n".join(failures[:10]))
+
+
+if __name__ == "__main__":
+    main()
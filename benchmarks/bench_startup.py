@@ -0,0 +1,92 @@
+"""Startup benchmark: import cost of main.py and time until the first prompt is rendered.
+
+Usage: python -m benchmarks.bench_startup [--runs N] [--budget-ms MS] [--client]
+Exits with status 1 when the median time to first prompt exceeds the budget or when
+a heavy SDK is imported before the first prompt. --client measures the thin client of the
+daemon mode, which must not load anything the daemon owns either.
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+
+# NOTE: These must stay lazy, they are only needed once an LLM request is made.
+LAZY_MODULES = ('openai', 'groq', 'httpx', 'pydantic')
+# NOTE: The thin client leaves the cache, journal and context to the daemon.
+CLIENT_LAZY_MODULES = LAZY_MODULES + ('sqlite3', 'core.shellm', 'models.registry')
+
+FIRST_PROMPT = (
+    "import time; started = time.perf_counter(); "
+    "import main; from core.shellm import SheLLM; from core.prompts import get_prompt; "
+    "SheLLM(llm_api='openai'); get_prompt(); "
+    "import sys; elapsed = (time.perf_counter() - started) * 1000; "
+    "print('RESULT', elapsed, ','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+CLIENT_FIRST_PROMPT = (
+    "import time; started = time.perf_counter(); "
+    "import main; from core.client import DaemonClient, ThinShell; from core.prompts import get_prompt; "
+    "ThinShell(DaemonClient('openai')); get_prompt(); "
+    "import sys; elapsed = (time.perf_counter() - started) * 1000; "
+    "print('RESULT', elapsed, ','.join(m for m in {lazy!r} if m in sys.modules))"
+)
+
+
+def import_times():
+    """Returns (module, cumulative microseconds) pairs from `python -X importtime -c 'import main'`."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True
+    )
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times.append((name.strip(), int(cumulative)))
+    return times
+
+
+def first_prompt(client=False):
+    """Returns (milliseconds to first prompt, eagerly imported lazy modules) of a fresh interpreter."""
+    script = CLIENT_FIRST_PROMPT.format(lazy=CLIENT_LAZY_MODULES) if client else FIRST_PROMPT.format(lazy=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True
+    )
+    line = next(line for line in result.stdout.splitlines() if line.startswith('RESULT'))
+    _, elapsed, *eager = line.split(' ')
+    return float(elapsed), [m for m in ''.join(eager).split(',') if m]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=100)
+    parser.add_argument('--client', action='store_true', help="Measure the daemon's thin client instead.")
+    args = parser.parse_args()
+
+    heaviest = sorted(import_times(), key=lambda item: item[1], reverse=True)[:10]
+    print("Heaviest imports (cumulative):")
+    for name, micros in heaviest:
+        print(f"  {micros / 1000:8.1f} ms  {name}")
+
+    samples = []
+    eager = []
+    for _ in range(args.runs):
+        elapsed, eager = first_prompt(args.client)
+        samples.append(elapsed)
+    median = statistics.median(samples)
+    print(f"Time to first prompt: median {median:.1f} ms, min {min(samples):.1f} ms over {args.runs} runs")
+
+    failed = False
+    if eager:
+        print(f"FAIL: imported before the first prompt: {', '.join(eager)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"FAIL: over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
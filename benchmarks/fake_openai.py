@@ -0,0 +1,188 @@
+"""Fake OpenAI-compatible chat completions server with injectable latency and errors.
+
+Usage: python -m benchmarks.fake_openai [port] [latency_ms | distribution]
+or from Python: `with FakeOpenAIServer(latency=0.2) as server: ... server.base_url ...`
+
+Latency distributions (milliseconds): fixed:50, uniform:20-80, lognormal:80,0.5 (median, sigma)
+and spike:50,2000,0.04 (base, stall, probability).
+"""
+import re
+import sys
+import json
+import time
+import random
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_REPLY = "```bash\nls -la\n```"
+
+
+def latency_distribution(spec, seed=None):
+    """Returns a callable drawing latencies in seconds from a distribution spec, see the module docstring."""
+    rng = random.Random(seed)
+    kind, _, args = spec.partition(':')
+    if not args:
+        kind, args = 'fixed', kind
+    values = [float(value) for value in re.split(r'[,-]', args)]
+    if kind == 'fixed':
+        return lambda: values[0] / 1000
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1]) / 1000
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda: median * rng.lognormvariate(0, sigma) / 1000
+    if kind == 'spike':
+        base, stall, probability = values
+        return lambda: (stall if rng.random() < probability else base) / 1000
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def scripted_reply(script, default=DEFAULT_REPLY):
+    """Returns a reply callable answering with the first script entry whose pattern matches the request.
+
+    script is a list of (regex, reply) pairs matched against the last user message.
+    """
+    compiled = [(re.compile(pattern, re.IGNORECASE), reply) for pattern, reply in script]
+
+    def reply(body):
+        messages = [message for message in body.get("messages", []) if message.get("role") == "user"]
+        text = messages[-1]["content"] if messages else ""
+        for pattern, answer in compiled:
+            if pattern.search(text):
+                return answer
+        return default
+    return reply
+
+
+class FakeOpenAIServer:
+    """Serves /v1/chat/completions (streamed or not) from a background thread.
+
+    latency is a number of seconds or a callable returning one per request, status likewise
+    (e.g. 429 to simulate rate limiting, 0 to drop the connection without answering), reply is the
+    completion text or a callable of the request body.
+    """
+
+    def __init__(self, port=0, latency=0.0, status=200, reply=DEFAULT_REPLY, chunk_delay=0.0, retry_after=None):
+        self.latency = latency
+        self.status = status
+        self.reply = reply
+        self.chunk_delay = chunk_delay
+        self.retry_after = retry_after
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self.handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    @staticmethod
+    def value(setting, *args):
+        return setting(*args) if callable(setting) else setting
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # NOTE: Headers and body are separate writes, with Nagle each response would stall on a delayed ACK.
+            disable_nagle_algorithm = True
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.send_response(200)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def send_json(self, status, payload, headers=()):
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with fake.lock:
+                    fake.requests += 1
+                time.sleep(fake.value(fake.latency))
+                status = fake.value(fake.status)
+                if status == 0:
+                    self.close_connection = True
+                    return
+                if status != 200:
+                    headers = [("Retry-After", str(fake.retry_after))] if fake.retry_after else []
+                    self.send_json(status, {"error": {"message": "injected error", "type": "fake"}}, headers)
+                    return
+                reply = fake.value(fake.reply, body)
+                if body.get("stream"):
+                    self.stream(body, reply)
+                    return
+                choices = [
+                    {"index": i, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}
+                    for i in range(body.get("n", 1))
+                ]
+                self.send_json(200, {
+                    "id": "fake", "object": "chat.completion", "created": 0, "model": body["model"],
+                    "choices": choices,
+                    "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+                })
+
+            def stream(self, body, reply):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                def send(data):
+                    payload = f"data: {data}\n\n".encode()
+                    self.wfile.write(f"{len(payload):x}\r\n".encode() + payload + b"\r\n")
+                    self.wfile.flush()
+
+                try:
+                    for i in range(0, len(reply), 4):
+                        chunk = {
+                            "id": "fake", "object": "chat.completion.chunk", "created": 0, "model": body["model"],
+                            "choices": [{"index": 0, "delta": {"content": reply[i:i + 4]}, "finish_reason": None}],
+                        }
+                        send(json.dumps(chunk))
+                        time.sleep(fake.chunk_delay)
+                    send("[DONE]")
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="fake-openai", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8765
+    latency = latency_distribution(sys.argv[2] if len(sys.argv) > 2 else '50')
+    server = FakeOpenAIServer(port=port, latency=latency)
+    print(f"Fake OpenAI server on {server.base_url}")
+    server.server.serve_forever()
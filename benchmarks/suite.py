@@ -0,0 +1,213 @@
+"""Benchmark suite: end-to-end latencies against a scripted mock server, compared with a stored baseline.
+
+Scenarios:
+  startup     time until the first prompt in a fresh interpreter.
+  prompt      get_prompt latency.
+  suggestion  SheLLM.handle_lm_command, from the request to the confirmation prompt (always answered 'n').
+  question    SheLLM.answer_question with streaming.
+  pty         run_command_with_pty throughput.
+
+Results are written as JSON (--output). When the baseline file exists every metric is compared with it
+and the suite exits with status 1 if one regressed by more than --tolerance. Baselines are machine
+specific, refresh them with --save-baseline after an intended change or on new hardware.
+
+Usage: python -m benchmarks.suite [--only suggestion,question] [--latency lognormal:80,0.5] [--requests N]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import builtins
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+from datetime import datetime, timezone
+
+from benchmarks.fake_openai import FakeOpenAIServer, latency_distribution, scripted_reply
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+SCENARIOS = ('startup', 'prompt', 'suggestion', 'question', 'pty')
+
+SCRIPT = [
+    (r'Request: .*(list|show) .*files', "```bash\nls -la\n```"),
+    (r'Request: .*disk', "```bash\ndf -h\n```"),
+    (r'Request: .*process', "```bash\nps aux --sort=-%mem | head\n```"),
+    (r'Question: ', "The previous command listed the files of the current directory, the largest one is main.py."),
+]
+PROMPTS = ('list all files', 'show disk usage', 'top memory processes', 'show hidden files')
+
+
+def percentiles(samples, unit, scale=1.0, noise=0.0):
+    """p50/p95 of samples as result entries, lower is better."""
+    from utils.metrics import percentile
+    samples = [sample * scale for sample in samples]
+    return {
+        'p50': {'value': round(percentile(samples, 0.5), 3), 'unit': unit, 'better': 'lower', 'noise': noise},
+        'p95': {'value': round(percentile(samples, 0.95), 3), 'unit': unit, 'better': 'lower', 'noise': noise},
+    }
+
+
+def bench_startup(args, shellm):
+    from benchmarks.bench_startup import first_prompt
+    samples = [first_prompt()[0] for _ in range(args.runs)]
+    return {'first_prompt': {'value': round(statistics.median(samples), 1), 'unit': 'ms', 'better': 'lower', 'noise': 10}}
+
+
+def bench_prompt(args, shellm):
+    from core.prompts import get_prompt
+    get_prompt()
+    samples = []
+    for _ in range(1000):
+        started = time.perf_counter()
+        get_prompt()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples, 'us', 1e6, noise=50)
+
+
+def bench_suggestion(args, shellm):
+    answers = []
+    original_input = builtins.input
+    builtins.input = lambda prompt='': answers.append(prompt) or 'n'
+    samples = []
+    try:
+        for i in range(args.requests):
+            started = time.perf_counter()
+            shellm.handle_lm_command(PROMPTS[i % len(PROMPTS)])
+            samples.append(time.perf_counter() - started)
+    finally:
+        builtins.input = original_input
+    if len(answers) != args.requests:
+        raise RuntimeError(f"Only {len(answers)} of {args.requests} requests produced a suggestion.")
+    return percentiles(samples, 'ms', 1000, noise=5)
+
+
+def bench_question(args, shellm):
+    samples = []
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sink:
+        sys.stdout = sink
+        try:
+            for i in range(args.requests):
+                started = time.perf_counter()
+                answer = shellm.answer_question(f"what is the largest file {i}")
+                samples.append(time.perf_counter() - started)
+        finally:
+            sys.stdout = stdout
+    if not answer:
+        raise RuntimeError("The question was not answered.")
+    return percentiles(samples, 'ms', 1000, noise=5)
+
+
+def bench_pty(args, shellm):
+    from core.commands import run_command_with_pty
+    size_mb = 20
+    stdout = sys.stdout
+    with open(os.devnull, 'w') as sink:
+        sys.stdout = sink
+        try:
+            started = time.perf_counter()
+            run_command_with_pty(f"yes $(printf 'x%.0s' {{1..119}}) | head -c {size_mb}M")
+            elapsed = time.perf_counter() - started
+        finally:
+            sys.stdout = stdout
+    return {'throughput': {'value': round(size_mb / elapsed, 1), 'unit': 'MB/s', 'better': 'higher', 'noise': 10}}
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Prints every metric next to its baseline and returns the names of the regressed ones.
+
+    A metric regressed when it got worse by more than tolerance (relative) and by more than its noise
+    (absolute), so microsecond jitter does not fail the suite.
+    """
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        line = f"  {name:<24} {result['value']:>10} {result['unit']:<5}"
+        if base and base['value']:
+            change = (result['value'] - base['value']) / base['value']
+            worsening = change if result['better'] == 'lower' else -change
+            worse = worsening > tolerance and abs(result['value'] - base['value']) > result.get('noise', 0)
+            line += f" baseline {base['value']:>10} {change:+7.1%}{'  REGRESSION' if worse else ''}"
+            if worse:
+                regressions.append(name)
+        print(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--only', default=','.join(SCENARIOS), help="Comma separated scenarios to run.")
+    parser.add_argument('--latency', default='fixed:50', help="Mock server latency distribution.")
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters for the startup scenario.")
+    parser.add_argument('--output', default=None, help="JSON file for the results.")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative regression.")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(latency=latency_distribution(args.latency, seed=0), reply=scripted_reply(SCRIPT)).start()
+    home = tempfile.mkdtemp(prefix='shellm-suite-')
+    # NOTE: Caches, the journal and the fast path would answer repeated prompts without the mock server.
+    os.environ.update(
+        OPENAI_API_KEY='fake', OPENAI_BASE_URL=server.base_url, SHELLM_HOME=home, SHELLM_CACHE='false',
+        SHELLM_JOURNAL='false', SHELLM_FASTPATH='false', SHELLM_PREFETCH_DEPTH='0', SHELLM_METRICS_JSONL='',
+        SHELLM_METRICS_PROM='', SHELLM_HEDGE_API='', SHELLM_VALIDATION_API='', SHELLM_QA_API=''
+    )
+    from core.shellm import SheLLM
+    logging.disable(logging.INFO)
+    shellm = SheLLM(llm_api='openai')
+    shellm.model.get()
+
+    results = {}
+    for scenario in args.only.split(','):
+        started = time.perf_counter()
+        for metric, result in globals()[f'bench_{scenario}'](args, shellm).items():
+            results[f'{scenario}.{metric}'] = result
+        print(f"{scenario} done in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    server.stop()
+
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': f"{platform.system()} {platform.machine()}",
+            'latency': args.latency,
+            'requests': args.requests,
+        },
+        'results': results,
+    }
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('latency') != args.latency:
+            print(f"Baseline was measured with latency {baseline['meta'].get('latency')}, not {args.latency}.")
+    print("Results:")
+    regressions = compare(results, baseline.get('results', {}), args.tolerance)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved the baseline to {args.baseline}.")
+    elif regressions:
+        print(f"{len(regressions)} metrics regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+
+
+def get_shellm_dir() -> str:
+    """Returns the SheLLM data directory (~/.shellm by default), creating it if needed."""
+    path = os.path.expanduser(os.getenv('SHELLM_HOME', '~/.shellm'))
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,325 @@
+import os
+import re
+import mmap
+import time
+import bisect
+import logging
+import threading
+from array import array
+from contextlib import contextmanager
+
+from config.paths import get_shellm_dir
+from utils.condense import ERROR_LINE, strip_escape_sequences, apply_carriage_returns
+
+logger = logging.getLogger(__name__)
+
+RANGE_REQUEST = re.compile(r'\blines?\s+(\d+)\s*(?:-|to|\.\.)\s*(\d+)', re.IGNORECASE)
+TAIL_REQUEST = re.compile(r'\b(?:last|tail)\s+(\d+)(?:\s+lines?)?\b', re.IGNORECASE)
+GREP_REQUEST = re.compile(r'[\'"`]([^\'"`]{2,})[\'"`]|\bgrep\s+([^\s\'"`]+)', re.IGNORECASE)
+ARTIFACT_REQUEST = re.compile(r'\bartifact\s+#?(\d+)\b', re.IGNORECASE)
+WORD = re.compile(r'[A-Za-z][\w.-]{2,}')
+# NOTE: The index holds one (byte offset, line number) checkpoint per block of output, lines inside a
+# block are found with C-level find/count on the mapped file. Indexing every line would halve throughput.
+INDEX_BLOCK = 64 * 1024
+
+
+class Artifact:
+    """Full output of one command on disk, with a sparse line offset index in a sidecar file.
+
+    The output is memory mapped on access, so slices are read without loading the whole output.
+    """
+
+    def __init__(self, artifact_id, command, path, size, lines):
+        self.id = artifact_id
+        self.command = command
+        self.path = path
+        self.size = size
+        self.lines = lines
+
+    def note(self) -> str:
+        """The line standing in for the full output in the context."""
+        return f"[full output saved as artifact {self.id}: {self.lines} lines, {self.size} bytes]"
+
+    @property
+    def index_path(self):
+        return self.path[:-len('.out')] + '.idx'
+
+    @contextmanager
+    def mapped(self):
+        """Yields (data, checkpoint offsets, checkpoint line numbers), data memory mapped."""
+        index = array('Q')
+        with open(self.index_path, 'rb') as index_file:
+            index.frombytes(index_file.read())
+        with open(self.path, 'rb') as data_file:
+            data = mmap.mmap(data_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield data, index[0::2], index[1::2]
+            finally:
+                data.close()
+
+    @staticmethod
+    def decode(raw: bytes) -> str:
+        """Decodes a slice and cleans it like the context output (escape codes, \\r overwrites)."""
+        lines = raw.decode(errors='replace').split('\n')
+        return '\n'.join(apply_carriage_returns(strip_escape_sequences(lines)))
+
+    @staticmethod
+    def line_start(data, offsets, numbers, line: int) -> int:
+        """Byte offset where a 0-based line starts."""
+        checkpoint = bisect.bisect_right(numbers, line) - 1
+        position = offsets[checkpoint]
+        for _ in range(line - numbers[checkpoint]):
+            position = data.find(b'\n', position) + 1
+        return position
+
+    @staticmethod
+    def line_number(data, offsets, numbers, position: int) -> int:
+        """0-based line of a byte offset."""
+        checkpoint = bisect.bisect_right(offsets, position) - 1
+        return numbers[checkpoint] + data[offsets[checkpoint]:position].count(b'\n')
+
+    def read_lines(self, start: int, end: int) -> list[tuple[int, str]]:
+        """Returns (1-based line number, text) of lines start..end, both 1-based and inclusive."""
+        start, end = max(start, 1), min(end, self.lines)
+        if start > end:
+            return []
+        with self.mapped() as (data, offsets, numbers):
+            first = self.line_start(data, offsets, numbers, start - 1)
+            last = first
+            for _ in range(end - start + 1):
+                newline = data.find(b'\n', last)
+                last = newline + 1 if newline >= 0 else self.size
+            raw = data[first:last]
+            text = self.decode(raw[:-1] if raw.endswith(b'\n') else raw)
+        return list(enumerate(text.split('\n'), start))
+
+    def tail(self, count: int) -> list[tuple[int, str]]:
+        return self.read_lines(self.lines - count + 1, self.lines)
+
+    def grep(self, pattern, max_matches=50, context=0) -> list[tuple[int, str]]:
+        """Returns the lines matching a bytes regex (plus context lines), searched on the mapped file."""
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern.encode(), re.IGNORECASE)
+        matches = []
+        with self.mapped() as (data, offsets, numbers):
+            position = 0
+            while len(matches) < max_matches:
+                match = pattern.search(data, position)
+                if not match:
+                    break
+                matches.append(self.line_number(data, offsets, numbers, match.start()))
+                # NOTE: One hit per line, continue after the end of the matched line.
+                newline = data.find(b'\n', match.end())
+                if newline < 0:
+                    break
+                position = newline + 1
+        lines = []
+        for number in matches:
+            first = max(number + 1 - context, lines[-1][0] + 1 if lines else 1)
+            lines.extend(self.read_lines(first, number + 1 + context))
+        return lines
+
+
+class ArtifactWriter:
+    """Receives a command's raw output and spills it to disk once it outgrows what the context keeps."""
+
+    def __init__(self, store, command, threshold):
+        self.store = store
+        self.command = command
+        self.threshold = threshold
+        self.buffer = bytearray()
+        self.data_file = None
+        self.index = array('Q')
+        self.size = 0
+        self.lines = 0
+        self.checkpoint = -INDEX_BLOCK
+        self.at_line_start = True
+        self.failed = False
+
+    def feed(self, data: bytes) -> None:
+        if self.failed:
+            return
+        try:
+            if self.data_file is None:
+                self.buffer += data
+                if len(self.buffer) <= self.threshold:
+                    return
+                self.path = self.store.new_path()
+                self.data_file = open(self.path, 'wb')
+                data = bytes(self.buffer)
+                self.buffer = None
+            self.data_file.write(data)
+        except OSError as e:
+            # NOTE: A full disk must not interrupt the command, the context still has the head and tail.
+            logger.warning(f"Could not save the output of '{self.command}': {e}")
+            self.failed = True
+            return
+        if self.size - self.checkpoint >= INDEX_BLOCK:
+            self.add_checkpoint(data)
+        self.lines += data.count(b'\n')
+        self.size += len(data)
+        self.at_line_start = data.endswith(b'\n')
+
+    def add_checkpoint(self, data: bytes) -> None:
+        """Records the offset and number of the first line starting in the chunk about to be counted."""
+        if self.at_line_start:
+            offset, line = self.size, self.lines
+        else:
+            newline = data.find(b'\n')
+            if newline < 0:
+                return
+            offset, line = self.size + newline + 1, self.lines + 1
+        self.index.extend((offset, line))
+        self.checkpoint = offset
+
+    def close(self) -> Artifact | None:
+        """Finishes the files and returns the artifact, None when the output was small enough to keep whole."""
+        self.buffer = None
+        if self.data_file is None:
+            return None
+        self.data_file.close()
+        if self.failed:
+            return None
+        # NOTE: A last line without a trailing newline still counts.
+        lines = self.lines + (0 if self.at_line_start else 1)
+        try:
+            with open(self.path[:-len('.out')] + '.idx', 'wb') as index_file:
+                self.index.tofile(index_file)
+        except OSError as e:
+            logger.warning(f"Could not save the output index of '{self.command}': {e}")
+            return None
+        return self.store.add(self.command, self.path, self.size, lines)
+
+
+class ArtifactStore:
+    """Per-session directory of spilled command outputs, evicted oldest first above a size limit."""
+
+    def __init__(self, root=None, max_bytes=None, threshold=None):
+        self._root = root
+        self.max_bytes = max_bytes or int(float(os.getenv('SHELLM_ARTIFACTS_MAX_MB', '256')) * 1024 * 1024)
+        # NOTE: Outputs below the head + tail kept by OutputCapture are already whole in the context.
+        self.threshold = threshold if threshold is not None else int(os.getenv('SHELLM_ARTIFACT_MIN_BYTES', '65536'))
+        self.session = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        self.artifacts = []
+        self.next_id = 1
+        self.lock = threading.Lock()
+
+    @property
+    def root(self):
+        if self._root is None:
+            self._root = os.path.join(get_shellm_dir(), 'artifacts')
+        return self._root
+
+    @property
+    def session_dir(self):
+        return os.path.join(self.root, self.session)
+
+    def new_path(self) -> str:
+        os.makedirs(self.session_dir, exist_ok=True)
+        with self.lock:
+            artifact_id = self.next_id
+            self.next_id += 1
+        return os.path.join(self.session_dir, f"{artifact_id}.out")
+
+    def writer(self, command: str) -> ArtifactWriter:
+        return ArtifactWriter(self, command, self.threshold)
+
+    def add(self, command, path, size, lines) -> Artifact:
+        artifact_id = int(os.path.basename(path)[:-len('.out')])
+        artifact = Artifact(artifact_id, command, path, size, lines)
+        with self.lock:
+            self.artifacts.append(artifact)
+        logger.debug(f"Saved {size} bytes ({lines} lines) of '{command}' as artifact {artifact_id}.")
+        self.evict(keep=artifact)
+        return artifact
+
+    def evict(self, keep=None) -> None:
+        """Deletes the oldest artifacts of every session until the directory fits in max_bytes."""
+        artifacts = {}  # NOTE: path without extension -> [newest mtime, total size, files]
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entry = artifacts.setdefault(os.path.splitext(path)[0], [0, 0, []])
+                entry[0] = max(entry[0], stat.st_mtime)
+                entry[1] += stat.st_size
+                entry[2].append(path)
+        total = sum(size for _, size, _ in artifacts.values())
+        if total <= self.max_bytes:
+            return
+        protected = keep.path[:-len('.out')] if keep else None
+        for stem, (_, size, paths) in sorted(artifacts.items(), key=lambda item: item[1][0]):
+            if total <= self.max_bytes:
+                break
+            if stem == protected:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+            logger.debug(f"Evicted artifact {stem} ({size} bytes).")
+        with self.lock:
+            self.artifacts = [artifact for artifact in self.artifacts if os.path.exists(artifact.path)]
+        for entry in os.scandir(self.root):
+            if entry.is_dir() and entry.name != self.session and not os.listdir(entry.path):
+                os.rmdir(entry.path)
+
+    def find(self, question: str, last_command: str | None = None) -> Artifact | None:
+        """The artifact a question is about: named explicitly, sharing a word with its command, or the last one."""
+        with self.lock:
+            artifacts = list(self.artifacts)
+        if not artifacts:
+            return None
+        requested = ARTIFACT_REQUEST.search(question)
+        if requested:
+            return next((a for a in artifacts if a.id == int(requested.group(1))), None)
+        words = {word.lower() for word in WORD.findall(question)}
+        for artifact in reversed(artifacts):
+            if words & {word.lower() for word in WORD.findall(artifact.command)}:
+                return artifact
+        newest = artifacts[-1]
+        if newest.command == last_command or RANGE_REQUEST.search(question) or TAIL_REQUEST.search(question):
+            return newest
+        return None
+
+    def excerpt(self, question: str, last_command: str | None = None, max_lines=None) -> str | None:
+        """Slices of the relevant artifact for a question: requested ranges, greps and tails, else errors and the end."""
+        artifact = self.find(question, last_command)
+        if artifact is None:
+            return None
+        max_lines = max_lines or int(os.getenv('SHELLM_ARTIFACT_EXCERPT_LINES', '80'))
+        sections = []
+        try:
+            for match in RANGE_REQUEST.finditer(question):
+                start, end = int(match.group(1)), int(match.group(2))
+                sections.append((f"lines {start}-{end}", artifact.read_lines(start, min(end, start + max_lines - 1))))
+            for match in GREP_REQUEST.finditer(question):
+                pattern = match.group(1) or match.group(2)
+                sections.append((f"lines matching {pattern!r}", artifact.grep(re.compile(re.escape(pattern.encode()), re.IGNORECASE), max_lines)))
+            for match in TAIL_REQUEST.finditer(question):
+                sections.append((f"last {match.group(1)} lines", artifact.tail(min(int(match.group(1)), max_lines))))
+            if not sections:
+                sections.append(("error lines", artifact.grep(re.compile(ERROR_LINE.pattern.encode(), re.IGNORECASE), max_lines // 2, context=1)))
+                sections.append(("last lines", artifact.tail(max_lines // 4)))
+        except OSError as e:
+            logger.debug(f"Could not read artifact {artifact.id}: {e}")
+            return None
+        budget = max_lines
+        shown = set()
+        blocks = [f"Excerpts of the full output of `{artifact.command}` (artifact {artifact.id}, {artifact.lines} lines):"]
+        for title, lines in sections:
+            if budget <= 0:
+                break
+            lines = [(number, text) for number, text in lines if number not in shown][:budget]
+            shown.update(number for number, _ in lines)
+            budget -= len(lines)
+            blocks.append(f"--- {title} ---")
+            blocks.extend(f"{number}: {text}" for number, text in lines)
+            if not lines:
+                blocks.append("(none)")
+        return '\n'.join(blocks)
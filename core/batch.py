@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import heapq
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Client-side token bucket limiting how many requests start per second."""
+
+    def __init__(self, rate: float, burst: int | None = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if not self.rate:
+            return
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def parse_line(number: int, line: str) -> dict | None:
+    """Parses an input line: a JSON object or a plain prompt, '##' marks a question."""
+    line = line.strip()
+    if not line:
+        return None
+    if line.startswith('{'):
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {number}: invalid JSON, {e}.") from e
+        if not isinstance(item, dict):
+            raise ValueError(f"Line {number}: expected a JSON object, got {type(item).__name__}.")
+    else:
+        item = {'prompt': line}
+    prompt = item.get('prompt')
+    if not isinstance(prompt, str):
+        raise ValueError(f"Line {number}: 'prompt' must be a string, got {type(prompt).__name__}.")
+    prompt = prompt.strip()
+    kind = item.get('type')
+    if not kind:
+        kind = 'question' if prompt.startswith('##') else 'command'
+    prompt = prompt[2:].strip() if prompt.startswith('##') else prompt.lstrip('#').strip()
+    if kind not in ('command', 'question'):
+        raise ValueError(f"Line {number}: unknown type {kind!r}, expected 'command' or 'question'.")
+    if not prompt:
+        raise ValueError(f"Line {number}: empty prompt.")
+    return {'id': item.get('id', number), 'line': number, 'type': kind, 'prompt': prompt}
+
+
+def read_items(path: str) -> list[dict]:
+    with open(path) as f:
+        return [item for number, line in enumerate(f, 1) if (item := parse_line(number, line))]
+
+
+def completed_ids(path: str) -> set:
+    """Ids that already have a successful result in an output file, for --resume."""
+    done = set()
+    if path == '-' or not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if not record.get('error'):
+                done.add(record.get('id'))
+    return done
+
+
+class BatchRunner:
+    """Generates suggestions and answers for many prompts concurrently, never executing anything."""
+
+    def __init__(self, model, concurrency=None, rate=None, ordered=True):
+        from models.hedging import HedgedModel
+        self.model = model
+        # NOTE: A hedged model routes questions itself, a plain backend may send them to SHELLM_QA_API.
+        self.qa_model = model if isinstance(model, HedgedModel) else model.backend_for('qa')
+        self.concurrency = concurrency or int(os.getenv('SHELLM_BATCH_CONCURRENCY', '8'))
+        self.limiter = RateLimiter(rate if rate is not None else float(os.getenv('SHELLM_BATCH_RATE', '0')))
+        self.ordered = ordered
+
+    async def process(self, item: dict, context) -> dict:
+        await self.limiter.acquire()
+        started = time.perf_counter()
+        record = dict(item)
+        try:
+            if item['type'] == 'question':
+                record['answer'] = await self.qa_model.aanswer_question(context, item['prompt'])
+            else:
+                record['suggestion'] = await self.model.aget_command_suggestion(context, item['prompt'])
+            record['error'] = None
+        except Exception as e:
+            record['error'] = f"{type(e).__name__}: {e}"
+        record['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return record
+
+    async def run(self, items: list[dict], out) -> dict:
+        """Processes items with at most `concurrency` in flight and writes one JSON line per item."""
+        from utils.schemas import Context
+        context = Context()
+        queue = asyncio.Queue()
+        for index, item in enumerate(items):
+            queue.put_nowait((index, item))
+        results = []  # NOTE: Heap of (index, record) waiting for their turn in ordered mode.
+        next_index = 0
+        stats = {'done': 0, 'errors': 0}
+        started = time.perf_counter()
+
+        def write(record):
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+
+        async def worker():
+            nonlocal next_index
+            while True:
+                try:
+                    index, item = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                record = await self.process(item, context)
+                stats['done'] += 1
+                stats['errors'] += bool(record['error'])
+                if not self.ordered:
+                    write(record)
+                else:
+                    heapq.heappush(results, (index, record))
+                    while results and results[0][0] == next_index:
+                        write(heapq.heappop(results)[1])
+                        next_index += 1
+                if stats['done'] % 10 == 0 or stats['done'] == len(items):
+                    logger.info(f"[{stats['done']}/{len(items)}] {stats['errors']} errors, "
+                                f"{stats['done'] / (time.perf_counter() - started):.1f} prompts/s")
+
+        await asyncio.gather(*(worker() for _ in range(min(self.concurrency, len(items)) or 1)))
+        stats['elapsed_s'] = time.perf_counter() - started
+        return stats
+
+
+def log_to_stderr() -> None:
+    """Moves the console logging from stdout to stderr, so stdout only carries the results."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, logging.StreamHandler) and handler.stream is sys.stdout:
+            handler.setStream(sys.stderr)
+
+
+def run_batch(llm_api, path, output='-', concurrency=None, rate=None, ordered=True, resume=False) -> int:
+    """Runs a batch file and returns the process exit code."""
+    from models.registry import LazyModel
+    from models.runtime import runtime
+
+    if output == '-':
+        log_to_stderr()
+    try:
+        items = read_items(path)
+    except ValueError as e:
+        logger.error(f"Invalid batch file {path}: {e}")
+        return 2
+    if resume:
+        done = completed_ids(output)
+        skipped = len(items)
+        items = [item for item in items if item['id'] not in done]
+        logger.info(f"Resuming: {skipped - len(items)} prompts already done, {len(items)} to go.")
+    runner = BatchRunner(LazyModel(llm_api).get(), concurrency, rate, ordered)
+    out = sys.stdout if output == '-' else open(output, 'a' if resume else 'w')
+    try:
+        stats = runtime.run(runner.run(items, out))
+    except KeyboardInterrupt:
+        logger.info("Batch interrupted, rerun with --resume to continue.")
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    logger.info(f"Batch done: {stats['done']} prompts, {stats['errors']} errors in {stats['elapsed_s']:.1f}s.")
+    return 1 if stats['errors'] else 0
@@ -0,0 +1,93 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+from typing import TYPE_CHECKING
+
+from config.paths import get_shellm_dir
+
+if TYPE_CHECKING:
+    from utils.schemas import Context
+
+logger = logging.getLogger(__name__)
+
+
+class SuggestionCache:
+    """On-disk LRU/TTL cache of accepted command suggestions."""
+
+    def __init__(self, path=None, max_entries=None, ttl=None):
+        self.path = path or os.path.join(get_shellm_dir(), 'cache.db')
+        self.max_entries = max_entries or int(os.getenv('SHELLM_CACHE_SIZE', '1000'))
+        self.ttl = ttl or int(os.getenv('SHELLM_CACHE_TTL', str(7 * 24 * 3600)))
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS suggestions ("
+            "key TEXT PRIMARY KEY, prompt TEXT, model TEXT, command TEXT, "
+            "created_at REAL, last_used REAL, uses INTEGER DEFAULT 1)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_suggestions_last_used ON suggestions (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Lowercases the prompt and collapses whitespace."""
+        return ' '.join(prompt.lower().split())
+
+    @staticmethod
+    def fingerprint(context: 'Context', cwd: str | None = None) -> str:
+        """Hashes the parts of the context a suggestion depends on."""
+        history_hash = hashlib.sha256('\n'.join(context.recent_commands()).encode()).hexdigest()
+        parts = [cwd or os.getcwd(), context.last_command, history_hash]
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+    def key(self, prompt: str, model: str, context: 'Context', cwd: str | None = None) -> str:
+        """Builds the cache key from the normalized prompt, model name and context fingerprint."""
+        parts = [self.normalize_prompt(prompt), model, self.fingerprint(context, cwd)]
+        return hashlib.sha256('\0'.join(parts).encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        """Returns the cached command for the key, or None on a miss or expired entry."""
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT command, created_at FROM suggestions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or now - row[1] > self.ttl:
+            self.misses += 1
+            return None
+        self.conn.execute(
+            "UPDATE suggestions SET last_used = ?, uses = uses + 1 WHERE key = ?", (now, key)
+        )
+        self.conn.commit()
+        self.hits += 1
+        logger.debug(f"Suggestion cache hit for key {key[:12]}")
+        return row[0]
+
+    def put(self, key: str, prompt: str, model: str, command: str) -> None:
+        """Stores an accepted command and evicts expired and least recently used entries."""
+        now = time.time()
+        self.conn.execute(
+            "INSERT INTO suggestions (key, prompt, model, command, created_at, last_used) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET "
+            "command = excluded.command, created_at = excluded.created_at, last_used = excluded.last_used",
+            (key, self.normalize_prompt(prompt), model, command, now, now)
+        )
+        self.conn.execute("DELETE FROM suggestions WHERE created_at < ?", (now - self.ttl,))
+        self.conn.execute(
+            "DELETE FROM suggestions WHERE key NOT IN "
+            "(SELECT key FROM suggestions ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+        self.conn.commit()
+
+    def clear(self) -> None:
+        """Removes every cached suggestion."""
+        self.conn.execute("DELETE FROM suggestions")
+        self.conn.commit()
+
+    def hit_rate(self) -> float:
+        """Returns the share of lookups that were served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
@@ -0,0 +1,329 @@
+import os
+import sys
+import time
+import socket
+import logging
+import threading
+import subprocess
+from datetime import datetime
+from colorama import Fore, Style
+
+from .commands import change_directory, run_command_with_pty
+from .ssh import run_interactive_ssh
+from .completion import Completer
+from .artifacts import ArtifactStore
+from .jobs import JobManager, is_background
+from .protocol import ProtocolError, socket_path, send_frame, recv_frame
+from config.paths import get_shellm_dir
+from utils.interrupts import interruptible
+from utils.condense import OutputCondenser
+
+logger = logging.getLogger(__name__)
+
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+# NOTE: Same as core.prefetch.FIX_COMMANDS, which is not imported to keep the client's startup lean.
+FIX_COMMANDS = ('', 'fix')
+SOURCE_LABELS = {
+    'cache': f" {Fore.BLUE}(cached){Style.RESET_ALL}",
+    'local': f" {Fore.BLUE}(local, r to ask the LLM){Style.RESET_ALL}",
+    'fix': f" {Fore.BLUE}(fix){Style.RESET_ALL}",
+}
+
+
+class DaemonError(Exception):
+    """The daemon is unreachable or rejected a request."""
+
+
+def terminal_id() -> str:
+    """Identifies the terminal, so a client started again in the same terminal resumes its session."""
+    try:
+        return os.ttyname(sys.stdin.fileno())
+    except OSError:
+        return f"pid:{os.getpid()}"
+
+
+def start_daemon(llm_api, path, timeout=None) -> None:
+    """Starts a detached daemon logging to ~/.shellm/daemon.log and waits until it accepts connections."""
+    timeout = timeout if timeout is not None else float(os.getenv('SHELLM_DAEMON_START_TIMEOUT', '10'))
+    with open(os.path.join(get_shellm_dir(), 'daemon.log'), 'ab') as log:
+        subprocess.Popen(
+            [sys.executable, MAIN_SCRIPT, '--daemon', '--llm-api', llm_api],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=log, start_new_session=True,
+            env={**os.environ, 'SHELLM_DAEMON_SOCKET': path}
+        )
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(path)
+            return
+        except OSError:
+            continue
+        finally:
+            sock.close()
+    raise DaemonError(f"The daemon did not start within {timeout:.0f}s, see {get_shellm_dir()}/daemon.log.")
+
+
+class DaemonClient:
+    """One terminal's connection to the daemon.
+
+    A request is cancelled by dropping the connection, the next request reconnects to the same
+    session since sessions are keyed by terminal.
+    """
+
+    def __init__(self, llm_api, path=None, terminal=None, autostart=None):
+        self.llm_api = llm_api
+        self.path = path or socket_path()
+        self.terminal = terminal or terminal_id()
+        self.autostart = autostart if autostart is not None else os.getenv('SHELLM_DAEMON_AUTOSTART', 'true').lower() != 'false'
+        self.sock = None
+        self.next_id = 0
+        self.info = {}
+        # NOTE: Held while connecting, so a request does not race the background connect of warm_up.
+        self.lock = threading.RLock()
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            if not self.autostart:
+                raise DaemonError(f"No SheLLM daemon on {self.path} ({e}).") from e
+            logger.info(f"Starting the SheLLM daemon ({self.llm_api})...")
+            start_daemon(self.llm_api, self.path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+            except OSError as e:
+                sock.close()
+                raise DaemonError(f"Could not connect to the daemon on {self.path} ({e}).") from e
+        self.sock = sock
+        self.info = self.call('hello', terminal=self.terminal, pid=os.getpid())
+        if self.info.get('llm_api') != self.llm_api:
+            logger.warning(f"The daemon uses the {self.info.get('llm_api')} model, not {self.llm_api}.")
+
+    def reset(self) -> None:
+        """Drops the connection, which cancels the request in flight."""
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    close = reset
+
+    def stream(self, op, **fields):
+        """Sends a request and yields its frames, the last one being the final reply."""
+        with self.lock:
+            if self.sock is None:
+                self.connect()
+            self.next_id += 1
+            request_id = self.next_id
+        try:
+            send_frame(self.sock, {'id': request_id, 'op': op, 'cwd': os.getcwd(), **fields})
+            while True:
+                frame = recv_frame(self.sock)
+                if frame is None:
+                    raise DaemonError("The daemon closed the connection.")
+                if frame.get('id') != request_id:
+                    continue
+                if 'ok' in frame and not frame['ok']:
+                    raise DaemonError(frame.get('error') or f"{op} failed.")
+                yield frame
+                if 'ok' in frame:
+                    return
+        except (OSError, ProtocolError) as e:
+            self.reset()
+            raise DaemonError(f"Lost the connection to the daemon: {e}") from e
+        except BaseException:
+            # NOTE: Anything else (CTRL+C, the caller giving up) leaves a reply pending, start over.
+            self.reset()
+            raise
+
+    def call(self, op, **fields) -> dict:
+        """Sends a request and returns its final reply."""
+        frame = {}
+        for frame in self.stream(op, **fields):
+            pass
+        return frame
+
+
+class ThinShell:
+    """The REPL of a terminal attached to the daemon: commands run here, LLM requests are served there.
+
+    Outputs spilled to artifacts stay in this terminal, the relevant slices are sent along with questions.
+    """
+
+    def __init__(self, client: DaemonClient, history_file=None):
+        self.client = client
+        self.artifacts = ArtifactStore() if os.getenv('SHELLM_ARTIFACTS', 'true').lower() != 'false' else None
+        self.jobs = JobManager(self.artifacts.writer if self.artifacts else None)
+        self.completer = Completer(None, history_file)
+        self.condenser = OutputCondenser()
+        self.current_process_pid = None
+        self.ssh_session = None
+        self.last_command = None
+        self.context_tokens = self.token_budget = None
+
+    def warm_up(self):
+        """Connects in the background (starting the daemon if needed) while the first prompt is shown."""
+        self.completer.warm_up()
+        threading.Thread(target=self.connect, name="shellm-connect", daemon=True).start()
+
+    def connect(self):
+        try:
+            with self.client.lock:
+                if self.client.sock is None:
+                    self.client.connect()
+        except DaemonError as e:
+            logger.error(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {e}")
+
+    def execute_system_command(self, command):
+        """Runs a command or builtin in this terminal and reports it to the daemon."""
+        if not command.strip():
+            logger.info("No command entered. Please enter a valid command.")
+            return
+        tokens = command.split()
+        cwd = os.getcwd()
+        started = time.perf_counter()
+        if tokens[0] == 'cd':
+            change_directory(tokens)
+            self.completer.directories.prefetch(os.getcwd())
+        elif tokens[0] in ('history', 'stats'):
+            self.show_lines(tokens[0], tokens[1:])
+        elif tokens[0] == 'ssh':
+            run_interactive_ssh(tokens, self)
+        elif self.jobs.run_builtin(tokens):
+            self.report_jobs()
+        elif is_background(command):
+            job = self.jobs.start(command.rstrip()[:-1].rstrip())
+            logger.info(f"[{job.id}] {job.pid}")
+        else:
+            spill = self.artifacts.writer(command) if self.artifacts else None
+            self.record(command, run_command_with_pty(command, spill), spill=spill, cwd=cwd)
+        if tokens[0] in ('cd', 'ssh'):
+            # NOTE: Journaled without an output, which leaves the daemon's context alone.
+            self.client.call('record', command=command, duration_ms=(time.perf_counter() - started) * 1000, cwd=cwd)
+        if tokens[0] not in ('history', 'stats', 'jobs'):
+            self.completer.history.record(command)
+
+    def record(self, command, result, fix=True, cwd=None, spill=None):
+        artifact = spill.close() if spill else None
+        reply = self.client.call(
+            'record', command=command, output=result.output, exit_code=result.exit_code,
+            signal=result.signal_number, duration_ms=result.duration_ms, fix=fix,
+            artifact=artifact.note() if artifact else None, **({'cwd': cwd} if cwd else {})
+        )
+        self.last_command = command
+        self.context_tokens, self.token_budget = reply.get('context_tokens'), reply.get('token_budget')
+        if reply.get('fix'):
+            logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} Command failed ({result.status()}), type # for a fix.")
+
+    def update_context(self, command, output, exit_code=None):
+        """Stores a line run in an SSH session in the daemon's context, without journaling it."""
+        reply = self.client.call('record', command=command, output=output, exit_code=exit_code, fix=False, journal=False)
+        self.last_command = command
+        self.context_tokens, self.token_budget = reply.get('context_tokens'), reply.get('token_budget')
+
+    def context_size(self):
+        """(estimated tokens, budget) of this terminal's context in the daemon, as of the last command."""
+        if self.context_tokens is None and self.client.info:
+            return self.client.info.get('context_tokens'), self.client.info.get('token_budget')
+        return self.context_tokens, self.token_budget
+
+    def report_jobs(self):
+        """Reports the background jobs that finished, called before each prompt."""
+        for job in self.jobs.pop_finished():
+            logger.info(f"[{job.id}]+ {job.status():<12} {job.command}")
+            self.record(f"{job.command} &", job.result, fix=not job.killed, cwd=job.cwd, spill=job.spill)
+
+    def show_lines(self, op, args):
+        """Shows `history` or `stats` as computed by the daemon."""
+        current_time = datetime.now().strftime('%H:%M:%S')
+        if op == 'stats' and args:
+            logger.info("Usage: stats (exports are available in the standalone REPL)")
+            return
+        reply = self.client.call(op, args=args)
+        title = "Command History" if op == 'history' else "Daemon Stats"
+        if op == 'stats' and not reply.get('enabled'):
+            logger.info("Metrics are disabled (SHELLM_METRICS=false).")
+            return
+        if not reply['lines'] and op == 'history':
+            logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} No command history.")
+            return
+        logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} {title}:")
+        for i, line in enumerate(reply['lines'], 1):
+            logger.info(f"{i}: {line}" if op == 'history' else line)
+
+    def handle_lm_command(self, prompt, remote=False):
+        """Asks the daemon for a suggestion and runs it here (or in the SSH session) once confirmed."""
+        fixing = prompt in FIX_COMMANDS
+        retry = False
+        seen = []
+        while True:
+            try:
+                with interruptible():
+                    reply = self.client.call(
+                        'suggest', prompt=prompt, fix=fixing and not retry, retry=retry, seen=seen, jobs=self.jobs.snapshot(),
+                        path=os.environ.get('PATH'), remote=remote
+                    )
+            except KeyboardInterrupt:
+                logger.info(f"\n{Fore.RED}[SheLLM]{Style.RESET_ALL} Suggestion cancelled.")
+                return
+            if fixing and reply['prompt'] is None:
+                logger.info("No failed command to fix. Describe the command you need after '#'.")
+                return
+            prompt = reply['prompt']
+            suggestion = reply['command']
+            if not suggestion:
+                logger.warning("No command suggestion could be generated.")
+                return
+            seen.append(suggestion)
+            logger.info(f"Execute command: {Fore.RED}{suggestion}{Style.RESET_ALL}{SOURCE_LABELS.get(reply['source'], '')}")
+            response = input(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} Confirm execution (Y/n/r)").lower()
+            decision = {'y': 'accepted', 'n': 'rejected', 'r': 'retry'}.get(response, 'other')
+            self.client.call('decide', command=suggestion, decision=decision)
+            if response == 'y':
+                if remote and self.ssh_session:
+                    self.ssh_session.send_command(suggestion)
+                else:
+                    self.execute_system_command(suggestion)
+                return
+            if response == 'n':
+                return
+            if response == 'r':
+                retry = True
+
+    def answer_question(self, question):
+        """Asks the daemon and renders the answer as it streams in."""
+        current_time = datetime.now().strftime('%H:%M:%S')
+        sys.stdout.write(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} Answer: {Fore.GREEN}")
+        sys.stdout.flush()
+        written = False
+        excerpt = self.artifacts.excerpt(question, self.last_command) if self.artifacts else None
+        try:
+            with interruptible():
+                for frame in self.client.stream('answer', question=question, excerpt=excerpt, jobs=self.jobs.snapshot()):
+                    token = frame.get('token')
+                    if token is None:
+                        if not written and frame.get('answer'):
+                            sys.stdout.write(frame['answer'])
+                        continue
+                    # NOTE: Drop leading whitespace so the answer starts right after the label.
+                    if not written:
+                        token = token.lstrip()
+                        if not token:
+                            continue
+                    sys.stdout.write(token)
+                    sys.stdout.flush()
+                    written = True
+        except KeyboardInterrupt:
+            sys.stdout.write(f"{Style.RESET_ALL}\n")
+            logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} Answer cancelled.")
+            return
+        sys.stdout.write(f"{Style.RESET_ALL}\n")
+        sys.stdout.flush()
+
+    def close(self):
+        self.jobs.shutdown()
+        self.client.close()
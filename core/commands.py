@@ -1,4 +1,5 @@
 import os
+import codecs
 import shlex
 import subprocess
 import sys
@@ -6,9 +7,13 @@ import pty
 import select
 import signal
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
+READ_SIZE = 64 * 1024
+
+
 def change_directory(tokens):
     """Handles the 'cd' command."""
     try:
@@ -20,40 +25,134 @@ def change_directory(tokens):
     except FileNotFoundError as e:
         logger.error(f"cd: {e}")
 
-def run_command_with_pty(command):
-    """Runs commands in a pseudo-terminal to support interactive commands."""
-    def read(fd):
-        output = ""
-        while True:
-            r, _, _ = select.select([fd], [], [])
-            if fd in r:
-                try:
-                    data = os.read(fd, 1024)
-                    if not data:
-                        break
-                    decoded_data = data.decode()
-                    sys.stdout.write(decoded_data)
-                    sys.stdout.flush()
-                    output += decoded_data
-                except OSError:
-                    break
-        return output
+class OutputCapture:
+    """Bounded capture of a command's output that keeps its head and tail and counts the rest."""
+
+    def __init__(self, head_bytes=None, tail_bytes=None):
+        self.head_bytes = head_bytes or int(os.getenv('SHELLM_CAPTURE_HEAD_BYTES', '32768'))
+        self.tail_bytes = tail_bytes or int(os.getenv('SHELLM_CAPTURE_TAIL_BYTES', '32768'))
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.total_bytes = 0
+
+    def feed(self, data: bytes) -> None:
+        """Adds a chunk of raw output, memory stays bounded regardless of the total size."""
+        self.total_bytes += len(data)
+        room = self.head_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if data:
+            self.tail += data
+            # NOTE: Trim lazily so the tail is not shifted on every chunk.
+            if len(self.tail) > 2 * self.tail_bytes:
+                del self.tail[:-self.tail_bytes]
+
+    @property
+    def omitted_bytes(self) -> int:
+        """Number of bytes dropped between the head and the tail."""
+        return max(self.total_bytes - len(self.head) - self.tail_bytes, 0)
+
+    def text(self) -> str:
+        """Decodes the captured output, summarizing the omitted middle part."""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        if not self.omitted_bytes:
+            return decoder.decode(bytes(self.head + self.tail), final=True)
+        # NOTE: final=False holds back a multi-byte character split at the head boundary.
+        head = decoder.decode(bytes(self.head), final=False)
+        tail = bytes(self.tail[-self.tail_bytes:])
+        skip = 0
+        while skip < len(tail) and tail[skip] & 0xC0 == 0x80:
+            skip += 1
+        tail = tail[skip:].decode(errors='replace')
+        return (
+            f"{head}\n[... {self.omitted_bytes} bytes omitted, "
+            f"{self.total_bytes} bytes total ...]\n{tail}"
+        )
+
+def relay_output(fd, capture: OutputCapture, out=None, spill=None) -> None:
+    """Copies output from fd to the terminal until EOF while feeding the capture (and the spill writer)."""
+    out = out or sys.stdout.buffer
+    while True:
+        r, _, _ = select.select([fd], [], [])
+        if fd in r:
+            try:
+                data = os.read(fd, READ_SIZE)
+            except OSError:
+                break
+            if not data:
+                break
+            out.write(data)
+            out.flush()
+            capture.feed(data)
+            if spill is not None:
+                spill.feed(data)
+
+class CommandResult:
+    """Outcome of a command: its condensable output, exit status and how long it ran."""
+
+    def __init__(self, output, exit_code=None, signal_number=None, duration_ms=0.0):
+        self.output = output
+        self.exit_code = exit_code
+        self.signal_number = signal_number
+        self.duration_ms = duration_ms
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.exit_code)
+
+    @property
+    def interrupted(self) -> bool:
+        """Whether the user stopped the command with CTRL+C, which is not a failure worth fixing."""
+        return self.signal_number == signal.SIGINT or self.exit_code == 128 + signal.SIGINT
+
+    def status(self) -> str:
+        if self.signal_number:
+            return f"killed by {signal.Signals(self.signal_number).name}"
+        return f"exit {self.exit_code}"
+
+
+def wait_for_exit(pid, block=True) -> tuple[int | None, int | None] | None:
+    """Reaps the child and returns (exit code, signal), the exit code of a signal being 128 + signal like shells.
+
+    Without block, returns None right away when the child is still running.
+    """
+    try:
+        reaped, status = os.waitpid(pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        return None, None
+    if reaped == 0:
+        return None
+    if os.WIFSIGNALED(status):
+        return 128 + os.WTERMSIG(status), os.WTERMSIG(status)
+    return os.waitstatus_to_exitcode(status), None
+
+
+def run_command_with_pty(command, spill=None) -> CommandResult:
+    """Runs commands in a pseudo-terminal to support interactive commands.
 
+    spill receives the full raw output, e.g. an ArtifactWriter keeping it on disk.
+    """
     def signal_handler(sig, frame):
         if pid:
             os.kill(pid, sig)
 
+    capture = OutputCapture()
+    started = time.perf_counter()
     pid, fd = pty.fork()
     if pid == 0:
         os.execvp("/bin/bash", ["/bin/bash", "-c", command])
     else:
-        signal.signal(signal.SIGINT, signal_handler)
+        previous_handler = signal.signal(signal.SIGINT, signal_handler)
         try:
-            output = read(fd)
+            relay_output(fd, capture, spill=spill)
         except Exception as e:
             logger.error(f"An error occurred: {e}")
         finally:
             os.close(fd)
-            signal.signal(signal.SIGINT, signal.SIG_DFL)  # Reset signal handler to default
+            exit_code, signal_number = wait_for_exit(pid)
+            signal.signal(signal.SIGINT, previous_handler)
 
-    return output
+    if capture.omitted_bytes:
+        logger.debug(f"Captured {capture.total_bytes} bytes, kept head and tail for the context.")
+    return CommandResult(capture.text(), exit_code, signal_number, (time.perf_counter() - started) * 1000)
@@ -0,0 +1,293 @@
+import os
+import time
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+from .fastpath import frecency
+
+logger = logging.getLogger(__name__)
+
+BUILTINS = ('cd', 'history', 'stats', 'ssh', 'jobs', 'fg', 'exit')
+# NOTE: Only shell separators split words, so paths and flags are completed as a whole.
+COMPLETER_DELIMS = ' \t\n;|&<>'
+COMMAND_SEPARATORS = (';', '|', '&', '&&', '||', '(', '`', '$(')
+
+
+class PrefixTrie:
+    """Prefix trie over a sorted word list, each node knows the slice of words below it.
+
+    Only the first `depth` characters get nodes, longer prefixes are finished with a binary search
+    inside the node's slice. That keeps the trie small even with tens of thousands of words.
+    """
+
+    def __init__(self, words=(), depth=3):
+        self.words = sorted(set(words))
+        self.depth = depth
+        self.root = {}
+        # NOTE: A node is {char: child} plus the '' key holding its [lo, hi) range in self.words.
+        for index, word in enumerate(self.words):
+            node = self.root
+            for char in word[:depth]:
+                node = node.setdefault(char, {'': [index, index]})
+                node[''][1] = index + 1
+
+    def __len__(self):
+        return len(self.words)
+
+    def complete(self, prefix: str, limit: int | None = None) -> list[str]:
+        """Returns the words starting with prefix, in sorted order."""
+        if not prefix:
+            return self.words[:limit]
+        node = self.root
+        for char in prefix[:self.depth]:
+            node = node.get(char)
+            if node is None:
+                return []
+        lo, hi = node['']
+        if len(prefix) > self.depth:
+            lo = bisect.bisect_left(self.words, prefix, lo, hi)
+            hi = bisect.bisect_left(self.words, prefix + '\U0010ffff', lo, hi)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return self.words[lo:hi]
+
+
+class ExecutableIndex:
+    """Executables on PATH, rebuilt lazily when PATH or the mtime of one of its directories changes."""
+
+    def __init__(self, recheck_interval=1.0):
+        self.recheck_interval = recheck_interval
+        self.trie = PrefixTrie()
+        self.signature = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def path_signature() -> tuple:
+        directories = [directory for directory in os.getenv('PATH', '').split(os.pathsep) if directory]
+        mtimes = []
+        for directory in directories:
+            try:
+                mtimes.append(os.stat(directory).st_mtime_ns)
+            except OSError:
+                mtimes.append(None)
+        return tuple(directories), tuple(mtimes)
+
+    def refresh(self) -> None:
+        """Rebuilds the trie if PATH changed, checking directory mtimes at most once per interval."""
+        now = time.monotonic()
+        if self.signature is not None and now - self.checked_at < self.recheck_interval \
+                and self.signature[0] == tuple(d for d in os.getenv('PATH', '').split(os.pathsep) if d):
+            return
+        with self.lock:
+            self.checked_at = now
+            signature = self.path_signature()
+            if signature == self.signature:
+                return
+            started = time.perf_counter()
+            names = set(BUILTINS)
+            for directory in signature[0]:
+                try:
+                    with os.scandir(directory) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_file() and os.access(entry.path, os.X_OK):
+                                    names.add(entry.name)
+                            except OSError:
+                                continue
+                except OSError:
+                    continue
+            self.trie = PrefixTrie(names)
+            self.signature = signature
+            logger.debug(f"Indexed {len(self.trie)} executables in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+    def complete(self, prefix: str, limit: int | None = None) -> list[str]:
+        self.refresh()
+        return self.trie.complete(prefix, limit)
+
+
+class DirectoryCache:
+    """LRU cache of sorted directory listings, revalidated with the directory mtime."""
+
+    def __init__(self, max_directories=None):
+        self.max_directories = max_directories or int(os.getenv('SHELLM_COMPLETION_DIRS', '64'))
+        self.listings = OrderedDict()  # NOTE: path -> (mtime_ns, sorted names, directory names)
+        self.lock = threading.Lock()
+
+    def listing(self, path: str):
+        """Returns (sorted names, set of subdirectory names) of a directory, from the cache when fresh."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            return [], set()
+        with self.lock:
+            cached = self.listings.get(path)
+            if cached and cached[0] == mtime:
+                self.listings.move_to_end(path)
+                return cached[1], cached[2]
+        names = []
+        directories = set()
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    names.append(entry.name)
+                    try:
+                        if entry.is_dir():
+                            directories.add(entry.name)
+                    except OSError:
+                        continue
+        except OSError:
+            return [], set()
+        names.sort()
+        with self.lock:
+            self.listings[path] = (mtime, names, directories)
+            self.listings.move_to_end(path)
+            while len(self.listings) > self.max_directories:
+                self.listings.popitem(last=False)
+        return names, directories
+
+    def prefetch(self, path: str) -> None:
+        """Lists a directory in the background so the first TAB in it is fast."""
+        with self.lock:
+            if path in self.listings:
+                return
+        threading.Thread(target=self.listing, args=(path,), name="shellm-completion-listing", daemon=True).start()
+
+    def complete(self, text: str, limit: int | None = None) -> list[str]:
+        """Completes a (possibly ~ prefixed) path."""
+        head, base = os.path.split(text)
+        directory = os.path.expanduser(head) if head else '.'
+        names, directories = self.listing(os.path.abspath(directory))
+        matches = []
+        index = bisect.bisect_left(names, base)
+        while index < len(names) and names[index].startswith(base):
+            name = names[index]
+            index += 1
+            # NOTE: Like shells, dotfiles are only completed when asked for.
+            if name.startswith('.') and not base.startswith('.'):
+                continue
+            matches.append(os.path.join(head, name) + ('/' if name in directories else ''))
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
+
+
+class HistoryIndex:
+    """Frecency of commands and of the arguments used with each program, from the journal and history."""
+
+    def __init__(self, journal=None, history_file=None):
+        self.journal = journal
+        self.history_file = history_file
+        self.programs = {}  # NOTE: program -> score
+        self.arguments = {}  # NOTE: program -> {argument: score}
+        self.ready = False
+        self.lock = threading.Lock()
+
+    def build(self) -> None:
+        with self.lock:
+            if self.ready:
+                return
+            now = time.time()
+            usage = {}
+            if self.journal:
+                for command, uses, last in self.journal.command_usage():
+                    usage[command] = (uses, last)
+            elif self.history_file and os.path.exists(self.history_file):
+                with open(self.history_file, errors='replace') as f:
+                    for line in f:
+                        uses, _ = usage.get(line.strip(), (0, now))
+                        usage[line.strip()] = (uses + 1, now)
+            for command, (uses, last) in usage.items():
+                self.add(command, frecency(uses, now - last))
+            self.ready = True
+
+    def add(self, command: str, score: float = 100) -> None:
+        words = command.split()
+        if not words or words[0].startswith('#'):
+            return
+        program = words[0]
+        self.programs[program] = self.programs.get(program, 0) + score
+        arguments = self.arguments.setdefault(program, {})
+        for word in words[1:]:
+            arguments[word] = arguments.get(word, 0) + score
+
+    def record(self, command: str) -> None:
+        """Learns from a command run in this session."""
+        if self.ready:
+            with self.lock:
+                self.add(command)
+
+    def rank(self, matches: list[str], program: str | None = None) -> list[str]:
+        """Orders matches by frecency, most used first and alphabetically otherwise."""
+        scores = self.arguments.get(program, {}) if program else self.programs
+        return sorted(matches, key=lambda match: -scores.get(match.rstrip('/'), 0))
+
+    def complete_argument(self, program: str, prefix: str, limit: int) -> list[str]:
+        """Arguments used with program before that start with prefix, most frecent first."""
+        arguments = self.arguments.get(program)
+        if not arguments:
+            return []
+        matches = [argument for argument in arguments if argument.startswith(prefix)]
+        matches.sort(key=lambda argument: -arguments[argument])
+        return matches[:limit]
+
+
+class Completer:
+    """readline completer for programs, paths and previously used arguments."""
+
+    def __init__(self, journal=None, history_file=None, limit=None):
+        self.limit = limit or int(os.getenv('SHELLM_COMPLETION_LIMIT', '1000'))
+        self.executables = ExecutableIndex()
+        self.directories = DirectoryCache()
+        self.history = HistoryIndex(journal, history_file)
+        self.matches = []
+
+    def warm_up(self) -> None:
+        """Builds the indexes in the background."""
+        def build():
+            self.executables.refresh()
+            self.history.build()
+            self.directories.listing(os.getcwd())
+        threading.Thread(target=build, name="shellm-warmup-completion", daemon=True).start()
+
+    def install(self) -> None:
+        import readline
+        readline.set_completer_delims(COMPLETER_DELIMS)
+        readline.set_completer(self.complete)
+
+    def complete_line(self, line: str, begidx: int, text: str) -> list[str]:
+        """Returns the completions of text, the word of line starting at begidx."""
+        if line.lstrip().startswith('#'):
+            return []
+        before = line[:begidx].split()
+        is_command = not before or before[-1] in COMMAND_SEPARATORS or before[-1].endswith((';', '|', '&'))
+        if not self.history.ready:
+            self.history.build()
+        if is_command and '/' not in text:
+            matches = self.executables.complete(text, self.limit)
+            return self.history.rank(matches)
+        if is_command:
+            return self.directories.complete(text, self.limit)
+        program = before[0] if before else None
+        for index in range(len(before) - 1, -1, -1):
+            if before[index] in COMMAND_SEPARATORS and index + 1 < len(before):
+                program = before[index + 1]
+                break
+        matches = self.history.complete_argument(program, text, self.limit)
+        seen = set(matches)
+        paths = self.directories.complete(text, self.limit)
+        matches += self.history.rank([path for path in paths if path not in seen], program)
+        return matches[:self.limit]
+
+    def complete(self, text: str, state: int) -> str | None:
+        """readline entry point, computes the matches on the first call of a completion."""
+        if state == 0:
+            import readline
+            try:
+                self.matches = self.complete_line(readline.get_line_buffer(), readline.get_begidx(), text)
+            except Exception as e:
+                logger.debug(f"Completion failed: {e}")
+                self.matches = []
+        return self.matches[state] if state < len(self.matches) else None
@@ -0,0 +1,466 @@
+import os
+import uuid
+import time
+import errno
+import select
+import socket
+import signal
+import logging
+import threading
+import socketserver
+import concurrent.futures
+
+from .commands import CommandResult
+from .protocol import ProtocolError, socket_path, send_frame, recv_frame
+from .cache import SuggestionCache
+from .prefetch import SuggestionPrefetcher, FixPrefetcher
+from .journal import SessionJournal, parse_history_args
+from .fastpath import FastPath
+from utils.condense import OutputCondenser
+from utils.tokens import compact_text
+from utils.metrics import metrics
+from models.registry import LazyModel
+
+logger = logging.getLogger(__name__)
+
+OPS = ('record', 'suggest', 'decide', 'answer', 'history', 'stats', 'ping', 'shutdown')
+
+
+def daemon_running(path: str) -> bool:
+    """Whether a daemon accepts connections on path."""
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+class Session:
+    """One terminal's state: its context, the suggestion in progress, prefetched alternatives and pending fix."""
+
+    def __init__(self, terminal, model, new_context):
+        self.id = uuid.uuid4().hex[:12]
+        self.terminal = terminal
+        self.prefetcher = SuggestionPrefetcher(model)
+        self.fixes = FixPrefetcher(model)
+        self.request = None
+        self.connections = 0
+        self.last_used = time.monotonic()
+        self._new_context = new_context
+        self._context = None
+        self._context_lock = threading.Lock()
+
+    @property
+    def context(self):
+        if self._context is None:
+            with self._context_lock:
+                if self._context is None:
+                    self._context = self._new_context()
+        return self._context
+
+    def context_size(self) -> dict:
+        if self._context is None:
+            return {}
+        return {'context_tokens': self._context.request_tokens, 'token_budget': self._context.token_budget}
+
+    def close(self) -> None:
+        self.prefetcher.cancel()
+        self.fixes.cancel()
+
+
+class Reply:
+    """Sends the frames answering one request of a connection."""
+
+    def __init__(self, sock, request_id):
+        self.sock = sock
+        self.request_id = request_id
+
+    def __call__(self, **fields):
+        send_frame(self.sock, {'id': self.request_id, **fields})
+
+    def wait(self, future, poll_interval=0.05):
+        """Returns the result of a runtime future, cancelling it if the client hangs up first (CTRL+C)."""
+        watching = True
+        while not future.done():
+            if not watching:
+                concurrent.futures.wait([future])
+            elif select.select([self.sock], [], [], poll_interval)[0]:
+                # NOTE: Readable with no data is EOF, data is the next request, which recv_frame reads later.
+                if self.sock.recv(1, socket.MSG_PEEK):
+                    watching = False
+                else:
+                    future.cancel()
+                    raise ConnectionResetError(errno.ECONNRESET, "The client closed the connection.")
+        return future.result()
+
+
+class ConnectionHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        self.server.shellm.handle_connection(self.request)
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class SheLLMDaemon:
+    """Owns the model clients, connection pool, suggestion cache, history index and journal for many terminals.
+
+    Thin clients run commands in their own terminal and talk to the daemon over a UNIX socket, one
+    connection and one session (context, prefetches, pending fix) per terminal. Every connection is
+    served by its own thread, so requests from different terminals run concurrently on the shared
+    async runtime.
+    """
+
+    def __init__(self, llm_api, path=None, history_file=None, idle_timeout=None, max_sessions=None):
+        self.llm_api = llm_api
+        self.path = path or socket_path()
+        self.history_file = history_file
+        self.idle_timeout = idle_timeout if idle_timeout is not None else float(os.getenv('SHELLM_DAEMON_IDLE_TIMEOUT', '0'))
+        self.max_sessions = max_sessions or int(os.getenv('SHELLM_DAEMON_MAX_SESSIONS', '64'))
+        self.model = LazyModel(llm_api)
+        self.cache = SuggestionCache() if os.getenv('SHELLM_CACHE', 'true').lower() != 'false' else None
+        self.journal = SessionJournal() if os.getenv('SHELLM_JOURNAL', 'true').lower() != 'false' else None
+        self.fastpath = FastPath(self.journal) if os.getenv('SHELLM_FASTPATH', 'true').lower() != 'false' else None
+        self.condenser = OutputCondenser()
+        self.job_context_tokens = int(os.getenv('SHELLM_JOB_CONTEXT_TOKENS', '300'))
+        self.sessions = {}
+        self.lock = threading.Lock()
+        # NOTE: The cache's SQLite connection is shared by the connection threads.
+        self.cache_lock = threading.Lock()
+        self._past_commands = None
+        self.server = None
+        self.last_activity = time.monotonic()
+
+    def past_commands(self) -> list[str]:
+        """Commands of previous sessions, read once and shared by the contexts of all terminals."""
+        with self.lock:
+            if self._past_commands is None:
+                commands = []
+                if self.history_file:
+                    try:
+                        with open(self.history_file, errors='replace') as f:
+                            commands = f.read().splitlines()[-10000:]
+                    except OSError:
+                        pass
+                if self.journal:
+                    commands += self.journal.recent_commands()
+                self._past_commands = commands
+            return self._past_commands
+
+    def new_context(self):
+        """A fresh context seeded like a standalone SheLLM's."""
+        from utils.schemas import Context
+        context = Context()
+        context.load_past_commands(self.past_commands())
+        limit = int(os.getenv('SHELLM_JOURNAL_SEED', '5'))
+        if self.journal and limit > 0:
+            for event in self.journal.query(limit=limit):
+                context.update_session_history(event['command'], event['output_snippet'] or "", event['exit_code'])
+                context.last_command = event['command']
+                context.last_output = event['output_snippet'] or ""
+        return context
+
+    def serve(self) -> int:
+        """Serves clients until `shutdown`, SIGTERM or the idle timeout, returns the exit code."""
+        if daemon_running(self.path):
+            logger.error(f"A SheLLM daemon is already listening on {self.path}.")
+            return 1
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        old_umask = os.umask(0o177)
+        try:
+            self.server = DaemonServer(self.path, ConnectionHandler)
+        finally:
+            os.umask(old_umask)
+        self.server.shellm = self
+        signal.signal(signal.SIGTERM, lambda sig, frame: threading.Thread(target=self.server.shutdown).start())
+        self.model.warm_up()
+        if self.fastpath:
+            self.fastpath.start()
+        if self.idle_timeout > 0:
+            threading.Thread(target=self.watch_idle, name="shellm-daemon-idle", daemon=True).start()
+        logger.info(f"SheLLM daemon ({self.llm_api}) listening on {self.path}, pid {os.getpid()}.")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+            with self.lock:
+                for session in self.sessions.values():
+                    session.close()
+            if self.journal:
+                self.journal.close()
+            logger.info("SheLLM daemon stopped.")
+        return 0
+
+    def watch_idle(self) -> None:
+        """Stops the daemon once no terminal has been connected for idle_timeout seconds."""
+        while True:
+            time.sleep(min(self.idle_timeout, 5))
+            with self.lock:
+                connected = any(session.connections for session in self.sessions.values())
+            if not connected and time.monotonic() - self.last_activity > self.idle_timeout:
+                logger.info(f"No client for {self.idle_timeout:.0f}s, stopping.")
+                self.server.shutdown()
+                return
+
+    def attach(self, terminal: str) -> Session:
+        """Returns the terminal's session, creating it (and evicting the oldest idle ones) if needed."""
+        with self.lock:
+            session = self.sessions.get(terminal)
+            if session is None:
+                idle = sorted((s for s in self.sessions.values() if not s.connections), key=lambda s: s.last_used)
+                for evicted in idle[:max(len(self.sessions) - self.max_sessions + 1, 0)]:
+                    evicted.close()
+                    del self.sessions[evicted.terminal]
+                session = Session(terminal, self.model, self.new_context)
+                self.sessions[terminal] = session
+                logger.info(f"New session {session.id} for {terminal}.")
+            session.connections += 1
+            session.last_used = self.last_activity = time.monotonic()
+            return session
+
+    def detach(self, session: Session) -> None:
+        with self.lock:
+            session.connections -= 1
+            session.last_used = self.last_activity = time.monotonic()
+
+    def handle_connection(self, sock) -> None:
+        """Serves the requests of one client connection in order."""
+        session = None
+        try:
+            while True:
+                message = recv_frame(sock)
+                if message is None:
+                    break
+                reply = Reply(sock, message.get('id'))
+                op = message.get('op')
+                try:
+                    if op == 'hello':
+                        if session is None:
+                            session = self.attach(str(message.get('terminal') or f"anonymous:{uuid.uuid4().hex}"))
+                        reply(ok=True, session=session.id, llm_api=self.llm_api, pid=os.getpid(), **session.context_size())
+                    elif session is None:
+                        reply(ok=False, error="The first request must be 'hello'.")
+                    elif op in OPS:
+                        with self.lock:
+                            session.last_used = time.monotonic()
+                        getattr(self, f"op_{op}")(session, message, reply)
+                    else:
+                        reply(ok=False, error=f"Unknown op: {op}")
+                except (ProtocolError, OSError):
+                    raise
+                except Exception as e:
+                    logger.exception(f"Request {op} failed")
+                    reply(ok=False, error=str(e))
+        except ProtocolError as e:
+            logger.warning(f"Dropping client: {e}")
+        except OSError as e:
+            # NOTE: A client closes its connection to cancel a request (CTRL+C), that is not an error.
+            if e.errno not in (errno.EPIPE, errno.ECONNRESET):
+                logger.warning(f"Client connection failed: {e}")
+        finally:
+            if session is not None:
+                self.detach(session)
+
+    def sync_jobs(self, session: Session, jobs) -> None:
+        """Puts the partial output of the client's running background jobs in the context."""
+        session.context.background_jobs = [
+            {**job, 'output': compact_text(self.condenser.condense(job.get('output') or ""), self.job_context_tokens)}
+            for job in jobs or []
+        ]
+
+    def op_record(self, session, message, reply):
+        """A command finished in the client's terminal: update the context and journal, start a fix on failure.
+
+        A command without output (cd, ssh) is only journaled, one with journal=False (a line typed in an
+        SSH session) only goes into the context, as in the standalone REPL.
+        """
+        command = message['command']
+        result = CommandResult(
+            message.get('output') or "", message.get('exit_code'), message.get('signal'), message.get('duration_ms') or 0.0
+        )
+        journaled = message.get('journal', True)
+        if journaled:
+            session.fixes.cancel()
+        output = None
+        fixing = False
+        if 'output' in message:
+            output = self.condenser.condense(result.output)
+            if message.get('artifact'):
+                output += f"\n{message['artifact']}"
+            context = session.context
+            context.last_command = command
+            context.last_output = output
+            context.last_exit_code = result.exit_code
+            context.update_session_history(command, output, result.exit_code)
+            fixing = message.get('fix', True) and result.failed and not result.interrupted
+            if fixing:
+                session.fixes.start(context, command, result)
+        if self.journal and journaled:
+            self.journal.record(
+                'command',
+                command=command,
+                exit_code=result.exit_code,
+                duration_ms=result.duration_ms,
+                output=output,
+                cwd=message.get('cwd'),
+                session=session.id
+            )
+        reply(ok=True, fix=fixing, **session.context_size())
+
+    def op_suggest(self, session, message, reply):
+        """A suggestion for a prompt, from the pending fix, the cache, the fast path, a prefetch or the LLM."""
+        context = session.context
+        self.sync_jobs(session, message.get('jobs'))
+        # NOTE: Suggestions are validated against the client's directory and PATH, not the daemon's.
+        context.shell_cwd = message.get('cwd')
+        context.shell_path = message.get('path')
+        suggestion = None
+        source = 'llm'
+        if message.get('retry') and session.request:
+            request = session.request
+            request['retried'] = True
+            seen = message.get('seen') or []
+            suggestion = session.prefetcher.next(seen)
+            if not suggestion:
+                # NOTE: A fresh request may repeat a suggestion already shown, the alternatives are checked
+                # against the ones seen.
+                self.wait_for_suggestion(session, reply, session.prefetcher.start(context, request['prompt'], force=True))
+                suggestion = session.prefetcher.next(seen)
+            reply(ok=True, prompt=request['prompt'], command=suggestion, source='llm')
+            return
+        prompt = message['prompt']
+        fixing = bool(message.get('fix'))
+        if fixing:
+            pending = session.fixes.take()
+            if pending is None:
+                reply(ok=True, prompt=None, command=None, source='fix')
+                return
+            prompt, suggestion = pending
+            source = 'fix'
+        else:
+            session.fixes.cancel()
+        if self.journal:
+            self.journal.record('prompt', prompt=prompt, cwd=message.get('cwd'), session=session.id)
+        model_name = f"{self.llm_api}:{self.model.suggestion_model}"
+        if message.get('remote'):
+            model_name += ":ssh"
+        cache_key = self.cache.key(prompt, model_name, context, message.get('cwd')) if self.cache else None
+        request = session.request = {
+            'prompt': prompt, 'model_name': model_name, 'cache_key': cache_key, 'fixing': fixing, 'retried': False
+        }
+        if self.cache and not suggestion:
+            started = time.perf_counter()
+            with self.cache_lock:
+                suggestion = self.cache.get(cache_key)
+            if suggestion is not None:
+                source = 'cache'
+                metrics.record(
+                    provider=self.llm_api,
+                    model=self.model.suggestion_model,
+                    phase='suggestion',
+                    latency_ms=(time.perf_counter() - started) * 1000,
+                    cache_hit=True
+                )
+        if self.fastpath and not suggestion:
+            started = time.perf_counter()
+            suggestion = self.fastpath.suggest(prompt)
+            if suggestion is not None:
+                source = 'local'
+                metrics.record(
+                    provider='local',
+                    model='fastpath',
+                    phase='suggestion',
+                    latency_ms=(time.perf_counter() - started) * 1000
+                )
+        if not suggestion:
+            from models.runtime import runtime
+            future = runtime.submit(self.model.aget_command_suggestion(context, request['prompt']))
+            suggestion = self.wait_for_suggestion(session, reply, future)
+            source = 'llm'
+        # NOTE: Prefetch whatever answered first, a cached, local or fix suggestion is retried too.
+        session.prefetcher.start(context, request['prompt'])
+        reply(ok=True, prompt=request['prompt'], command=suggestion, source=source)
+
+    def wait_for_suggestion(self, session, reply, future):
+        """Result of a suggestion future, None when it failed, cancelled when the client hangs up."""
+        if future is None:
+            return None
+        try:
+            return reply.wait(future)
+        except OSError:
+            logger.info(f"Suggestion for session {session.id} cancelled.")
+            raise
+        except Exception as e:
+            logger.error(f"Error fetching suggestion from {self.llm_api}: {e}")
+            return None
+
+    def op_decide(self, session, message, reply):
+        """What the user did with the suggestion: accepted, rejected, retry or other."""
+        request = session.request or {}
+        decision = message.get('decision', 'other')
+        command = message.get('command')
+        if self.journal:
+            self.journal.record(
+                'suggestion', command=command, prompt=request.get('prompt'), decision=decision,
+                cwd=message.get('cwd'), session=session.id
+            )
+        if decision == 'accepted' and request:
+            if self.cache:
+                with self.cache_lock:
+                    self.cache.put(request['cache_key'], request['prompt'], request['model_name'], command)
+            if self.fastpath and not request['fixing']:
+                self.fastpath.record(request['prompt'], command)
+        if decision in ('accepted', 'rejected'):
+            session.prefetcher.cancel()
+            session.prefetcher.record(request.get('retried', False))
+            session.request = None
+        reply(ok=True)
+
+    def op_answer(self, session, message, reply):
+        """Answers a question, streaming {token} frames before the final {done} one."""
+        self.sync_jobs(session, message.get('jobs'))
+        question = message['question']
+        # NOTE: Spilled outputs stay in the client's artifact store, which sends the relevant slices along.
+        prompt = f"{question}\n\n{message['excerpt']}" if message.get('excerpt') else question
+        if os.getenv('SHELLM_STREAM', 'true').lower() != 'false':
+            tokens = []
+            for token in self.model.stream_answer(session.context, prompt):
+                reply(token=token)
+                tokens.append(token)
+            answer = "".join(tokens).strip() or None
+        else:
+            answer = self.model.answer_question(session.context, prompt)
+        if self.journal:
+            self.journal.record('question', prompt=question, output=answer, cwd=message.get('cwd'), session=session.id)
+        reply(ok=True, done=True, answer=answer)
+
+    def op_history(self, session, message, reply):
+        limit, filters = parse_history_args(message.get('args') or [], message.get('cwd'), session.id)
+        reply(ok=True, lines=self.journal.history(limit, **filters) if self.journal else [])
+
+    def op_stats(self, session, message, reply):
+        lines = []
+        if metrics.enabled:
+            with self.cache_lock:
+                lines = metrics.report(self.cache)
+        reply(ok=True, enabled=metrics.enabled, lines=lines)
+
+    def op_ping(self, session, message, reply):
+        with self.lock:
+            sessions = len(self.sessions)
+        reply(ok=True, pid=os.getpid(), sessions=sessions)
+
+    def op_shutdown(self, session, message, reply):
+        reply(ok=True)
+        threading.Thread(target=self.server.shutdown, name="shellm-daemon-shutdown").start()
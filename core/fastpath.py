@@ -0,0 +1,280 @@
+import os
+import re
+import time
+import shlex
+import string
+import logging
+import functools
+import threading
+
+from utils.retrieval import tokenize
+
+logger = logging.getLogger(__name__)
+
+STOPWORDS = {
+    'a', 'an', 'the', 'all', 'any', 'of', 'in', 'inside', 'on', 'for', 'to', 'me', 'my', 'show', 'list', 'get',
+    'display', 'print', 'what', 'which', 'is', 'are', 'with', 'and', 'please', 'current', 'this', 'that',
+    'how', 'do', 'i', 'can', 'you', 'by', 'from', 'under', 'than', 'over', 'above', 'here', 'there', 'give',
+    'see', 'check', 'tell', 'command', 'currently', 'every', 'each', 'most', 'some', 'whats', 's', 'now', 'per',
+    'machine', 'computer', 'am',
+}
+SYNONYMS = {
+    'big': 'large', 'bigger': 'large', 'biggest': 'large', 'larger': 'large', 'largest': 'large', 'huge': 'large',
+    'folder': 'directory', 'folders': 'directory', 'dir': 'directory', 'dirs': 'directory', 'directories': 'directory',
+    'listening': 'listen', 'opened': 'open', 'ram': 'memory', 'mem': 'memory', 'processes': 'process',
+    'proc': 'process', 'size': 'usage', 'sizes': 'usage', 'space': 'usage', 'used': 'usage', 'use': 'usage',
+    'container': 'container', 'recently': 'recent', 'latest': 'recent', 'newest': 'recent', 'commits': 'commit',
+    'ip': 'ip', 'address': 'ip', 'addresses': 'ip', 'modified': 'changed', 'edited': 'changed',
+}
+# NOTE: The slack may ignore one extra term of a request that the command already covers, never an action.
+ACTIONS = {
+    'delete', 'remove', 'rm', 'kill', 'stop', 'start', 'restart', 'move', 'copy', 'rename', 'compress',
+    'archive', 'extract', 'install', 'uninstall', 'change', 'set', 'create', 'edit', 'replace', 'clean',
+    'prune', 'push', 'pull', 'reset', 'chmod', 'chown', 'sort', 'count', 'not', 'except', 'without', 'no',
+}
+EXTENSIONS = {
+    'python': 'py', 'javascript': 'js', 'typescript': 'ts', 'rust': 'rs', 'shell': 'sh', 'bash': 'sh',
+    'markdown': 'md', 'text': 'txt', 'log': 'log', 'json': 'json', 'yaml': 'yaml', 'java': 'java',
+    'html': 'html', 'css': 'css', 'csv': 'csv', 'pdf': 'pdf', 'jpg': 'jpg', 'png': 'png', 'c': 'c', 'go': 'go',
+}
+SIZE_PATTERN = re.compile(r'\b(\d+(?:\.\d+)?)\s*([kmg])(?:i?b)?\b', re.IGNORECASE)
+COUNT_PATTERN = re.compile(r'\b(?:top|last|first|recent)\s+(\d+)\b', re.IGNORECASE)
+PATH_PATTERN = re.compile(r'(?:^|\s)((?:~|\.{1,2})?/\S*|~|\.{1,2})(?=\s|$)')
+EXTENSION_PATTERN = re.compile(r'(?:^|\s)\*?\.([a-z0-9]{1,8})(?=\s|$)', re.IGNORECASE)
+LANGUAGE_PATTERN = re.compile(r'\b(' + '|'.join(EXTENSIONS) + r')\s+(?:files?|code|scripts?|sources?)\b', re.IGNORECASE)
+
+# NOTE: Curated intent -> command table. Phrases are normalized like requests, {slots} are filled from the
+# request or the defaults. Only read-only commands that stay on this machine belong here.
+TEMPLATES = (
+    (("listening ports", "open ports", "ports listen"), "ss -tulpn", ()),
+    (("large files", "files larger", "find large files"),
+     "find {path} -xdev -type f -name '*.{ext}' -size +{size} -exec ls -lh {{}} + 2>/dev/null | sort -k5 -rh | head -n {count}",
+     ('ext',)),
+    (("large files", "files larger", "find large files"),
+     "find {path} -xdev -type f -size +{size} -exec ls -lh {{}} + 2>/dev/null | sort -k5 -rh | head -n {count}", ()),
+    (("large directories", "directory usage", "disk usage directories", "directory usage sorted"),
+     "du -h --max-depth=1 {path} 2>/dev/null | sort -rh | head -n {count}", ()),
+    (("docker disk usage", "docker usage", "docker disk"), "docker system df -v", ()),
+    (("disk usage", "disk free", "free disk", "free disk usage", "disk usage left"), "df -h", ()),
+    (("memory usage", "free memory", "available memory"), "free -h", ()),
+    (("process cpu", "process cpu usage", "cpu usage", "top cpu process"),
+     "ps aux --sort=-%cpu | head -n {count}", ()),
+    (("process memory", "process memory usage", "top memory process"),
+     "ps aux --sort=-%mem | head -n {count}", ()),
+    (("find files", "files", "find files extension", "files extension"),
+     "find {path} -type f -name '*.{ext}'", ('ext',)),
+    (("count lines", "count lines files", "lines code", "count lines code"),
+     "find {path} -type f -name '*.{ext}' -print0 | xargs -0 cat | wc -l", ('ext',)),
+    (("count files", "number files", "how many files"), "find {path} -type f | wc -l", ()),
+    (("recent files", "recent changed files", "changed files"),
+     "find {path} -type f -printf '%T@ %p\\n' 2>/dev/null | sort -rn | head -n {count} | cut -d' ' -f2-", ()),
+    (("empty files",), "find {path} -type f -empty", ()),
+    (("empty directory", "empty directories"), "find {path} -type d -empty", ()),
+    (("symlinks", "symbolic links", "broken symlinks"), "find {path} -type l", ()),
+    (("ip", "local ip", "network interfaces", "ip interfaces"), "ip -brief address", ()),
+    (("running containers", "docker containers", "containers", "docker ps"), "docker ps", ()),
+    (("docker images",), "docker images", ()),
+    (("kernel version",), "uname -r", ()),
+    (("os version", "linux version", "distribution version", "distro"), "cat /etc/os-release", ()),
+    (("uptime", "system uptime"), "uptime", ()),
+    (("git branches", "branches", "local branches"), "git branch -a", ()),
+    (("recent commit", "git log", "last commit", "git history"), "git log --oneline -n {count}", ()),
+    (("git status", "uncommitted changes", "git changes"), "git status --short", ()),
+    (("environment variables", "env variables", "env vars"), "env | sort", ()),
+    (("path variable", "path entries"), "echo \"$PATH\" | tr ':' '\\n'", ()),
+    (("cpu info", "cpu cores", "number cpus", "cpu"), "lscpu", ()),
+    (("logged users", "who logged", "logged in users"), "who", ()),
+    (("failed services", "failed units"), "systemctl --failed", ()),
+    (("cron jobs", "crontab"), "crontab -l", ()),
+)
+SLOT_DEFAULTS = {'path': '.', 'size': '100M', 'count': '20'}
+
+
+def stem(term: str) -> str:
+    """Very light plural stripping so 'ports' and 'port' match."""
+    term = SYNONYMS.get(term, term)
+    if len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+        term = term[:-1]
+    return term
+
+
+def parse_request(request: str) -> tuple[frozenset, dict]:
+    """Splits a request into its normalized intent terms and the slot values it mentions."""
+    terms, slots = _parse_request(request)
+    return terms, dict(slots)
+
+
+# NOTE: Journals repeat the same requests a lot, which makes building the index from them much cheaper.
+@functools.lru_cache(maxsize=65536)
+def _parse_request(request: str) -> tuple[frozenset, tuple]:
+    slots = {}
+    text = request
+    for name, pattern in (('size', SIZE_PATTERN), ('count', COUNT_PATTERN), ('path', PATH_PATTERN),
+                          ('ext', EXTENSION_PATTERN), ('ext', LANGUAGE_PATTERN)):
+        match = pattern.search(text)
+        if not match or name in slots:
+            continue
+        if name == 'size':
+            unit = match.group(2)
+            slots['size'] = match.group(1) + (unit.lower() if unit.lower() == 'k' else unit.upper())
+            text = text[:match.start()] + ' ' + text[match.end():]
+        elif name == 'count':
+            slots['count'] = match.group(1)
+            text = text[:match.start(1)] + ' ' + text[match.end(1):]
+        elif pattern is LANGUAGE_PATTERN:
+            slots['ext'] = EXTENSIONS[match.group(1).lower()]
+            # NOTE: Keep the word "files" (or "code"), only the language is a slot value.
+            text = text[:match.start(1)] + ' ' + text[match.end(1):]
+        else:
+            slots[name] = match.group(1).lower() if name == 'ext' else match.group(1)
+            text = text[:match.start(1)] + ' ' + text[match.end(1):]
+    terms = frozenset(stem(term) for term in tokenize(text) if term not in STOPWORDS)
+    return terms - STOPWORDS, tuple(sorted(slots.items()))
+
+
+def quote_path(path: str) -> str:
+    """Quotes a path for the shell while keeping a leading ~ expandable."""
+    if path == '~' or path.startswith('~/'):
+        return '~' + (shlex.quote(path[1:]) if len(path) > 2 else path[1:])
+    return shlex.quote(path)
+
+
+def frecency(uses: int, age: float) -> float:
+    """Scores a command by how often and how recently it was accepted."""
+    days = age / 86400
+    if days < 4:
+        weight = 100
+    elif days < 14:
+        weight = 70
+    elif days < 31:
+        weight = 50
+    elif days < 90:
+        weight = 30
+    else:
+        weight = 10
+    return uses * weight
+
+
+class FastPath:
+    """Offline suggestion engine answering routine requests before the LLM is asked.
+
+    Accepted suggestions are ranked by frecency, the curated TEMPLATES are slot filled. Both live in
+    dicts keyed by the request's term set, so a lookup is a handful of dict probes (the request and
+    the request minus one term) whatever the number of entries.
+    """
+
+    def __init__(self, journal=None, history_limit=None, slack=1):
+        self.journal = journal
+        self.history_limit = history_limit or int(os.getenv('SHELLM_FASTPATH_HISTORY', '50000'))
+        self.slack = slack
+        self.history = {}  # NOTE: (terms, slots) -> {command: [uses, last accepted]}
+        self.templates = {}  # NOTE: terms -> [(command template, required slots, all slots)]
+        self.ready = False
+        self.lock = threading.Lock()
+        self.building = None
+        # NOTE: Suggestions accepted before the index is ready, added once it is built.
+        self.pending = []
+        self.pending_lock = threading.Lock()
+
+    def start(self) -> None:
+        """Builds the indexes in a background thread, once."""
+        with self.pending_lock:
+            if self.building is not None or self.ready:
+                return
+            self.building = threading.Thread(target=self.build, name="shellm-fastpath-build", daemon=True)
+        self.building.start()
+
+    def build(self) -> None:
+        """Builds the indexes from the template table and the accepted suggestions in the journal."""
+        with self.lock:
+            if self.ready:
+                return
+            started = time.perf_counter()
+            for phrases, template, required in TEMPLATES:
+                for phrase in phrases:
+                    terms, _ = parse_request(phrase)
+                    fields = {field for _, field, _, _ in string.Formatter().parse(template) if field}
+                    self.templates.setdefault(terms, []).append((template, set(required), fields))
+            snapshot = None
+            if self.journal:
+                # NOTE: Journal writes are queued, flushed first so the snapshot covers every earlier acceptance.
+                self.journal.flush()
+                snapshot = time.time()
+                for prompt, command, ts in self.journal.accepted_suggestions(self.history_limit):
+                    self.add(prompt, command, ts)
+            with self.pending_lock:
+                for prompt, command, ts in self.pending:
+                    # NOTE: Suggestions accepted before the snapshot are already in the journal.
+                    if snapshot is None or ts >= snapshot:
+                        self.add(prompt, command, ts)
+                self.pending.clear()
+                self.ready = True
+            logger.debug(f"Fast path index built in {(time.perf_counter() - started) * 1000:.0f} ms "
+                         f"({len(self.history)} requests, {len(self.templates)} template phrases).")
+
+    @staticmethod
+    def history_key(terms: frozenset, slots: dict) -> tuple:
+        return terms, tuple(sorted(slots.items()))
+
+    def add(self, prompt: str, command: str, ts: float | None = None) -> None:
+        """Adds an accepted suggestion to the frecency index."""
+        terms, slots = parse_request(prompt)
+        if not terms:
+            return
+        commands = self.history.setdefault(self.history_key(terms, slots), {})
+        uses, last = commands.get(command, (0, 0))
+        commands[command] = (uses + 1, max(last, ts or time.time()))
+
+    def record(self, prompt: str, command: str) -> None:
+        """Learns from a suggestion the user accepted, whatever produced it."""
+        with self.pending_lock:
+            queued = not self.ready
+            if queued:
+                self.pending.append((prompt, command, time.time()))
+        if queued:
+            self.start()
+            return
+        with self.lock:
+            self.add(prompt, command)
+
+    def candidates(self, terms: frozenset):
+        """(term set, dropped term) of the request and, within the slack, of the sets with one term less."""
+        yield terms, None
+        if self.slack and len(terms) > 1:
+            for term in sorted(terms - ACTIONS):
+                yield terms - {term}, term
+
+    @staticmethod
+    def covers(command: str, term: str | None) -> bool:
+        """Whether a command already does what a dropped request term asks, e.g. "short" for `git status --short`.
+
+        Any other term is a qualifier ("stopped" containers, memory "of chrome") the LLM has to handle.
+        """
+        return term is None or term in {stem(word) for word in tokenize(command)}
+
+    def suggest(self, request: str) -> str | None:
+        """Returns a local suggestion for the request, or None to ask the LLM (also while the index is being built)."""
+        # NOTE: The index is built in the background, building it here would stall the first request for a second.
+        if not self.ready:
+            self.start()
+            return None
+        terms, slots = parse_request(request)
+        if not terms:
+            return None
+        now = time.time()
+        with self.lock:
+            for candidate, dropped in self.candidates(terms):
+                commands = self.history.get(self.history_key(candidate, slots))
+                if commands:
+                    command = max(commands, key=lambda command: frecency(commands[command][0], now - commands[command][1]))
+                    if self.covers(command, dropped):
+                        return command
+                for template, required, fields in self.templates.get(candidate, ()):
+                    # NOTE: A template must use every slot of the request, or it would silently drop a filter.
+                    if required <= slots.keys() <= fields:
+                        values = {**SLOT_DEFAULTS, **slots}
+                        values['path'] = quote_path(values['path'])
+                        command = template.format(**values)
+                        if self.covers(command, dropped):
+                            return command
+        return None
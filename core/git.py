@@ -1,13 +1,134 @@
+import os
+import time
+import logging
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 
-def get_git_info():
-    """Returns the current git branch and status if in a git repository."""
+logger = logging.getLogger(__name__)
+
+
+def find_repo_root(path):
+    """Returns the closest parent directory containing .git, without spawning git."""
+    while True:
+        if os.path.exists(os.path.join(path, '.git')):
+            return path
+        parent = os.path.dirname(path)
+        if parent == path:
+            return None
+        path = parent
+
+
+def git_dir(root):
+    """Resolves the git directory of a repository, following worktree `gitdir:` files."""
+    dot_git = os.path.join(root, '.git')
+    if os.path.isfile(dot_git):
+        try:
+            with open(dot_git) as f:
+                line = f.read().strip()
+            if line.startswith('gitdir:'):
+                return os.path.join(root, line[len('gitdir:'):].strip())
+        except OSError:
+            pass
+    return dot_git
+
+
+def repo_signature(root):
+    """Returns the mtimes of HEAD and index, which change whenever the branch or the index does."""
+    directory = git_dir(root)
+    signature = []
+    for name in ('HEAD', 'index'):
+        try:
+            signature.append(os.stat(os.path.join(directory, name)).st_mtime_ns)
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+def read_git_info(root, timeout=5):
+    """Returns the current git branch and number of changes using a single git call."""
     try:
-        if subprocess.run(['git', 'rev-parse', '--is-inside-work-tree'], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).returncode == 0:
-            branch = subprocess.check_output(['git', 'branch', '--show-current'], text=True).strip()
-            status = subprocess.check_output(['git', 'status', '--porcelain'], text=True)
-            changes = len(status.split('\n')) - 1 if status else 0
-            return f"{branch} | {changes} changes" if branch else ""
+        result = subprocess.run(
+            ['git', 'status', '--porcelain', '--branch'],
+            cwd=root,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=timeout
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.debug(f"git status failed in {root}: {e}")
+        return ""
+    if result.returncode != 0:
         return ""
-    except subprocess.CalledProcessError:
+    lines = result.stdout.splitlines()
+    if not lines or not lines[0].startswith('## '):
         return ""
+    header = lines[0][3:]
+    if header.startswith('No commits yet on '):
+        branch = header[len('No commits yet on '):]
+    elif header.startswith('HEAD (no branch)'):
+        branch = ""
+    else:
+        branch = header.split('...')[0].split(' ')[0]
+    changes = len(lines) - 1
+    return f"{branch} | {changes} changes" if branch else ""
+
+
+class GitSegmentProvider:
+    """Caches git prompt info per repository root and refreshes it in a background thread."""
+
+    def __init__(self, timeout=None, max_age=None):
+        self.timeout = timeout if timeout is not None else float(os.getenv('SHELLM_GIT_TIMEOUT', '0.1'))
+        self.max_age = max_age if max_age is not None else float(os.getenv('SHELLM_GIT_MAX_AGE', '5'))
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='shellm-git')
+        self.lock = threading.Lock()
+        self.cache = {}  # NOTE: root -> (signature, refreshed_at, info)
+        self.pending = {}  # NOTE: root -> future of the refresh in flight
+
+    def refresh(self, root, signature):
+        """Schedules a background refresh of the repository, reusing one already in flight."""
+        with self.lock:
+            future = self.pending.get(root)
+            if future is None:
+                future = self.executor.submit(self._refresh, root, signature)
+                self.pending[root] = future
+            return future
+
+    def _refresh(self, root, signature):
+        try:
+            info = read_git_info(root)
+            with self.lock:
+                self.cache[root] = (signature, time.monotonic(), info)
+            return info
+        finally:
+            with self.lock:
+                self.pending.pop(root, None)
+
+    def get(self, cwd=None):
+        """Returns (info, stale) for cwd, waiting at most `timeout` seconds for fresh data."""
+        root = find_repo_root(cwd or os.getcwd())
+        if root is None:
+            return "", False
+        signature = repo_signature(root)
+        cached = self.cache.get(root)
+        if cached and cached[0] == signature:
+            # NOTE: Working tree edits do not touch the index, so refresh old entries in the background.
+            if time.monotonic() - cached[1] > self.max_age:
+                self.refresh(root, signature)
+            return cached[2], False
+        future = self.refresh(root, signature)
+        try:
+            return future.result(timeout=self.timeout), False
+        except TimeoutError:
+            logger.debug(f"git info for {root} not ready after {self.timeout}s, using last known value.")
+            return (cached[2] if cached else ""), True
+
+
+git_segments = GitSegmentProvider()
+
+
+def get_git_info():
+    """Returns the current git branch and status if in a git repository."""
+    info, _ = git_segments.get()
+    return info
@@ -0,0 +1,334 @@
+import os
+import pty
+import sys
+import tty
+import time
+import errno
+import select
+import signal
+import termios
+import logging
+import threading
+from collections import deque
+from colorama import Fore, Style
+
+from .commands import OutputCapture, CommandResult, READ_SIZE, wait_for_exit
+from .ssh import ESCAPE_KEY, copy_window_size, write_all
+
+logger = logging.getLogger(__name__)
+
+# NOTE: Seconds between checks for a job whose pty hung up but whose process has not exited yet.
+REAP_INTERVAL = 0.1
+
+
+def is_background(command: str) -> bool:
+    """Whether a command line ends with a single '&' (not '&&')."""
+    stripped = command.rstrip()
+    return stripped.endswith('&') and not stripped.endswith('&&')
+
+
+def parse_job_id(argument: str) -> int | None:
+    """Parses a job reference like '%2' or '2'."""
+    try:
+        return int(argument.lstrip('%'))
+    except ValueError:
+        return None
+
+
+def parse_signal(argument: str) -> signal.Signals | None:
+    """Parses a kill option like '-9', '-KILL' or '-SIGKILL'."""
+    name = argument.lstrip('-').upper()
+    try:
+        return signal.Signals(int(name)) if name.isdigit() else signal.Signals[name if name.startswith('SIG') else f"SIG{name}"]
+    except (KeyError, ValueError):
+        return None
+
+
+class Job:
+    """A command running in its own pty, its output captured into bounded buffers."""
+
+    def __init__(self, job_id, command, pid, fd, spill=None, replay_bytes=None):
+        self.id = job_id
+        self.command = command
+        self.pid = pid
+        self.fd = fd
+        self.spill = spill
+        self.capture = OutputCapture()
+        # NOTE: Output not shown on the terminal yet, replayed (bounded) when the job is brought to the foreground.
+        self.unseen = deque()
+        self.unseen_bytes = 0
+        self.replay_bytes = replay_bytes or int(os.getenv('SHELLM_JOB_REPLAY_BYTES', '65536'))
+        self.started = time.monotonic()
+        self.cwd = os.getcwd()
+        self.result = None
+        self.killed = False
+        self.attached_fd = None
+        self.done = threading.Event()
+        self.hung_up = False
+        self.closed = False
+        self.lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.result is None
+
+    def status(self) -> str:
+        if self.running:
+            return "Running"
+        if not self.result.failed:
+            return "Done"
+        status = self.result.status()
+        return status[0].upper() + status[1:]
+
+    def feed(self, data: bytes) -> None:
+        with self.lock:
+            self.capture.feed(data)
+            if self.attached_fd is not None:
+                write_all(self.attached_fd, data)
+            else:
+                self.unseen.append(data)
+                self.unseen_bytes += len(data)
+                while self.unseen_bytes > self.replay_bytes and len(self.unseen) > 1:
+                    self.unseen_bytes -= len(self.unseen.popleft())
+        if self.spill is not None:
+            self.spill.feed(data)
+
+    def output(self) -> str:
+        """Output captured so far, the head and tail of it for long running jobs."""
+        with self.lock:
+            return self.capture.text()
+
+    def attach(self, fd) -> None:
+        """Replays the unseen output to fd and writes further output through."""
+        with self.lock:
+            for data in self.unseen:
+                write_all(fd, data)
+            self.unseen.clear()
+            self.unseen_bytes = 0
+            self.attached_fd = fd
+
+    def detach(self) -> None:
+        with self.lock:
+            self.attached_fd = None
+
+    def write(self, data: bytes) -> None:
+        """Sends keystrokes to the job, ignored once its pty is closed."""
+        with self.lock:
+            if not self.closed:
+                write_all(self.fd, data)
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            os.close(self.fd)
+
+    def finish(self, exit_code, signal_number) -> None:
+        self.result = CommandResult(
+            self.output(), exit_code, signal_number, (time.monotonic() - self.started) * 1000
+        )
+        self.done.set()
+
+
+class JobManager:
+    """Runs background jobs and multiplexes their output from a single reader thread.
+
+    The reader never touches the terminal unless a job is in the foreground, so the prompt loop
+    is never blocked. Finished jobs are queued for the prompt loop to report and record.
+    """
+
+    def __init__(self, spill_factory=None):
+        self.spill_factory = spill_factory
+        self.jobs = {}
+        self.next_id = 1
+        self.finished = deque()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.wake_read, self.wake_write = None, None
+
+    def start(self, command: str) -> Job:
+        """Starts command (without its trailing '&') as a background job."""
+        pid, fd = pty.fork()
+        if pid == 0:
+            try:
+                os.execvp("/bin/bash", ["/bin/bash", "-c", command])
+            finally:
+                os._exit(127)
+        copy_window_size(sys.stdout.fileno(), fd)
+        os.set_blocking(fd, False)
+        spill = self.spill_factory(command) if self.spill_factory else None
+        with self.lock:
+            job = Job(self.next_id, command, pid, fd, spill)
+            self.jobs[job.id] = job
+            self.next_id += 1
+            if self.thread is None:
+                self.wake_read, self.wake_write = os.pipe()
+                os.set_blocking(self.wake_read, False)
+                self.thread = threading.Thread(target=self.read_loop, name="shellm-jobs", daemon=True)
+                self.thread.start()
+        os.write(self.wake_write, b'\0')
+        return job
+
+    def read_loop(self) -> None:
+        while True:
+            with self.lock:
+                running = [job for job in self.jobs.values() if job.running]
+            # NOTE: A job whose pty hung up may still be running (it closed its output, or is still exiting),
+            # it is polled on the following ticks rather than waited for, which would stall the other jobs.
+            hung_up = [job for job in running if job.hung_up and not self.reap(job)]
+            readers = {job.fd: job for job in running if not job.hung_up}
+            try:
+                readable, _, _ = select.select([self.wake_read, *readers], [], [], REAP_INTERVAL if hung_up else None)
+            except InterruptedError:
+                continue
+            if self.wake_read in readable:
+                try:
+                    os.read(self.wake_read, 1024)
+                except BlockingIOError:
+                    pass
+            for fd in readable:
+                if fd in readers:
+                    self.drain(readers[fd])
+
+    def drain(self, job: Job) -> None:
+        """Reads what the job has written, finishing it on EOF once its process exited."""
+        try:
+            while True:
+                data = os.read(job.fd, READ_SIZE)
+                if not data:
+                    break
+                job.feed(data)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            if e.errno != errno.EIO:
+                logger.debug(f"Reading job {job.id} failed: {e}")
+        job.hung_up = True
+        self.reap(job)
+
+    def reap(self, job: Job) -> bool:
+        """Finishes the job if its process exited, without waiting for it. Returns whether it did."""
+        status = wait_for_exit(job.pid, block=False)
+        if status is None:
+            return False
+        job.finish(*status)
+        # NOTE: The pty is only closed now, closing it earlier would send SIGHUP to a job still running.
+        job.close()
+        self.finished.append(job)
+        return True
+
+    def get(self, job_id=None) -> Job | None:
+        """Returns a job by id, the newest running one by default."""
+        with self.lock:
+            if job_id is not None:
+                return self.jobs.get(job_id)
+            running = [job for job in self.jobs.values() if job.running]
+        return running[-1] if running else None
+
+    def running(self) -> list[Job]:
+        with self.lock:
+            return [job for job in self.jobs.values() if job.running]
+
+    def listing(self) -> list[Job]:
+        """Running jobs and the finished ones not reported yet, like the shell's `jobs`."""
+        with self.lock:
+            return list(self.jobs.values())
+
+    def pop_finished(self) -> list[Job]:
+        """Returns the jobs that finished since the last call and forgets them."""
+        jobs = []
+        while self.finished:
+            job = self.finished.popleft()
+            with self.lock:
+                self.jobs.pop(job.id, None)
+            jobs.append(job)
+        return jobs
+
+    def snapshot(self) -> list[dict]:
+        """Id, command, age and output so far of the running jobs, for the LLM context."""
+        return [
+            {'id': job.id, 'command': job.command, 'seconds': int(time.monotonic() - job.started), 'output': job.output()}
+            for job in self.running()
+        ]
+
+    def run_builtin(self, tokens) -> bool:
+        """Handles `jobs`, `fg [%N]` and `kill [-SIGNAL] %N`, returns False for any other command."""
+        if tokens[0] == 'jobs':
+            self.show()
+        elif tokens[0] == 'fg':
+            job = self.resolve(tokens[1:])
+            if job is not None:
+                logger.info(f"{job.command} {Fore.BLUE}(CTRL+] to send it back to the background){Style.RESET_ALL}")
+                if not self.foreground(job):
+                    logger.info(f"\n[{job.id}]+ Running      {job.command} &")
+        elif tokens[0] == 'kill' and len(tokens) > 1 and tokens[-1].startswith('%'):
+            job = self.resolve(tokens[1:])
+            sig = parse_signal(tokens[1]) if len(tokens) > 2 else signal.SIGTERM
+            if sig is None:
+                logger.error(f"kill: invalid signal {tokens[1]}")
+            elif job is not None:
+                self.kill(job, sig)
+        else:
+            return False
+        return True
+
+    def show(self) -> None:
+        """Lists the jobs like the shell's `jobs`."""
+        jobs = self.listing()
+        if not jobs:
+            logger.info("No background jobs.")
+        for job in jobs:
+            logger.info(f"[{job.id}] {job.pid} {job.status():<12} {job.command}")
+
+    def resolve(self, args) -> Job | None:
+        """The running job named by the last argument (the newest one without arguments)."""
+        job = self.get(parse_job_id(args[-1]) if args else None)
+        if job is None or not job.running:
+            logger.error(f"No such job: {args[-1] if args else 'current'}")
+            return None
+        return job
+
+    def kill(self, job: Job, sig=signal.SIGTERM) -> None:
+        """Signals the job's whole process group (the job is a session leader in its pty)."""
+        job.killed = True
+        try:
+            os.killpg(job.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def foreground(self, job: Job, stdin_fd=None, stdout_fd=None) -> bool:
+        """Relays the terminal to a job until it exits (True) or CTRL+] sends it back to the background (False)."""
+        stdin_fd = sys.stdin.fileno() if stdin_fd is None else stdin_fd
+        stdout_fd = sys.stdout.fileno() if stdout_fd is None else stdout_fd
+        saved_tty = termios.tcgetattr(stdin_fd) if os.isatty(stdin_fd) else None
+        previous_winch = signal.signal(signal.SIGWINCH, lambda sig, frame: copy_window_size(stdout_fd, job.fd))
+        copy_window_size(stdout_fd, job.fd)
+        job.attach(stdout_fd)
+        try:
+            if saved_tty is not None:
+                tty.setraw(stdin_fd)
+            while not job.done.is_set():
+                try:
+                    readable, _, _ = select.select([stdin_fd], [], [], 0.1)
+                except InterruptedError:
+                    continue
+                if stdin_fd not in readable:
+                    continue
+                data = os.read(stdin_fd, READ_SIZE)
+                if not data or ESCAPE_KEY in data:
+                    job.write(data.partition(ESCAPE_KEY)[0])
+                    return False
+                try:
+                    job.write(data)
+                except OSError:
+                    pass
+            return True
+        finally:
+            job.detach()
+            if saved_tty is not None:
+                termios.tcsetattr(stdin_fd, termios.TCSAFLUSH, saved_tty)
+            signal.signal(signal.SIGWINCH, previous_winch)
+
+    def shutdown(self) -> None:
+        """Hangs up the jobs still running when SheLLM exits."""
+        for job in self.running():
+            self.kill(job, signal.SIGHUP)
@@ -0,0 +1,235 @@
+import os
+import time
+import uuid
+import queue
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+
+from config.paths import get_shellm_dir
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS events ("
+    "id INTEGER PRIMARY KEY, session TEXT NOT NULL, ts REAL NOT NULL, kind TEXT NOT NULL, "
+    "cwd TEXT, command TEXT, prompt TEXT, decision TEXT, exit_code INTEGER, duration_ms REAL, "
+    "output_bytes INTEGER, output_digest TEXT, output_snippet TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_events_ts ON events (ts)",
+    "CREATE INDEX IF NOT EXISTS idx_events_cwd_ts ON events (cwd, ts)",
+    "CREATE INDEX IF NOT EXISTS idx_events_command ON events (command)",
+)
+# NOTE: Trigram full-text index of the commands, so `history TEXT` substring searches do not scan the journal.
+SEARCH_SCHEMA = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS events_search USING fts5("
+    "command, content='events', content_rowid='id', tokenize='trigram case_sensitive 1')",
+    "CREATE TRIGGER IF NOT EXISTS events_search_insert AFTER INSERT ON events WHEN new.command IS NOT NULL "
+    "BEGIN INSERT INTO events_search (rowid, command) VALUES (new.id, new.command); END",
+)
+# NOTE: Trigrams only match searches of at least 3 characters, shorter ones scan the commands.
+MIN_INDEXED_SEARCH = 3
+COLUMNS = (
+    'session', 'ts', 'kind', 'cwd', 'command', 'prompt', 'decision', 'exit_code', 'duration_ms',
+    'output_bytes', 'output_digest', 'output_snippet',
+)
+
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def parse_history_args(args, cwd=None, session=None):
+    """Parses `history [N] [--here] [--session] [^PREFIX | TEXT]` into a limit and query filters."""
+    limit = 20
+    filters = {}
+    for arg in args:
+        if arg.isdigit():
+            limit = int(arg)
+        elif arg == '--here':
+            filters['cwd'] = cwd or os.getcwd()
+        elif arg == '--session' and session:
+            filters['session'] = session
+        elif arg.startswith('^'):
+            filters['prefix'] = arg[1:]
+        else:
+            filters['search'] = arg
+    return limit, filters
+
+
+class SessionJournal:
+    """Append-only SQLite journal of commands, LLM prompts, suggestions and decisions.
+
+    Writes are queued and committed in batches by a background thread, so recording an
+    event never waits on disk.
+    """
+
+    def __init__(self, path=None, batch_size=1000, flush_interval=0.5, snippet_chars=2000):
+        self.path = path or os.path.join(get_shellm_dir(), 'journal.db')
+        self.session = uuid.uuid4().hex[:12]
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.snippet_chars = snippet_chars
+        self.conn = connect(self.path)
+        # NOTE: Reads share self.conn, e.g. across the connection threads of a daemon.
+        self.lock = threading.Lock()
+        for statement in SCHEMA:
+            self.conn.execute(statement)
+        self.indexed_search = self.create_search_index()
+        self.conn.commit()
+        self.queue = queue.Queue()
+        self.writer = threading.Thread(target=self._write_loop, name="shellm-journal", daemon=True)
+        self.writer.start()
+
+    def create_search_index(self) -> bool:
+        """Creates the command search index, indexing existing journals once. False when SQLite lacks FTS5 trigrams."""
+        exists = self.conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'events_search'").fetchone()
+        try:
+            for statement in SEARCH_SCHEMA:
+                self.conn.execute(statement)
+        except sqlite3.OperationalError as e:
+            logger.debug(f"History search is not indexed, SQLite has no FTS5 trigram tokenizer: {e}")
+            return False
+        if not exists:
+            self.conn.execute("INSERT INTO events_search (events_search) VALUES ('rebuild')")
+        return True
+
+    def record(self, kind, command=None, prompt=None, decision=None, exit_code=None,
+               duration_ms=None, output=None, cwd=None, session=None):
+        """Queues an event, the output is stored as a size, a digest and a short snippet.
+
+        session overrides the journal's own session, e.g. for the terminals a daemon serves.
+        """
+        output_bytes = output_digest = output_snippet = None
+        if output is not None:
+            encoded = output.encode(errors='replace')
+            output_bytes = len(encoded)
+            output_digest = hashlib.sha256(encoded).hexdigest()
+            output_snippet = output[-self.snippet_chars:]
+        self.queue.put((
+            session or self.session, time.time(), kind, cwd or os.getcwd(), command, prompt, decision, exit_code,
+            duration_ms, output_bytes, output_digest, output_snippet
+        ))
+
+    def _write_loop(self):
+        conn = connect(self.path)
+        while True:
+            batch = []
+            waiters = []
+            item = self.queue.get()
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+                elif item is not None:
+                    batch.append(item)
+                if item is None or len(batch) >= self.batch_size or waiters:
+                    break
+                try:
+                    item = self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+            if batch:
+                try:
+                    conn.executemany(
+                        f"INSERT INTO events ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                        batch
+                    )
+                    conn.commit()
+                except sqlite3.Error as e:
+                    logger.error(f"Could not write to the session journal: {e}")
+            for waiter in waiters:
+                waiter.set()
+            if item is None:
+                conn.close()
+                return
+
+    def flush(self, timeout=5):
+        """Waits until every queued event has been written."""
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait(timeout)
+
+    def close(self):
+        """Flushes the queue and stops the writer thread."""
+        self.queue.put(None)
+        self.writer.join(timeout=5)
+
+    def query(self, limit=20, kind='command', cwd=None, prefix=None, search=None, session=None):
+        """Returns the newest matching events as dicts, oldest first."""
+        self.flush()
+        source = "events"
+        order = "events.ts DESC"
+        clauses = ["events.kind = ?"]
+        params = [kind]
+        if cwd:
+            clauses.append("events.cwd = ?")
+            params.append(cwd)
+        if session:
+            clauses.append("events.session = ?")
+            params.append(session)
+        if prefix:
+            # NOTE: A range instead of LIKE so the command index is used.
+            clauses.append("events.command >= ? AND events.command < ?")
+            params += [prefix, prefix + '\uffff']
+        if search and self.indexed_search and len(search) >= MIN_INDEXED_SEARCH:
+            # NOTE: Walking the index newest first stops at the limit, events are appended in time order.
+            source = "events_search JOIN events ON events.id = events_search.rowid"
+            order = "events_search.rowid DESC"
+            clauses.append("events_search MATCH ?")
+            params.append('"' + search.replace('"', '""') + '"')
+        elif search:
+            clauses.append("instr(events.command, ?) > 0")
+            params.append(search)
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT events.id, {', '.join(f'events.{column}' for column in COLUMNS)} FROM {source} "
+                f"WHERE {' AND '.join(clauses)} ORDER BY {order} LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [dict(zip(('id',) + COLUMNS, row)) for row in reversed(rows)]
+
+    def history(self, limit=20, **filters) -> list[str]:
+        """The newest matching commands formatted for the `history` builtin, oldest first."""
+        return [
+            f"{datetime.fromtimestamp(event['ts']).strftime('%Y-%m-%d %H:%M:%S')} {event['command']}"
+            for event in self.query(limit=limit, **filters)
+        ]
+
+    def recent_commands(self, limit=5000, scan=25000):
+        """Returns up to `limit` distinct commands from the last `scan` events, oldest first."""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT command FROM events WHERE kind = 'command' ORDER BY ts DESC LIMIT ?",
+                (scan,)
+            ).fetchall()
+        commands = list(dict.fromkeys(row[0] for row in rows))[:limit]
+        return commands[::-1]
+
+    def accepted_suggestions(self, limit=50000):
+        """Returns (prompt, command, ts) of the newest accepted suggestions."""
+        self.flush()
+        with self.lock:
+            return self.conn.execute(
+                "SELECT prompt, command, ts FROM events WHERE kind = 'suggestion' AND decision = 'accepted' "
+                "ORDER BY ts DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+    def command_usage(self, scan=25000):
+        """Returns (command, uses, last ts) of the commands in the last `scan` events."""
+        self.flush()
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT command, ts FROM events WHERE kind = 'command' ORDER BY ts DESC LIMIT ?",
+                (scan,)
+            ).fetchall()
+        usage = {}
+        for command, ts in rows:
+            uses, last = usage.get(command, (0, ts))
+            usage[command] = (uses + 1, last)
+        return [(command, uses, last) for command, (uses, last) in usage.items()]
@@ -0,0 +1,125 @@
+import os
+import logging
+from concurrent.futures import CancelledError
+
+logger = logging.getLogger(__name__)
+
+
+class SuggestionPrefetcher:
+    """Fetches alternative suggestions in the background while the user reads the current one."""
+
+    def __init__(self, model, depth=None, min_retry_rate=None):
+        self.model = model
+        self.depth = depth if depth is not None else int(os.getenv('SHELLM_PREFETCH_DEPTH', '2'))
+        self.min_retry_rate = (
+            min_retry_rate if min_retry_rate is not None
+            else float(os.getenv('SHELLM_PREFETCH_MIN_RETRY_RATE', '0.1'))
+        )
+        self.future = None
+        self.alternatives = []
+        self.requests = 0
+        self.retried_requests = 0
+
+    def should_prefetch(self) -> bool:
+        """Prefetching costs tokens, so skip it when the user hardly ever retries."""
+        if self.depth <= 0:
+            return False
+        # NOTE: Always prefetch for the first requests until there is enough data to judge.
+        if self.requests < 10:
+            return True
+        return self.retried_requests / self.requests >= self.min_retry_rate
+
+    def start(self, context, prompt, force=False):
+        """Starts prefetching alternatives for the prompt, if it is worth the cost, and returns the future.
+
+        force fetches them whatever the retry rate, for a retry that the prefetched alternatives could not serve.
+        """
+        self.cancel()
+        if not force and not self.should_prefetch():
+            logger.debug("Skipping prefetch, retry rate is below the threshold.")
+            return None
+        # NOTE: A single sample may well repeat a suggestion already shown, so a forced fetch asks for two.
+        self.future = self.model.prefetch_command_alternatives(context, prompt, max(self.depth, 2) if force else self.depth)
+        return self.future
+
+    def next(self, seen) -> str | None:
+        """Returns the next prefetched alternative not shown yet, waiting for the prefetch if needed."""
+        if self.future is not None:
+            try:
+                self.alternatives.extend(self.future.result())
+            except CancelledError:
+                pass
+            except Exception as e:
+                logger.debug(f"Prefetch failed: {e}")
+            self.future = None
+        while self.alternatives:
+            alternative = self.alternatives.pop(0)
+            if alternative not in seen:
+                return alternative
+        return None
+
+    def record(self, retried: bool) -> None:
+        """Records whether a request needed a retry, which drives the cost-aware prefetching."""
+        self.requests += 1
+        if retried:
+            self.retried_requests += 1
+
+    def cancel(self) -> None:
+        """Cancels the prefetch in flight and drops the alternatives."""
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+        self.alternatives = []
+
+
+# NOTE: A bare '#' or '#fix' after a failed command asks for the precomputed fix.
+FIX_COMMANDS = ('', 'fix')
+
+
+class FixPrefetcher:
+    """Computes a fix for a failed command in the background, so '#' or '#fix' shows it right away."""
+
+    def __init__(self, model, enabled=None):
+        self.model = model
+        self.enabled = enabled if enabled is not None else os.getenv('SHELLM_FIX_PREFETCH', 'true').lower() != 'false'
+        self.future = None
+        self.prompt = None
+
+    @staticmethod
+    def fix_prompt(command, result) -> str:
+        return (
+            f"The command `{command}` failed ({result.status()}), its output is the response above. "
+            "Suggest a corrected command that does what it was meant to do."
+        )
+
+    def start(self, context, command, result) -> None:
+        """Starts computing a fix for a failed command, replacing the previous one."""
+        self.cancel()
+        self.prompt = self.fix_prompt(command, result)
+        if self.enabled:
+            from models.runtime import runtime
+            self.future = runtime.submit(self.model.aget_command_suggestion(context, self.prompt))
+
+    def take(self) -> tuple[str, str | None] | None:
+        """Returns (fix prompt, fix or None when it could not be computed), None when nothing failed."""
+        if self.prompt is None:
+            return None
+        suggestion = None
+        if self.future is not None:
+            try:
+                suggestion = self.future.result()
+            except CancelledError:
+                pass
+            except Exception as e:
+                logger.debug(f"Fix prefetch failed: {e}")
+        prompt = self.prompt
+        self.future = None
+        self.prompt = None
+        return prompt, suggestion
+
+    def cancel(self) -> None:
+        """Drops the pending fix, e.g. when the user moved on to another command."""
+        if self.future is not None:
+            self.future.cancel()
+            self.future = None
+        self.prompt = None
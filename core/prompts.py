@@ -1,20 +1,27 @@
 import os
 import getpass
 from datetime import datetime
+from typing import TYPE_CHECKING
 from colorama import Fore, Style
 
-from .git import get_git_info
-from utils.schemas import Context
+from .git import git_segments
 
+if TYPE_CHECKING:
+    from utils.schemas import Context
 
-def get_prompt():
-    """Constructs a customized prompt with user, host, path, git and venv info."""
+
+def format_tokens(tokens: int) -> str:
+    return f"{tokens / 1000:.1f}k" if tokens >= 1000 else str(tokens)
+
+
+def get_prompt(context_tokens: int | None = None, token_budget: int | None = None):
+    """Constructs a customized prompt with user, host, path, git, venv info and the context size."""
     user = getpass.getuser()
     host = os.uname().nodename
     path = os.getcwd()
+    git_info, git_stale = git_segments.get(path)
     if len(path) > 42:
         path = "../" + os.path.basename(path)
-    git_info = get_git_info()
     venv = os.environ.get('VIRTUAL_ENV', '').split('/')[-1] if os.environ.get('VIRTUAL_ENV') else ""
     current_time = datetime.now().strftime('%H:%M:%S')
     prompt_parts = [
@@ -24,42 +31,123 @@ def get_prompt():
         f"{Fore.GREEN}{path}{Style.RESET_ALL}"
     ]
     if git_info:
-        prompt_parts.append(f"{Fore.CYAN}({git_info}){Style.RESET_ALL}")
+        stale_marker = " (stale)" if git_stale else ""
+        prompt_parts.append(f"{Fore.CYAN}({git_info}{stale_marker}){Style.RESET_ALL}")
     if venv:
         prompt_parts.append(f"{Fore.MAGENTA}(venv:{venv}){Style.RESET_ALL}")
+    if context_tokens is not None:
+        color = Fore.RED if token_budget and context_tokens > token_budget else Fore.YELLOW
+        budget = f"/{format_tokens(token_budget)}" if token_budget else ""
+        prompt_parts.append(f"{color}(ctx {format_tokens(context_tokens)}{budget}){Style.RESET_ALL}")
     return ' '.join(prompt_parts) + "\n>"
 
 
-def generate_shell_system_prompt(context: Context) -> str:
-    """System prompt for when a shell command is to be generated."""
-    return (
-        "You are SheLLM, a shell command generator. Your task is to generate "
-        "accurate shell commands for a highly skilled Linux user. The user "
-        "expects precise, context-aware suggestions"
-        "The user's history of commands and their outputs from their current "
-        "linux terminal session are given to you "
-        f"below and should be analyzed to understand their patterns and "
-        f"goals:\n{context.session_history}\n\n"
-        "The user's most recent command and its output are given to you "
-        "below -  prioritize them as the primary basis "
-        "for inference, while still considering the broader context of the "
-        "given Shell Session history for"
-        "additional insights."
-        f"Most prior command from user:\n{context.last_command}\n"
-        f"Response to the most prior command:\n{context.last_command}\n\n"
-        "Your output must consist solely of shell commands, with no "
-        "explanations, additional information, comments, "
-        "or symbols not part of the command syntax."
-    )
+# NOTE: Everything that does not change between requests comes first and is kept byte-identical, so
+# providers can reuse their prompt cache: static instructions, few-shots, then the session history as
+# append-only prior turns, and only then the volatile part with the request.
+SHELL_SYSTEM_PROMPT = (
+    "You are SheLLM, a shell command generator. Your task is to generate "
+    "accurate shell commands for a highly skilled Linux user. The user "
+    "expects precise, context-aware suggestions. "
+    "The previous messages are the user's commands and their outputs from their current "
+    "linux terminal session and should be analyzed to understand their patterns and goals. "
+    "The last message gives the user's most recent command and its output - prioritize them as "
+    "the primary basis for inference, while still considering the broader context of the "
+    "session history for additional insights - followed by the request. "
+    "Your output must consist solely of shell commands, with no "
+    "explanations, additional information, comments, "
+    "or symbols not part of the command syntax."
+)
+
+QA_SYSTEM_PROMPT = (
+    "You are SheLLM, a shell command specialist. Your task is to not "
+    "discuss other topics, provide short, accurate, "
+    "extremely concise, and context-aware shell commands and shell "
+    "scripting related topics knowledge to a highly "
+    "skilled Linux user. The previous messages are the user's current terminal "
+    "session history, use them for context. The last message holds the question."
+)
 
+VALIDATION_PREFIX = (
+    {
+        "role": "system",
+        "content": "You are a senior system administrator who must validate shell commands if there are any errors or not and return the proper/fixed version. Also if the input contains anything other than a pure command (e.g., comments, flags, etc.), you must remove them. If the command is already correct, you must return it as is. If the command is in a code block, you must remove the code block. Use simple commands and avoid using complex commands for fewer errors unless required. Anticipate the user's needs and provide the best possible solution."
+    },
+    {
+        "role": "user",
+        "content": "ls -d */"
+    },
+    {
+        "role": "assistant",
+        "content": "ls -d */"
+    },
+    {
+        "role": "user",
+        "content": """```sh
+docker system df | awk '/VOLUME/{getline; while($1 ~ /^[[:alnum:]]/){print $2, $3, $4;s+=($3~/GB/?$2*1024:($3~/kB/?$2/1024:$2));getline}} END{print "Total Size: " s"MB"}' | sort -k1,1rn
+```"""
+    },
+    {
+        "role": "assistant",
+        "content": """sudo docker volume ls -q | xargs -I {} docker volume inspect {} --format='{{ .Name }}{{ printf "\t" }}{{ .Mountpoint }}' | sudo awk '{ system("sudo du -hs " $2) }' | sort -rh"""
+    },
+)
 
-def generate_qa_system_prompt(context: Context) -> str:
-    """System prompt for when a semantic question is asked."""
-    return (
-        "You are SheLLM, a shell command specialist. Your task is to not "
-        "discuss other topics, provide short, accurate,"
-        " extremely concise, and context-aware shell commands and shell "
-        "scripting related topics knowledge to a highly "
-        f"skilled Linux user. Use for context the user's current terminal "
-        f"session history:\n{context.session_history}\n\n"
+
+def generate_history_turns(context: 'Context') -> list[dict]:
+    """The session history as prior user turns, append-only between requests."""
+    return [{"role": "user", "content": entry.snippet(context.snippet_tokens)} for entry in context.history_window()]
+
+
+def generate_request_block(context: 'Context', query: str | None) -> str:
+    """The volatile part of a request: relevant older turns, past sessions and the latest output."""
+    relevant = context.relevant_entries(query) if query else []
+    block = ""
+    if relevant:
+        block += "Relevant earlier commands of this session:\n" + "".join(
+            entry.snippet(context.snippet_tokens) for entry in relevant
+        ) + "\n"
+    block += generate_past_commands_block(context, query)
+    if context.background_jobs:
+        block += "Background jobs still running (output so far):\n" + "".join(
+            f"[{job['id']}] {job['command']} &  ({job['seconds']}s)\n{job['output']}\n" for job in context.background_jobs
+        ) + "\n"
+    status = f" (exit {context.last_exit_code})" if context.last_exit_code else ""
+    block += (
+        f"Most prior command from user:\n{context.last_command}{status}\n"
+        f"Response to the most prior command:\n{context.latest_output()}\n\n"
     )
+    return block
+
+
+def generate_shell_messages(context: 'Context', request: str) -> list[dict]:
+    """Messages for when a shell command is to be generated."""
+    return [
+        {"role": "system", "content": SHELL_SYSTEM_PROMPT},
+        *generate_history_turns(context),
+        {"role": "user", "content": f"{generate_request_block(context, request)}Request: {request}"}
+    ]
+
+
+def generate_qa_messages(context: 'Context', question: str) -> list[dict]:
+    """Messages for when a semantic question is asked."""
+    return [
+        {"role": "system", "content": QA_SYSTEM_PROMPT},
+        *generate_history_turns(context),
+        {"role": "user", "content": f"{generate_request_block(context, question)}Question: {question}"}
+    ]
+
+
+def generate_past_commands_block(context: 'Context', query: str | None) -> str:
+    """Commands from previous sessions that are relevant to the request, if any."""
+    if not query:
+        return ""
+    commands = context.relevant_past_commands(query)
+    if not commands:
+        return ""
+    return "Relevant commands the user ran in previous sessions:\n" + "\n".join(commands) + "\n\n"
+
+
+def generate_validation_messages(command: str) -> list[dict]:
+    """Few-shot messages for when a generated command is to be validated, the prefix never changes."""
+    return [*VALIDATION_PREFIX, {"role": "user", "content": command}]
@@ -0,0 +1,65 @@
+import os
+import json
+import struct
+
+from config.paths import get_shellm_dir
+
+# NOTE: A frame is a 4 byte big-endian length followed by that many bytes of compact JSON.
+HEADER = struct.Struct('>I')
+MAX_FRAME_BYTES = 16 * 1024 * 1024
+
+
+class ProtocolError(Exception):
+    """A malformed or oversized frame, or a connection closed in the middle of one."""
+
+
+def socket_path() -> str:
+    """Path of the daemon's UNIX socket (SHELLM_DAEMON_SOCKET, ~/.shellm/daemon.sock by default)."""
+    return os.path.expanduser(os.getenv('SHELLM_DAEMON_SOCKET') or os.path.join(get_shellm_dir(), 'daemon.sock'))
+
+
+def encode_frame(message: dict) -> bytes:
+    payload = json.dumps(message, separators=(',', ':'), ensure_ascii=False).encode()
+    if len(payload) > MAX_FRAME_BYTES:
+        raise ProtocolError(f"Frame of {len(payload)} bytes exceeds the {MAX_FRAME_BYTES} bytes limit.")
+    return HEADER.pack(len(payload)) + payload
+
+
+def send_frame(sock, message: dict) -> None:
+    """Writes one message as a single frame."""
+    sock.sendall(encode_frame(message))
+
+
+def recv_exactly(sock, size: int) -> bytes | None:
+    """Reads size bytes, None on a clean EOF before the first byte."""
+    chunks = []
+    remaining = size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1024 * 1024))
+        if not chunk:
+            if remaining == size:
+                return None
+            raise ProtocolError("Connection closed in the middle of a frame.")
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_frame(sock) -> dict | None:
+    """Reads one message, None when the peer closed the connection."""
+    header = recv_exactly(sock, HEADER.size)
+    if header is None:
+        return None
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME_BYTES:
+        raise ProtocolError(f"Frame of {size} bytes exceeds the {MAX_FRAME_BYTES} bytes limit.")
+    payload = recv_exactly(sock, size) if size else b''
+    if payload is None:
+        raise ProtocolError("Connection closed in the middle of a frame.")
+    try:
+        message = json.loads(payload)
+    except ValueError as e:
+        raise ProtocolError(f"Invalid frame: {e}") from e
+    if not isinstance(message, dict):
+        raise ProtocolError("A frame must hold a JSON object.")
+    return message
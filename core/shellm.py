@@ -1,88 +1,392 @@
 import os
+import sys
 import logging
+import time
+import threading
 from datetime import datetime
 from colorama import Fore, Style
 
 from .commands import change_directory, run_command_with_pty
 from .ssh import run_interactive_ssh
-from utils.schemas import Context
-from models.openai_model import OpenAIModel
-from models.groq_model import GroqModel
+from .cache import SuggestionCache
+from .prefetch import SuggestionPrefetcher, FixPrefetcher, FIX_COMMANDS
+from .journal import SessionJournal, parse_history_args
+from .fastpath import FastPath
+from .completion import Completer
+from .artifacts import ArtifactStore
+from .jobs import JobManager, is_background
+from utils.interrupts import interruptible
+from utils.condense import OutputCondenser
+from utils.tokens import compact_text
+from utils.metrics import metrics
+from models.registry import LazyModel
 
 logger = logging.getLogger(__name__)
 
 
 class SheLLM:
-    def __init__(self, llm_api):
-        self.context = Context()
+    def __init__(self, llm_api, history_file=None):
+        self.llm_api = llm_api
+        self.history_file = history_file
+        self._context = None
+        self._context_lock = threading.Lock()
         self.history = []
         self.current_process_pid = None
-        if llm_api == 'groq':
-            self.model = GroqModel()
-        else:
-            self.model = OpenAIModel()
+        self.model = LazyModel(llm_api)
+        self.prefetcher = SuggestionPrefetcher(self.model)
+        self.fixes = FixPrefetcher(self.model)
+        self.stream = os.getenv('SHELLM_STREAM', 'true').lower() != 'false'
+        self.cache = SuggestionCache() if os.getenv('SHELLM_CACHE', 'true').lower() != 'false' else None
+        self.journal = SessionJournal() if os.getenv('SHELLM_JOURNAL', 'true').lower() != 'false' else None
+        self.fastpath = FastPath(self.journal) if os.getenv('SHELLM_FASTPATH', 'true').lower() != 'false' else None
+        self.condenser = OutputCondenser()
+        self.artifacts = ArtifactStore() if os.getenv('SHELLM_ARTIFACTS', 'true').lower() != 'false' else None
+        self.jobs = JobManager(self.artifacts.writer if self.artifacts else None)
+        self.job_context_tokens = int(os.getenv('SHELLM_JOB_CONTEXT_TOKENS', '300'))
+        self.completer = Completer(self.journal, history_file)
         self.ssh_session = None
         logger.info(f"SheLLM initialized with {llm_api} model.")
 
-    def update_context(self, command, output) -> None:
-        """Updates the context object with the last command and its output."""
+    @property
+    def context(self):
+        """The session context, created on first use since pydantic is slow to import."""
+        if self._context is None:
+            with self._context_lock:
+                if self._context is None:
+                    from utils.schemas import Context
+                    context = Context()
+                    context.load_past_commands(self.read_history_file())
+                    if self.journal:
+                        context.load_past_commands(self.journal.recent_commands())
+                        self.seed_context(context)
+                    self._context = context
+        return self._context
+
+    def read_history_file(self, limit=10000):
+        """Returns the last commands of the persisted readline history, newest last."""
+        if not self.history_file:
+            return []
+        try:
+            with open(self.history_file, errors='replace') as f:
+                return f.read().splitlines()[-limit:]
+        except OSError:
+            return []
+
+    def seed_context(self, context, limit=None):
+        """Replays the last journaled commands into a fresh context."""
+        limit = limit if limit is not None else int(os.getenv('SHELLM_JOURNAL_SEED', '5'))
+        if limit <= 0:
+            return
+        for event in self.journal.query(limit=limit):
+            context.update_session_history(event['command'], event['output_snippet'] or "", event['exit_code'])
+            context.last_command = event['command']
+            context.last_output = event['output_snippet'] or ""
+
+    def close(self):
+        """Hangs up background jobs and flushes pending journal writes."""
+        self.jobs.shutdown()
+        if self.journal:
+            self.journal.close()
+
+    def warm_up(self):
+        """Loads the context and the model backend in the background so the first request is fast."""
+        threading.Thread(target=lambda: self.context, name="shellm-warmup-context", daemon=True).start()
+        if self.fastpath:
+            self.fastpath.start()
+        self.completer.warm_up()
+        self.model.warm_up()
+
+    def update_context(self, command, output, exit_code=None) -> None:
+        """Updates the context object with the last command, its output and exit code."""
         self.context.last_command = command
         self.context.last_output = output
-        self.context.update_session_history(command, output)
+        self.context.last_exit_code = exit_code
+        self.context.update_session_history(command, output, exit_code)
 
         logger.debug(f"Updated the context after the last command of >{self.context.last_command})")  # noqa
 
+    def context_size(self):
+        """(estimated tokens, budget) of the context for the prompt line, (None, None) until it is loaded."""
+        if self._context is None:
+            return None, None
+        return self._context.request_tokens, self._context.token_budget
+
     def execute_system_command(self, command):
         """Executes system commands and captures output."""
         if not command.strip():
             logger.info("No command entered. Please enter a valid command.")
             return
 
+        self.fixes.cancel()
         tokens = command.split()
+        cwd = os.getcwd()
+        started = time.perf_counter()
+        output = None
+        result = None
         if tokens[0] == 'cd':
             change_directory(tokens)
+            self.completer.directories.prefetch(os.getcwd())
         elif tokens[0] == 'history':
-            self.show_history()
+            self.show_history(tokens[1:])
+        elif tokens[0] == 'stats':
+            self.show_stats(tokens[1:])
         elif tokens[0] == 'ssh':
             run_interactive_ssh(tokens, self)
+        elif self.jobs.run_builtin(tokens):
+            self.report_jobs()
+        elif is_background(command):
+            job = self.jobs.start(command.rstrip()[:-1].rstrip())
+            logger.info(f"[{job.id}] {job.pid}")
         else:
-            output = run_command_with_pty(command)
-            self.update_context(command, output)
+            spill = self.artifacts.writer(command) if self.artifacts else None
+            result = run_command_with_pty(command, spill)
+            output = self.record_result(command, result, spill)
+        if tokens[0] in ('history', 'stats', 'jobs'):
+            return
+        self.history.append(command)
+        self.completer.history.record(command)
+        if self.journal and not is_background(command):
+            self.journal.record(
+                'command',
+                command=command,
+                exit_code=result.exit_code if result else None,
+                duration_ms=result.duration_ms if result else (time.perf_counter() - started) * 1000,
+                output=output,
+                cwd=cwd
+            )
+
+    def record_result(self, command, result, spill=None, fix=True):
+        """Stores a finished command's condensed output and exit code in the context, returns the output."""
+        output = self.condenser.condense(result.output)
+        artifact = spill.close() if spill else None
+        if artifact:
+            output += f"\n{artifact.note()}"
+        self.update_context(command, output, result.exit_code)
+        if fix and result.failed and not result.interrupted:
+            self.fixes.start(self.context, command, result)
+            logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} Command failed ({result.status()}), type # for a fix.")
+        return output
+
+    def report_jobs(self):
+        """Records the background jobs that finished and tells the user, called before each prompt."""
+        for job in self.jobs.pop_finished():
+            logger.info(f"[{job.id}]+ {job.status():<12} {job.command}")
+            # NOTE: A job the user killed did not fail in a way worth fixing.
+            output = self.record_result(f"{job.command} &", job.result, job.spill, fix=not job.killed)
+            if self.journal:
+                self.journal.record(
+                    'command',
+                    command=f"{job.command} &",
+                    exit_code=job.result.exit_code,
+                    duration_ms=job.result.duration_ms,
+                    output=output,
+                    cwd=job.cwd
+                )
+
+    def sync_jobs_context(self):
+        """Puts the partial output of running jobs in the context before an LLM request."""
+        self.context.background_jobs = [
+            {**job, 'output': compact_text(self.condenser.condense(job['output']), self.job_context_tokens)}
+            for job in self.jobs.snapshot()
+        ]
 
     def handle_lm_command(self, command, remote=False):
         """Handles commands generated by the language model."""
-        while True:
-            suggestion = self.model.get_command_suggestion(
-                context = self.context,
-                prompt = command
-            )
-            if suggestion:
-                logger.info(f"Execute command: {Fore.RED}{suggestion}{Style.RESET_ALL}")
+        retried = False
+        seen = []
+        fix = None
+        fixing = command in FIX_COMMANDS
+        if fixing:
+            try:
+                with interruptible():
+                    pending = self.fixes.take()
+            except KeyboardInterrupt:
+                self.fixes.cancel()
+                logger.info(f"\n{Fore.RED}[SheLLM]{Style.RESET_ALL} Suggestion cancelled.")
+                return
+            if pending is None:
+                logger.info("No failed command to fix. Describe the command you need after '#'.")
+                return
+            command, fix = pending
+        else:
+            self.fixes.cancel()
+        self.sync_jobs_context()
+        if self.journal:
+            self.journal.record('prompt', prompt=command)
+        try:
+            while True:
+                model_name = f"{self.llm_api}:{self.model.suggestion_model}"
+                if remote:
+                    model_name += ":ssh"
+                cache_key = self.cache.key(command, model_name, self.context) if self.cache else None
+                fixed = fix is not None and not retried
+                suggestion = fix if fixed else None
+                if self.cache and not retried and not suggestion:
+                    started = time.perf_counter()
+                    suggestion = self.cache.get(cache_key)
+                    if suggestion is not None:
+                        metrics.record(
+                            provider=self.llm_api,
+                            model=self.model.suggestion_model,
+                            phase='suggestion',
+                            latency_ms=(time.perf_counter() - started) * 1000,
+                            cache_hit=True
+                        )
+                cached = suggestion is not None and not fixed
+                local = False
+                if self.fastpath and not suggestion and not retried:
+                    started = time.perf_counter()
+                    suggestion = self.fastpath.suggest(command)
+                    local = suggestion is not None
+                    if local:
+                        metrics.record(
+                            provider='local',
+                            model='fastpath',
+                            phase='suggestion',
+                            latency_ms=(time.perf_counter() - started) * 1000
+                        )
+                try:
+                    with interruptible():
+                        if retried:
+                            # NOTE: A fresh request may repeat a suggestion already shown, the alternatives
+                            # are checked against the ones seen.
+                            suggestion = self.prefetcher.next(seen)
+                            if not suggestion:
+                                self.prefetcher.start(self.context, command, force=True)
+                                suggestion = self.prefetcher.next(seen)
+                        else:
+                            if not suggestion:
+                                suggestion = self.model.get_command_suggestion(
+                                    context = self.context,
+                                    prompt = command
+                                )
+                            # NOTE: Prefetch whatever answered first, a cached, local or fix suggestion is retried too.
+                            self.prefetcher.start(self.context, command)
+                except KeyboardInterrupt:
+                    logger.info(f"\n{Fore.RED}[SheLLM]{Style.RESET_ALL} Suggestion cancelled.")
+                    return
+                if not suggestion:
+                    logger.warning("No command suggestion could be generated.")
+                    break
+                seen.append(suggestion)
+                cached_label = f" {Fore.BLUE}(cached){Style.RESET_ALL}" if cached else ""
+                if local:
+                    cached_label = f" {Fore.BLUE}(local, r to ask the LLM){Style.RESET_ALL}"
+                if fixed:
+                    cached_label = f" {Fore.BLUE}(fix){Style.RESET_ALL}"
+                logger.info(f"Execute command: {Fore.RED}{suggestion}{Style.RESET_ALL}{cached_label}")
                 response = input(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} Confirm execution (Y/n/r)").lower()
+                if self.journal:
+                    decision = {'y': 'accepted', 'n': 'rejected', 'r': 'retry'}.get(response, 'other')
+                    self.journal.record('suggestion', command=suggestion, prompt=command, decision=decision)
                 if response == 'y':
+                    self.prefetcher.cancel()
+                    if self.cache:
+                        self.cache.put(cache_key, command, model_name, suggestion)
+                    if self.fastpath and not fixing:
+                        self.fastpath.record(command, suggestion)
                     if remote and self.ssh_session:
-                        os.write(self.ssh_session, (suggestion + '\n').encode())
+                        self.ssh_session.send_command(suggestion)
                     else:
                         self.execute_system_command(suggestion)
                     break
                 elif response == 'n':
                     break
                 elif response == 'r':
+                    retried = True
                     continue
+        finally:
+            self.prefetcher.cancel()
+            self.prefetcher.record(retried)
 
     def answer_question(self, question):
         """Answers a question using the language model."""
-        answer = self.model.answer_question(self.context, question)
+        self.sync_jobs_context()
+        answer = self._answer_question(self.with_artifact_excerpt(question))
+        if self.journal:
+            self.journal.record('question', prompt=question, output=answer)
+        return answer
+
+    def with_artifact_excerpt(self, question):
+        """Appends slices of a spilled command output when the question is about it."""
+        if not self.artifacts:
+            return question
+        last_command = self._context.last_command if self._context else None
+        excerpt = self.artifacts.excerpt(question, last_command)
+        if not excerpt:
+            return question
+        logger.debug(f"Attaching {excerpt.count(chr(10))} lines of saved output to the question.")
+        return f"{question}\n\n{excerpt}"
+
+    def _answer_question(self, question):
+        if self.stream:
+            return self.stream_answer(question)
+        try:
+            with interruptible():
+                answer = self.model.answer_question(self.context, question)
+        except KeyboardInterrupt:
+            logger.info(f"\n{Fore.RED}[SheLLM]{Style.RESET_ALL} Answer cancelled.")
+            return None
         current_time = datetime.now().strftime('%H:%M:%S')
         logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} Answer: {Fore.GREEN}{answer}{Style.RESET_ALL}")
         return answer
 
-    def show_history(self):
-        """Shows the command history."""
+    def stream_answer(self, question):
+        """Answers a question and renders the tokens as they arrive."""
+        current_time = datetime.now().strftime('%H:%M:%S')
+        sys.stdout.write(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} Answer: {Fore.GREEN}")
+        sys.stdout.flush()
+        tokens = []
+        try:
+            with interruptible():
+                for token in self.model.stream_answer(self.context, question):
+                    # NOTE: Drop leading whitespace so the answer starts right after the label.
+                    if not tokens:
+                        token = token.lstrip()
+                        if not token:
+                            continue
+                    sys.stdout.write(token)
+                    sys.stdout.flush()
+                    tokens.append(token)
+        except KeyboardInterrupt:
+            sys.stdout.write(f"{Style.RESET_ALL}\n")
+            logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} Answer cancelled.")
+            return None
+        sys.stdout.write(f"{Style.RESET_ALL}\n")
+        sys.stdout.flush()
+        return "".join(tokens).strip() or None
+
+    def show_history(self, args=()):
+        """Shows the command history: `history [N] [--here] [--session] [^PREFIX | TEXT]`."""
         current_time = datetime.now().strftime('%H:%M:%S')
-        if not self.history:
+        limit, filters = parse_history_args(args, os.getcwd(), self.journal.session if self.journal else None)
+        if self.journal:
+            entries = self.journal.history(limit, **filters)
+        else:
+            entries = self.history[-limit:]
+        if not entries:
             logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} No command history.")
         else:
             logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} Command History:")
-            for i, cmd in enumerate(self.history, 1):
+            for i, cmd in enumerate(entries, 1):
                 logger.info(f"{i}: {cmd}")
+
+    def show_stats(self, args=()):
+        """Shows the request latency statistics, or exports them with `stats export jsonl|prom PATH`."""
+        current_time = datetime.now().strftime('%H:%M:%S')
+        if len(args) == 3 and args[0] == 'export' and args[1] in ('jsonl', 'prom'):
+            if args[1] == 'jsonl':
+                metrics.export_jsonl(args[2])
+            else:
+                metrics.export_prometheus(args[2])
+            logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} Exported stats to {args[2]}.")
+            return
+        if args:
+            logger.info("Usage: stats [export jsonl|prom PATH]")
+            return
+        logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {Fore.BLUE}[{current_time}]{Style.RESET_ALL} Session Stats:")
+        if not metrics.enabled:
+            logger.info("Metrics are disabled (SHELLM_METRICS=false).")
+            return
+        for line in metrics.report(self.cache):
+            logger.info(line)
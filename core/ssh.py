@@ -1,44 +1,249 @@
 import os
 import pty
 import sys
+import tty
+import fcntl
+import errno
 import select
+import signal
+import struct
+import termios
 import logging
+from colorama import Fore, Style
 
-from .prompts import get_prompt
+from .commands import OutputCapture, READ_SIZE
+from utils.condense import ESCAPE_SEQUENCE
 
 logger = logging.getLogger(__name__)
 
+# NOTE: CTRL+] switches from the remote session to the SheLLM prompt, like telnet's escape key.
+ESCAPE_KEY = b'\x1d'
+# NOTE: ssh options whose value is a separate argument (-p 2222, -i key), which must not be taken for the host.
+SSH_VALUE_OPTIONS = set('BbcDEeFIiJLlmOopQRSWw')
+# NOTE: Remote output kept per typed line to find its echo, the echo comes right after the keystrokes.
+ECHO_BYTES = 65536
 
-def run_interactive_ssh(tokens, shellm):
-    """Runs an interactive SSH session."""
+
+def destination(argv):
+    """The first non-option argument of an ssh command line (user@host), "remote" if there is none."""
+    args = iter(argv[1:])
+    for arg in args:
+        if arg == '--':
+            return next(args, "remote")
+        if arg.startswith('--'):
+            continue
+        if arg.startswith('-') and len(arg) > 1:
+            for position, flag in enumerate(arg[1:], 2):
+                if flag in SSH_VALUE_OPTIONS:
+                    # NOTE: -p2222 carries its value, -p takes the next argument.
+                    if position == len(arg):
+                        next(args, None)
+                    break
+            continue
+        return arg
+    return "remote"
+
+
+def copy_window_size(source_fd, target_fd):
+    """Copies the terminal window size of source_fd to target_fd."""
     try:
-        pid, fd = pty.fork()
-        if pid == 0:
-            os.execvp(tokens[0], tokens)
-        else:
-            shellm.ssh_session = fd  # Set the ssh_session file descriptor
-            interactive_ssh(fd, shellm)
-    except Exception as e:
-        logger.error(f"SSH session error: {e}")
+        size = fcntl.ioctl(source_fd, termios.TIOCGWINSZ, struct.pack('HHHH', 0, 0, 0, 0))
+        fcntl.ioctl(target_fd, termios.TIOCSWINSZ, size)
+    except OSError:
+        pass
+
+
+def write_all(fd, data):
+    """Writes all of data to a possibly non-blocking fd."""
+    view = memoryview(data)
+    while view:
+        try:
+            written = os.write(fd, view)
+        except BlockingIOError:
+            select.select([], [fd], [])
+            continue
+        view = view[written:]
+
+
+class SSHRelay:
+    """Full-duplex relay between the local terminal and an SSH (or any pty-spawned) session.
+
+    stdin is put in raw mode and forwarded byte by byte, so shortcuts and full-screen apps
+    work. Remote output is written through and captured per command into the context. A typed
+    line only goes into the context when the remote side echoed it back, so passwords typed at
+    the login or a sudo prompt never do.
+    """
+
+    def __init__(self, argv, shellm, stdin_fd=None, stdout_fd=None):
+        self.argv = argv
+        self.host = destination(argv)
+        self.shellm = shellm
+        self.stdin_fd = sys.stdin.fileno() if stdin_fd is None else stdin_fd
+        self.stdout_fd = sys.stdout.fileno() if stdout_fd is None else stdout_fd
+        self.pid = None
+        self.fd = None
+        self.typed = bytearray()
+        self.command = None
+        self.echo = bytearray()
+        self.echoed = None
+        self.capture = OutputCapture()
+        self.saved_tty = None
+
+    def spawn(self):
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:
+            try:
+                os.execvp(self.argv[0], self.argv)
+            finally:
+                os._exit(127)
+        copy_window_size(self.stdout_fd, self.fd)
+        os.set_blocking(self.fd, False)
+
+    def send_command(self, command):
+        """Sends a full command line to the remote side, e.g. an accepted suggestion."""
+        self.finish_command()
+        self.command = command
+        self.echoed = True
+        self.echo.clear()
+        write_all(self.fd, (command + '\n').encode())
 
-def interactive_ssh(fd, shellm):
-    """Handles interactive SSH session."""
-    while True:
-        rlist, _, _ = select.select([fd, sys.stdin], [], [])
-        
-        if fd in rlist:
-            data = os.read(fd, 1024)
-            if data:
-                sys.stdout.buffer.write(data)
-                sys.stdout.flush()
+    def finish_command(self):
+        """Stores the command line and the output captured since in the context, if the remote echoed it."""
+        if self.command is not None:
+            if self.echoed is None:
+                self.echoed = self.was_echoed(self.command)
+            if self.echoed:
+                self.shellm.update_context(
+                    f"[{self.argv[0]} {self.host}] {self.command}",
+                    self.shellm.condenser.condense(self.capture.text())
+                )
             else:
-                break
+                logger.debug("Dropped a line typed while the remote side did not echo, e.g. a password.")
+        self.command = None
+        self.echoed = None
+        self.capture = OutputCapture()
 
-        if sys.stdin in rlist:
-            command = input(get_prompt())
+    def was_echoed(self, line) -> bool:
+        """Whether the remote output since the line was started shows it, ignoring escapes and line wraps."""
+        shown = ''.join(ESCAPE_SEQUENCE.sub('', self.echo.decode(errors='replace')).split())
+        return ''.join(line.split()) in shown
+
+    def start_line(self):
+        """The first key of a new line: settles whether the previous one was echoed, then watches for this one."""
+        if self.command is not None and self.echoed is None:
+            self.echoed = self.was_echoed(self.command)
+        self.echo.clear()
+
+    def on_typed(self, data):
+        """Tracks what the user types to approximate the remote command lines."""
+        for byte in data:
+            if byte in (0x0d, 0x0a):
+                line = self.typed.decode(errors='replace').strip()
+                self.typed.clear()
+                if line:
+                    self.finish_command()
+                    self.command = line
+            elif byte in (0x7f, 0x08):
+                del self.typed[-1:]
+            elif byte == 0x03 or byte == 0x15:
+                self.typed.clear()
+            elif byte >= 0x20:
+                if not self.typed:
+                    self.start_line()
+                self.typed.append(byte)
+
+    def enter_raw_mode(self):
+        if os.isatty(self.stdin_fd):
+            self.saved_tty = termios.tcgetattr(self.stdin_fd)
+            tty.setraw(self.stdin_fd)
+
+    def restore_tty(self):
+        if self.saved_tty is not None:
+            termios.tcsetattr(self.stdin_fd, termios.TCSAFLUSH, self.saved_tty)
+            self.saved_tty = None
+
+    def prompt_mode(self):
+        """Leaves raw mode and handles one SheLLM prompt line."""
+        self.restore_tty()
+        try:
+            command = input(f"\r\n{Fore.RED}[SheLLM ssh]{Style.RESET_ALL} (# command, ## question, empty to return)> ")
+        except (EOFError, KeyboardInterrupt):
+            command = ""
+        finally:
+            self.enter_raw_mode()
+        if not command.strip():
+            write_all(self.fd, b'\x0c')  # NOTE: CTRL+L makes most remote shells redraw their prompt.
+            return
+        self.restore_tty()
+        try:
             if command.strip().startswith('##'):
-                shellm.answer_question(command[2:].strip())
+                self.shellm.answer_question(command.strip()[2:].strip())
             elif command.strip().startswith('#'):
-                shellm.handle_lm_command(command[1:].strip(), remote=True)
+                self.shellm.handle_lm_command(command.strip()[1:].strip(), remote=True)
             else:
-                os.write(fd, (command + '\n').encode())
+                self.send_command(command)
+        finally:
+            self.enter_raw_mode()
+
+    def relay(self):
+        """Runs the event loop until the remote side exits."""
+        while True:
+            try:
+                readable, _, _ = select.select([self.fd, self.stdin_fd], [], [])
+            except InterruptedError:
+                continue
+            if self.fd in readable:
+                try:
+                    while True:
+                        data = os.read(self.fd, READ_SIZE)
+                        if not data:
+                            return
+                        write_all(self.stdout_fd, data)
+                        self.capture.feed(data)
+                        if len(self.echo) < ECHO_BYTES:
+                            self.echo += data
+                except BlockingIOError:
+                    pass
+                except OSError as e:
+                    if e.errno == errno.EIO:
+                        return
+                    raise
+            if self.stdin_fd in readable:
+                data = os.read(self.stdin_fd, READ_SIZE)
+                if not data:
+                    return
+                if ESCAPE_KEY in data:
+                    before, _, after = data.partition(ESCAPE_KEY)
+                    if before:
+                        self.on_typed(before)
+                        write_all(self.fd, before)
+                    self.prompt_mode()
+                    data = after
+                if data:
+                    self.on_typed(data)
+                    write_all(self.fd, data)
+
+    def run(self):
+        """Spawns the session and relays it, always restoring the terminal afterwards."""
+        self.spawn()
+        previous_winch = signal.signal(signal.SIGWINCH, lambda sig, frame: copy_window_size(self.stdout_fd, self.fd))
+        self.shellm.ssh_session = self
+        self.enter_raw_mode()
+        try:
+            self.relay()
+        finally:
+            self.restore_tty()
+            signal.signal(signal.SIGWINCH, previous_winch)
+            self.shellm.ssh_session = None
+            self.finish_command()
+            os.close(self.fd)
+            os.waitpid(self.pid, 0)
+
+
+def run_interactive_ssh(tokens, shellm):
+    """Runs an interactive SSH session."""
+    logger.info(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} Press CTRL+] for the SheLLM prompt inside the session.")
+    try:
+        SSHRelay(tokens, shellm).run()
+    except Exception as e:
+        logger.error(f"SSH session error: {e}")
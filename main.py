@@ -3,12 +3,13 @@ import click
 import signal
 import readline
 import logging
+from dotenv import load_dotenv
 from colorama import init, Fore, Style
 from config.logger_setup import setup_logging
-from core.shellm import SheLLM
 from core.prompts import get_prompt
 
 # Configure logging
+load_dotenv()
 setup_logging()
 logger = logging.getLogger(__name__)
 
@@ -20,9 +21,23 @@ def signal_handler(sig, frame):
         logger.info("\nUse 'exit' to quit SheLLM.")
 
 @click.command()
-@click.option('--llm-api', type=click.Choice(['openai', 'groq']), default='openai', help="Choose the language model API to use.")
-def main(llm_api):
+@click.option('--llm-api', type=click.Choice(['openai', 'groq', 'local']), default='openai', help="Choose the language model API to use.")
+@click.option('--batch', 'batch_file', type=click.Path(exists=True, dir_okay=False), help="Generate suggestions and answers for every prompt of a file (JSONL or one prompt per line) without executing anything.")
+@click.option('--output', default='-', help="JSONL file the batch results are written to, stdout by default.")
+@click.option('--concurrency', type=int, default=None, help="Batch requests in flight at once (SHELLM_BATCH_CONCURRENCY, 8).")
+@click.option('--rate', type=float, default=None, help="Maximum batch requests started per second, 0 for no limit (SHELLM_BATCH_RATE).")
+@click.option('--unordered', is_flag=True, help="Write batch results as they complete instead of in input order.")
+@click.option('--resume', is_flag=True, help="Skip prompts that already have a successful result in --output.")
+@click.option('--daemon', is_flag=True, help="Serve the model, cache and journal to thin clients over a UNIX socket (SHELLM_DAEMON_SOCKET).")
+@click.option('--connect', is_flag=True, help="Run a thin REPL attached to the daemon, starting it if needed (or SHELLM_DAEMON=true).")
+def main(llm_api, batch_file, output, concurrency, rate, unordered, resume, daemon, connect):
     global shellm
+    if batch_file:
+        from core.batch import run_batch
+        raise SystemExit(run_batch(llm_api, batch_file, output, concurrency, rate, not unordered, resume))
+    if daemon:
+        from core.daemon import SheLLMDaemon
+        raise SystemExit(SheLLMDaemon(llm_api, history_file=os.path.expanduser("~/.shellm_history")).serve())
     init(autoreset=True)
     readline.parse_and_bind('tab: complete')
     readline.parse_and_bind('set editing-mode vi')
@@ -32,14 +47,26 @@ def main(llm_api):
     except FileNotFoundError:
         pass
 
-    shellm = SheLLM(llm_api=llm_api)
+    # NOTE: Imported here, a thin client must not pay for the modules only the standalone REPL needs.
+    if connect or os.getenv('SHELLM_DAEMON', 'false').lower() == 'true':
+        from core.client import DaemonClient, DaemonError, ThinShell
+        shellm = ThinShell(DaemonClient(llm_api), history_file)
+        recoverable = (DaemonError,)
+    else:
+        from core.shellm import SheLLM
+        shellm = SheLLM(llm_api=llm_api, history_file=history_file)
+        recoverable = ()
+    shellm.completer.install()
     signal.signal(signal.SIGINT, signal_handler)
 
     logger.info(f"Welcome to the {Fore.RED}SheLLM{Style.RESET_ALL} Model: {Fore.BLUE}{llm_api.capitalize()}{Style.RESET_ALL}. Prefix with '#' to generate a command or '##' to ask a question. Type 'exit' to quit.")
-    
+    if os.getenv('SHELLM_WARMUP', 'true').lower() != 'false':
+        shellm.warm_up()
+
     while True:
         try:
-            cmd = input(get_prompt())
+            shellm.report_jobs()
+            cmd = input(get_prompt(*shellm.context_size()))
             if cmd.lower() == "exit":
                 break
             elif cmd.strip().startswith('##'):
@@ -51,8 +78,11 @@ def main(llm_api):
         except (EOFError, KeyboardInterrupt):
             logger.info("\nExiting...")
             break
+        except recoverable as e:
+            logger.error(f"{Fore.RED}[SheLLM]{Style.RESET_ALL} {e}")
 
     readline.write_history_file(history_file)
+    shellm.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,324 @@
+import os
+import time
+import asyncio
+import logging
+from dotenv import load_dotenv
+from config.logger_setup import setup_logging
+from core import prompts
+from utils.schemas import Context
+from utils.sanitizer import remove_code_block
+from utils.validator import validate_locally
+from utils.metrics import metrics
+from utils.tokens import context_limit, trim_messages
+from models.runtime import runtime
+from models.breaker import breaker_for, error_status
+from models.streaming import iter_stream_tokens, closed_command_block
+
+# Configure logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+PHASES = ('suggestion', 'validation', 'qa')
+
+
+def cached_tokens(usage):
+    """Prompt tokens served from the provider's prompt cache, None when the provider does not say."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    if isinstance(details, dict):
+        return details.get('cached_tokens')
+    return getattr(details, 'cached_tokens', None)
+
+
+class ChatModel:
+    """Async OpenAI-compatible chat backend, subclasses only describe the provider."""
+
+    provider = None
+    api_key_env = None
+    base_url_env = None
+    default_base_url = None
+    default_models = {}
+    phase_params = {}
+    # NOTE: Providers that accept `n` return several candidates for the price of one prompt.
+    supports_n = False
+    # NOTE: Providers that report token usage at the end of a stream when asked with stream_options.
+    stream_usage = False
+
+    def __init__(self):
+        logger.debug("Initializing %s...", self.__class__.__name__)
+        load_dotenv()
+        self.api_key = os.getenv(self.api_key_env) if self.api_key_env else None
+        self.base_url = (os.getenv(self.base_url_env) if self.base_url_env else None) or self.default_base_url
+        # NOTE: SHELLM_<PHASE>_MODEL overrides the model of one request type, SHELLM_<PROVIDER>_MODEL all of them.
+        provider_model = os.getenv(f"SHELLM_{self.provider.upper()}_MODEL")
+        self.models = {
+            phase: os.getenv(f"SHELLM_{phase.upper()}_MODEL") or provider_model or self.default_models[phase]
+            for phase in PHASES
+        }
+        # NOTE: SHELLM_<PHASE>_API routes a request type to another backend, e.g. validation to a local model.
+        self.phase_apis = {phase: os.getenv(f"SHELLM_{phase.upper()}_API") for phase in PHASES}
+        self.timeout = float(os.getenv('SHELLM_REQUEST_TIMEOUT', '60'))
+        # NOTE: Room left in the context window for the completion itself.
+        self.response_tokens = int(os.getenv('SHELLM_RESPONSE_TOKENS', '1024'))
+        self.context_warn_ratio = float(os.getenv('SHELLM_CONTEXT_WARN_RATIO', '0.8'))
+        self.context_warned = set()
+        runtime.start()
+        self.client = self.create_client(runtime.http_client)
+        if os.getenv('SHELLM_MAX_RETRIES'):
+            self.client = self.client.with_options(max_retries=int(os.getenv('SHELLM_MAX_RETRIES')))
+        logger.debug("%s initialized.", self.__class__.__name__)
+
+    def create_client(self, http_client):
+        """Builds the async SDK client on top of the shared connection pool."""
+        raise NotImplementedError
+
+    @property
+    def suggestion_model(self):
+        return self.backend_for('suggestion').models['suggestion']
+
+    def backend_for(self, phase):
+        """Returns the backend serving a request type, this one unless SHELLM_<PHASE>_API says otherwise."""
+        name = self.phase_apis.get(phase)
+        if not name or name == self.provider:
+            return self
+        from models.registry import get_backend
+        return get_backend(name)
+
+    async def complete(self, phase, messages, **params):
+        """Sends a chat completion for a request type and returns the response."""
+        logger.debug("Messages sent to %s for %s: %s", self.provider, phase, messages)
+        started = time.perf_counter()
+        error = None
+        response = None
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.models[phase],
+                messages=messages,
+                timeout=self.timeout,
+                **{**self.phase_params.get(phase, {}), **params}
+            )
+            return response
+        except asyncio.CancelledError:
+            error = 'cancelled'
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            breaker_for(self.provider).record_failure(*error_status(e))
+            raise
+        finally:
+            if error is None:
+                breaker_for(self.provider).record_success()
+            usage = getattr(response, 'usage', None)
+            metrics.record(
+                provider=self.provider,
+                model=self.models[phase],
+                phase=phase,
+                latency_ms=(time.perf_counter() - started) * 1000,
+                prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                completion_tokens=getattr(usage, 'completion_tokens', None),
+                cached_tokens=cached_tokens(usage),
+                error=error
+            )
+
+    async def stream(self, phase, messages):
+        """Streams a chat completion for a request type token by token."""
+        logger.debug("Messages sent to %s for %s: %s", self.provider, phase, messages)
+        started = time.perf_counter()
+        stats = {}
+        error = None
+        params = dict(self.phase_params.get(phase, {}))
+        if self.stream_usage:
+            params['stream_options'] = {"include_usage": True}
+        try:
+            stream = await self.client.chat.completions.create(
+                model=self.models[phase],
+                messages=messages,
+                timeout=self.timeout,
+                stream=True,
+                **params
+            )
+            tokens = iter_stream_tokens(stream, started, f"{self.provider} {phase}", stats)
+            try:
+                async for token in tokens:
+                    yield token
+            finally:
+                await tokens.aclose()
+        except asyncio.CancelledError:
+            error = 'cancelled'
+            raise
+        except Exception as e:
+            error = type(e).__name__
+            breaker_for(self.provider).record_failure(*error_status(e))
+            raise
+        finally:
+            if error is None:
+                breaker_for(self.provider).record_success()
+            usage = stats.get('usage')
+            metrics.record(
+                provider=self.provider,
+                model=self.models[phase],
+                phase=phase,
+                latency_ms=(time.perf_counter() - started) * 1000,
+                prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                completion_tokens=getattr(usage, 'completion_tokens', None),
+                cached_tokens=cached_tokens(usage),
+                ttft_ms=stats.get('ttft_ms'),
+                error=error
+            )
+
+    async def warm_up(self):
+        """Opens a pooled connection to the provider so the first request skips the handshakes."""
+        try:
+            await runtime.http_client.head(str(self.client.base_url), timeout=5)
+            logger.debug("Connection to %s warmed up.", self.provider)
+        except Exception as e:
+            logger.debug("Could not warm up connection to %s: %s", self.provider, e)
+
+    async def avalidate_command(self, command):
+        """Validates the command to ensure it is safe and valid to execute."""
+        logger.debug("Validating command: %s", command)
+        response = await self.complete('validation', prompts.generate_validation_messages(command))
+        logger.debug("Response: %s", response)
+        if response.choices:
+            validated_command = response.choices[0].message.content.strip()
+            output = remove_code_block(validated_command)
+            logger.debug("Validated command: %s", output)
+            return output
+        logger.warning("No choices in response.")
+        return None
+
+    async def avalidate_suggestion(self, command, cwd=None, path=None):
+        """Validates the command locally and only asks the LLM to fix it when that fails."""
+        # NOTE: bash -n forks, run it off the event loop so concurrent requests (batch mode) keep flowing.
+        local_command, problem = await asyncio.to_thread(validate_locally, command, cwd, path)
+        if problem is None:
+            metrics.increment('validation.local')
+            logger.debug("Command passed local validation: %s", local_command)
+            return local_command
+        metrics.increment('validation.llm')
+        logger.debug("Local validation failed (%s), falling back to LLM validation.", problem)
+        return await self.backend_for('validation').avalidate_command(command)
+
+    async def aget_command_suggestion(self, context: Context, prompt: str) -> str | None:
+        """Generates shell commands based on context and a prompt, on the backend SHELLM_SUGGESTION_API names."""
+        backend = self.backend_for('suggestion')
+        if backend is not self:
+            return await backend.aget_command_suggestion(context, prompt)
+        logger.debug("Generating command suggestion from %s and prompt: %s", self.__class__.__name__, prompt)
+        suggested_command = ""
+        tokens = self.stream('suggestion', self.suggestion_messages(context, prompt))
+        try:
+            # NOTE: Stop reading as soon as the fenced command is closed, the rest is chatter.
+            async for token in tokens:
+                suggested_command += token
+                command_block = closed_command_block(suggested_command)
+                if command_block:
+                    suggested_command = command_block
+                    break
+        finally:
+            await tokens.aclose()
+        suggested_command = suggested_command.strip()
+        if suggested_command:
+            logger.debug("Suggested command before validation: %s", suggested_command)
+            suggested_command = await self.avalidate_suggestion(suggested_command, context.shell_cwd, context.shell_path)
+            logger.debug("Suggested command after validation: %s", suggested_command)
+            return suggested_command
+        logger.warning("Empty suggestion in response.")
+        return None
+
+    async def aget_command_alternatives(self, context: Context, prompt: str, count: int) -> list[str]:
+        """Generates up to `count` distinct validated alternatives for a prompt."""
+        backend = self.backend_for('suggestion')
+        if backend is not self:
+            return await backend.aget_command_alternatives(context, prompt, count)
+        logger.debug("Prefetching %d alternatives from %s for prompt: %s", count, self.__class__.__name__, prompt)
+        messages = self.suggestion_messages(context, prompt)
+        if self.supports_n:
+            responses = [await self.complete('suggestion', messages, n=count, temperature=1.0)]
+        else:
+            responses = await asyncio.gather(
+                *(self.complete('suggestion', messages, temperature=1.0) for _ in range(count)),
+                return_exceptions=True
+            )
+        candidates = []
+        for response in responses:
+            if isinstance(response, Exception):
+                logger.debug("Alternative request failed: %s", response)
+                continue
+            for choice in response.choices:
+                content = choice.message.content or ""
+                candidates.append((closed_command_block(content) or content).strip())
+        validated = await asyncio.gather(
+            *(self.avalidate_suggestion(candidate, context.shell_cwd, context.shell_path) for candidate in candidates if candidate),
+            return_exceptions=True
+        )
+        alternatives = []
+        for command in validated:
+            if isinstance(command, str) and command and command not in alternatives:
+                alternatives.append(command)
+        return alternatives
+
+    def fit_context(self, phase, messages: list[dict]) -> list[dict]:
+        """Trims the messages to the model's context window before they are sent, warning when it fills up."""
+        model = self.models[phase]
+        limit = context_limit(model) - self.response_tokens
+        messages, before, after = trim_messages(messages, limit)
+        if after < before:
+            logger.warning(
+                "Context of %d tokens exceeds the %d token limit of %s, trimmed to %d tokens.", before, limit, model, after
+            )
+        elif before > limit * self.context_warn_ratio and model not in self.context_warned:
+            # NOTE: Once per model, it would be repeated on every request otherwise.
+            self.context_warned.add(model)
+            logger.warning("Context of %d tokens is %.0f%% of the %d token limit of %s.", before, before / limit * 100, limit, model)
+        return messages
+
+    def suggestion_messages(self, context: Context, prompt: str) -> list[dict]:
+        """Builds the messages for a command suggestion."""
+        return self.fit_context('suggestion', prompts.generate_shell_messages(context, prompt))
+
+    async def aanswer_question(self, context: Context, question: str) -> str | None:
+        """Generates answers to semantic questions."""
+        response = await self.complete('qa', self.qa_messages(context, question))
+        logger.debug("Response: %s", response)
+        if response.choices:
+            answer = response.choices[0].message.content.strip()
+            logger.debug("Answer: %s", answer)
+            return answer
+        logger.warning("No choices in response.")
+        return None
+
+    def qa_messages(self, context: Context, question: str) -> list[dict]:
+        """Builds the messages for a semantic question."""
+        # NOTE: Rendering the history is not free, only do it when debug logging is on.
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Answering question for context: %s and question: %s", context.session_history, question)
+        return self.fit_context('qa', prompts.generate_qa_messages(context, question))
+
+    def get_command_suggestion(self, context: Context, prompt: str) -> str | None:
+        """Synchronous wrapper of aget_command_suggestion, cancelled on CTRL+C."""
+        try:
+            return runtime.run(self.aget_command_suggestion(context, prompt))
+        except Exception as e:
+            logger.error(f"Error fetching suggestion from {self.provider}: {e}")
+            return None
+
+    def prefetch_command_alternatives(self, context: Context, prompt: str, count: int):
+        """Starts fetching alternatives in the background and returns a concurrent.futures.Future."""
+        return runtime.submit(self.aget_command_alternatives(context, prompt, count))
+
+    def answer_question(self, context: Context, question: str) -> str | None:
+        """Synchronous wrapper of aanswer_question, cancelled on CTRL+C."""
+        backend = self.backend_for('qa')
+        try:
+            return runtime.run(backend.aanswer_question(context, question))
+        except Exception as e:
+            logger.error(f"Error fetching answer from {backend.provider}: {e}")
+            return None
+
+    def stream_answer(self, context: Context, question: str):
+        """Generates answers to semantic questions and yields them token by token."""
+        backend = self.backend_for('qa')
+        try:
+            yield from runtime.iterate(backend.stream('qa', backend.qa_messages(context, question)))
+        except Exception as e:
+            logger.error(f"Error streaming answer from {backend.provider}: {e}")
@@ -0,0 +1,97 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def error_status(error):
+    """Returns (HTTP status, Retry-After seconds) of an SDK error, None for what it does not carry."""
+    status = getattr(error, 'status_code', None)
+    retry_after = None
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        try:
+            retry_after = float(headers.get('retry-after'))
+        except (TypeError, ValueError):
+            retry_after = None
+    return status, retry_after
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker with exponential backoff.
+
+    After `failure_threshold` consecutive failures (or a single 429) the provider is skipped for the
+    backoff period. The circuit is then half open: the next request is a trial and no other one is let
+    through until it finishes. Its success closes the circuit, its failure doubles the backoff.
+    """
+
+    def __init__(self, name, failure_threshold=None, base_backoff=None, max_backoff=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or int(os.getenv('SHELLM_BREAKER_FAILURES', '3'))
+        self.base_backoff = base_backoff or float(os.getenv('SHELLM_BREAKER_BACKOFF', '2'))
+        self.max_backoff = max_backoff or float(os.getenv('SHELLM_BREAKER_MAX_BACKOFF', '120'))
+        self.failures = 0
+        self.opens = 0
+        self.open_until = 0.0
+        self.trial = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.open_until == 0:
+            return 'closed'
+        return 'open' if time.monotonic() < self.open_until or self.trial else 'half-open'
+
+    def allow(self) -> bool:
+        """Whether a request may be sent to the provider now, to be called right before sending it.
+
+        When the circuit is half open this takes the trial, so the next call returns False until the
+        trial's outcome is recorded.
+        """
+        with self.lock:
+            if self.open_until == 0:
+                return True
+            if time.monotonic() < self.open_until or self.trial:
+                return False
+            self.trial = True
+            return True
+
+    def record_cancelled(self) -> None:
+        """The trial request was cancelled before its outcome was known, the next request is the trial."""
+        with self.lock:
+            self.trial = False
+
+    def record_success(self) -> None:
+        with self.lock:
+            self.failures = 0
+            self.opens = 0
+            self.open_until = 0.0
+            self.trial = False
+
+    def record_failure(self, status=None, retry_after=None) -> None:
+        with self.lock:
+            self.failures += 1
+            self.trial = False
+            if status != 429 and self.failures < self.failure_threshold and self.open_until == 0:
+                return
+            backoff = min(self.base_backoff * 2 ** self.opens, self.max_backoff)
+            if retry_after:
+                backoff = max(backoff, min(retry_after, self.max_backoff))
+            self.opens += 1
+            self.open_until = time.monotonic() + backoff
+        logger.warning(f"{self.name} is failing (status {status or 'error'}), skipping it for {backoff:.0f}s.")
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(provider) -> CircuitBreaker:
+    """Returns the shared circuit breaker of a provider."""
+    with _breakers_lock:
+        if provider not in _breakers:
+            _breakers[provider] = CircuitBreaker(provider)
+        return _breakers[provider]
@@ -0,0 +1,180 @@
+import os
+import copy
+import asyncio
+import logging
+
+from utils.metrics import metrics, percentile
+from models.runtime import runtime
+from models.breaker import breaker_for
+
+logger = logging.getLogger(__name__)
+
+
+class HedgedModel:
+    """Sends suggestion and QA requests to a primary backend and hedges them with a secondary one.
+
+    The secondary request only starts once the primary took longer than its recent p95 latency
+    (or failed), the first valid result wins and the other request is cancelled. Providers whose
+    circuit breaker is open are skipped, and a half open circuit lets only its trial request through.
+    """
+
+    def __init__(self, primary, secondary):
+        self.primary = self.without_retries(primary)
+        self.secondary = self.without_retries(secondary)
+        self.provider = primary.provider
+        self.default_delay = float(os.getenv('SHELLM_HEDGE_DELAY_MS', '1500')) / 1000
+        self.min_delay = float(os.getenv('SHELLM_HEDGE_MIN_DELAY_MS', '200')) / 1000
+        self.quantile = float(os.getenv('SHELLM_HEDGE_PERCENTILE', '0.95'))
+
+    @staticmethod
+    def without_retries(backend):
+        """A copy of the backend whose client does not retry, the shared backend keeps its retries.
+
+        The other provider and the circuit breakers replace the SDK retries, which would otherwise
+        sit on a 429 or a dead connection with backoff instead of letting the race move on.
+        """
+        backend = copy.copy(backend)
+        backend.client = backend.client.with_options(max_retries=0)
+        return backend
+
+    def __getattr__(self, attribute):
+        return getattr(self.primary, attribute)
+
+    def hedge_delay(self, phase) -> float:
+        """Seconds to wait for the primary before hedging, from its recent latencies."""
+        model = self.primary.models[phase]
+        latencies = [
+            record['latency_ms'] for record in list(metrics.records)[-200:]
+            if record['provider'] == self.primary.provider and record['model'] == model
+            and record['phase'] == phase and not record['error'] and not record['cache_hit']
+        ]
+        if len(latencies) < 5:
+            return self.default_delay
+        return max(percentile(latencies, self.quantile) / 1000, self.min_delay)
+
+    def backends(self):
+        """The backends to race, in order, without the ones whose circuit is open."""
+        return [model for model in (self.primary, self.secondary) if breaker_for(model.provider).state != 'open']
+
+    async def race(self, phase, request, is_valid, discard=None):
+        """Runs request(backend) on the backends with hedging and returns the first valid result.
+
+        discard is called with valid results that lost the race, e.g. to close their streams.
+        """
+        pending = {}
+        trials = set()
+        backends = self.backends()
+        # NOTE: When every circuit is open, try the primary anyway rather than failing without a request.
+        forced = not backends
+        backends = backends or [self.primary]
+        delay = self.hedge_delay(phase)
+        started = asyncio.get_running_loop().time()
+        try:
+            while True:
+                if backends and (not pending or asyncio.get_running_loop().time() - started >= delay):
+                    backend = backends.pop(0)
+                    breaker = breaker_for(backend.provider)
+                    trial = breaker.state == 'half-open'
+                    # NOTE: The breaker is only asked right before sending, since a concurrent race may
+                    # have taken the trial of a half open circuit since backends().
+                    if not breaker.allow() and not forced:
+                        continue
+                    if pending:
+                        metrics.increment(f'hedge.{phase}.started')
+                        logger.debug("Hedging %s request to %s after %.0f ms.", phase, backend.provider, delay * 1000)
+                    task = asyncio.ensure_future(request(backend))
+                    pending[task] = backend
+                    if trial:
+                        trials.add(task)
+                if not pending:
+                    return None
+                timeout = None
+                if backends:
+                    timeout = max(delay - (asyncio.get_running_loop().time() - started), 0)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    backend = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.debug("%s %s request failed: %s", backend.provider, phase, e)
+                        result = None
+                    if is_valid(result):
+                        if backend is not self.primary:
+                            metrics.increment(f'hedge.{phase}.won')
+                        return result
+                    # NOTE: Do not wait out the hedge delay when the primary already failed.
+                    delay = 0
+        finally:
+            for task in pending:
+                if task.done() and not task.cancelled() and task.exception() is None and discard:
+                    await discard(task.result())
+                if not task.done() and task in trials:
+                    # NOTE: A cancelled trial records no outcome, free it for the next request.
+                    breaker_for(pending[task].provider).record_cancelled()
+                task.cancel()
+
+    async def aget_command_suggestion(self, context, prompt):
+        return await self.race(
+            'suggestion',
+            lambda backend: backend.aget_command_suggestion(context, prompt),
+            lambda result: bool(result)
+        )
+
+    async def aanswer_question(self, context, question):
+        return await self.race(
+            'qa',
+            lambda backend: backend.backend_for('qa').aanswer_question(context, question),
+            lambda result: bool(result)
+        )
+
+    async def astream_answer(self, context, question):
+        """Streams the answer of whichever backend produces its first token first."""
+        async def first_token(backend):
+            backend = backend.backend_for('qa')
+            tokens = backend.stream('qa', backend.qa_messages(context, question))
+            try:
+                return tokens, await tokens.__anext__()
+            except BaseException:
+                await tokens.aclose()
+                raise
+
+        async def close(result):
+            await result[0].aclose()
+
+        winner = await self.race('qa', first_token, lambda result: result is not None, close)
+        if winner is None:
+            return
+        tokens, token = winner
+        try:
+            yield token
+            async for token in tokens:
+                yield token
+        finally:
+            await tokens.aclose()
+
+    async def warm_up(self):
+        await asyncio.gather(self.primary.warm_up(), self.secondary.warm_up())
+
+    def get_command_suggestion(self, context, prompt):
+        """Synchronous wrapper of aget_command_suggestion, cancelled on CTRL+C."""
+        try:
+            return runtime.run(self.aget_command_suggestion(context, prompt))
+        except Exception as e:
+            logger.error(f"Error fetching hedged suggestion: {e}")
+            return None
+
+    def answer_question(self, context, question):
+        """Synchronous wrapper of aanswer_question, cancelled on CTRL+C."""
+        try:
+            return runtime.run(self.aanswer_question(context, question))
+        except Exception as e:
+            logger.error(f"Error fetching hedged answer: {e}")
+            return None
+
+    def stream_answer(self, context, question):
+        """Generates answers to semantic questions and yields them token by token."""
+        try:
+            yield from runtime.iterate(self.astream_answer(context, question))
+        except Exception as e:
+            logger.error(f"Error streaming hedged answer: {e}")
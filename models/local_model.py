@@ -0,0 +1,24 @@
+import openai
+from models.base import ChatModel
+
+
+class LocalModel(ChatModel):
+    """Any OpenAI-compatible server, e.g. a self-hosted llama.cpp or vLLM instance."""
+
+    provider = "local"
+    api_key_env = "SHELLM_LOCAL_API_KEY"
+    base_url_env = "SHELLM_LOCAL_BASE_URL"
+    default_base_url = "http://localhost:8080/v1"
+    default_models = {
+        "suggestion": "local",
+        "validation": "local",
+        "qa": "local",
+    }
+    supports_n = True
+    phase_params = {
+        "validation": {"temperature": 0},
+    }
+
+    def create_client(self, http_client):
+        # NOTE: Most local servers ignore the key but the SDK requires one.
+        return openai.AsyncOpenAI(api_key=self.api_key or "local", base_url=self.base_url, http_client=http_client)
@@ -0,0 +1,67 @@
+import os
+import logging
+import importlib
+import threading
+
+logger = logging.getLogger(__name__)
+
+# NOTE: Backends are imported by name so the SDKs are only loaded for the provider in use.
+BACKENDS = {
+    'openai': ('models.openai_model', 'OpenAIModel'),
+    'groq': ('models.groq_model', 'GroqModel'),
+    'local': ('models.local_model', 'LocalModel'),
+}
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def load_backend(name):
+    """Imports the backend module for `name` and constructs its model."""
+    module_name, class_name = BACKENDS[name]
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)()
+
+
+def get_backend(name):
+    """Returns the shared backend instance for `name`, constructing it on first use."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM API: {name}")
+    with _backends_lock:
+        if name not in _backends:
+            logger.debug(f"Loading {name} backend...")
+            _backends[name] = load_backend(name)
+        return _backends[name]
+
+
+class LazyModel:
+    """Proxy that imports the SDK and builds the client on first use."""
+
+    def __init__(self, name):
+        if name not in BACKENDS:
+            raise ValueError(f"Unknown LLM API: {name}")
+        self.name = name
+        self._model = None
+
+    def get(self):
+        """Returns the backend model, constructing it if needed."""
+        if self._model is None:
+            model = get_backend(self.name)
+            # NOTE: SHELLM_HEDGE_API names a second provider that races slow or failing requests.
+            hedge = os.getenv('SHELLM_HEDGE_API')
+            if hedge and hedge != self.name:
+                from models.hedging import HedgedModel
+                model = HedgedModel(model, get_backend(hedge))
+            self._model = model
+        return self._model
+
+    def warm_up(self):
+        """Constructs the backend and opens its connection in a background thread."""
+        def warm_up():
+            from models.runtime import runtime
+            model = self.get()
+            runtime.run(model.warm_up())
+        threading.Thread(target=warm_up, name=f"shellm-warmup-{self.name}", daemon=True).start()
+
+    def __getattr__(self, attribute):
+        return getattr(self.get(), attribute)
@@ -0,0 +1,87 @@
+import os
+import queue
+import asyncio
+import logging
+import threading
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRuntime:
+    """Background event loop shared by all backends, with one pooled HTTP client."""
+
+    def __init__(self):
+        self.loop = None
+        self.thread = None
+        self.http_client = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the event loop thread and the connection pool if they are not running yet."""
+        with self._lock:
+            if self.loop is not None:
+                return
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=int(os.getenv('SHELLM_MAX_CONNECTIONS', '20')),
+                    max_keepalive_connections=int(os.getenv('SHELLM_MAX_KEEPALIVE', '10')),
+                    keepalive_expiry=float(os.getenv('SHELLM_KEEPALIVE_EXPIRY', '120'))
+                ),
+                timeout=httpx.Timeout(float(os.getenv('SHELLM_REQUEST_TIMEOUT', '60')), connect=10.0),
+                follow_redirects=True
+            )
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self.loop.run_forever, name="shellm-async", daemon=True)
+            self.thread.start()
+            logger.debug("Async runtime started.")
+
+    def submit(self, coro):
+        """Schedules a coroutine on the runtime and returns a concurrent.futures.Future."""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Runs a coroutine to completion, cancelling it on timeout or CTRL+C."""
+        if timeout is not None:
+            coro = asyncio.wait_for(coro, timeout)
+        future = self.submit(coro)
+        try:
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def iterate(self, agen):
+        """Consumes an async generator from synchronous code, cancelling it when the caller stops."""
+        items = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(item)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                # NOTE: Poll so CTRL+C is delivered promptly to the main thread.
+                try:
+                    item = items.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            future.cancel()
+
+
+runtime = AsyncRuntime()
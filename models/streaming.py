@@ -0,0 +1,38 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CODE_FENCE = "```"
+
+
+async def iter_stream_tokens(stream, started: float, label: str, stats: dict | None = None):
+    """Yields content deltas from a chat completion stream, recording time-to-first-token and usage in stats."""
+    stats = stats if stats is not None else {}
+    try:
+        async for chunk in stream:
+            if getattr(chunk, 'usage', None):
+                stats['usage'] = chunk.usage
+            if not chunk.choices:
+                continue
+            token = chunk.choices[0].delta.content
+            if not token:
+                continue
+            if 'ttft_ms' not in stats:
+                stats['ttft_ms'] = (time.perf_counter() - started) * 1000
+                logger.debug("%s time to first token: %.0f ms", label, stats['ttft_ms'])
+            yield token
+    finally:
+        await stream.close()
+        logger.debug("%s stream closed after %.0f ms", label, (time.perf_counter() - started) * 1000)
+
+
+def closed_command_block(text: str) -> str | None:
+    """Returns the text up to the closing code fence once a fenced command block is complete."""
+    opening = text.find(CODE_FENCE)
+    if opening == -1:
+        return None
+    closing = text.find(CODE_FENCE, opening + len(CODE_FENCE))
+    if closing == -1:
+        return None
+    return text[:closing + len(CODE_FENCE)]
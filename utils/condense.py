@@ -0,0 +1,174 @@
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# NOTE: CSI (colours, cursor moves), OSC (window titles, hyperlinks) and the remaining two-byte escapes.
+ESCAPE_SEQUENCE = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)?|\x1b[P^_][^\x1b]*(?:\x1b\\)?|\x1b[@-Z\\-_]|\x1b[()#][0-9A-Za-z]')
+CONTROL_CHARS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+# NOTE: Full screen programs (top, watch, less) clear the screen or jump home before each repaint.
+CLEAR_SCREEN = re.compile(r'\x1b\[(?:1;1)?H|\x1b\[[23]?J|\x1bc')
+ERASE_LINE = '\x1b[K'
+VOLATILE = re.compile(r'\d+|0x[0-9a-fA-F]+')
+ERROR_LINE = re.compile(
+    r'error|fail|fatal|exception|traceback|panic|denied|not found|no such|cannot|can\'t|invalid|segmentation|abort',
+    re.IGNORECASE
+)
+
+
+def split_frames(lines):
+    """Replays screen repaints (top, watch) on a virtual screen and keeps only the final one."""
+    screen = None
+    row = 0
+    repaints = 0
+
+    def write(text):
+        # NOTE: Repaints skip unchanged rows, only rows with visible text or an erase replace the old row.
+        if ESCAPE_SEQUENCE.sub('', text).strip() or ERASE_LINE in text:
+            screen.extend([''] * (row + 1 - len(screen)))
+            screen[row] = text
+
+    for line in lines:
+        if screen is None:
+            if not CLEAR_SCREEN.search(line):
+                yield line
+                continue
+            screen = []
+        position = 0
+        for match in CLEAR_SCREEN.finditer(line):
+            write(line[position:match.start()])
+            position = match.end()
+            if match.group().endswith('H'):
+                repaints += 1
+                row = 0
+            elif match.group().endswith('c') or match.group() == '\x1b[2J':
+                screen.clear()
+            else:
+                del screen[row:]
+        write(line[position:])
+        row += 1
+    if screen is not None:
+        if repaints > 1:
+            yield f"[... {repaints - 1} earlier screen repaints omitted ...]"
+        yield from screen
+
+
+def strip_escape_sequences(lines):
+    """Removes ANSI escape sequences and stray control characters, keeping \\r for the next step."""
+    for line in lines:
+        yield CONTROL_CHARS.sub('', ESCAPE_SEQUENCE.sub('', line))
+
+
+def apply_carriage_returns(lines):
+    """Replays \\r overwrites like a terminal would, so progress bars keep their final state."""
+    for line in lines:
+        line = line.rstrip('\r')
+        if '\r' not in line:
+            yield line.rstrip()
+            continue
+        screen = []
+        for segment in line.split('\r'):
+            screen[:len(segment)] = segment
+        yield ''.join(screen).rstrip()
+
+
+def collapse_repeats(lines, min_run=3, min_similar_run=4):
+    """Collapses runs of identical or near-identical lines (differing in numbers only) into markers.
+
+    Error looking lines are only collapsed when identical, errors differing in a line number or a
+    path are distinct failures that prioritize_errors keeps.
+    """
+    def flush(run, key):
+        if not run:
+            return
+        if key == '':
+            yield ''
+        elif len(run) >= min_run and all(line == run[0] for line in run):
+            yield run[0]
+            yield f"[... previous line repeated {len(run) - 1} more times ...]"
+        elif len(run) < min_similar_run:
+            yield from run
+        else:
+            yield run[0]
+            yield f"[... {len(run) - 2} similar lines omitted ...]"
+            yield run[-1]
+
+    run = []
+    run_key = None
+    for line in lines:
+        key = line.strip() if ERROR_LINE.search(line) else VOLATILE.sub('#', line.strip())
+        if key != run_key:
+            yield from flush(run, run_key)
+            run = []
+            run_key = key
+        run.append(line)
+    yield from flush(run, run_key)
+
+
+def prioritize_errors(lines, max_lines=None):
+    """Bounds the output to max_lines keeping its head, its tail and error looking lines in between."""
+    max_lines = max_lines or int(os.getenv('SHELLM_CONDENSE_MAX_LINES', '200'))
+    lines = list(lines)
+    if len(lines) <= max_lines:
+        yield from lines
+        return
+    head = max_lines // 4
+    tail = max_lines // 2
+    middle = lines[head:len(lines) - tail]
+    errors = [i for i, line in enumerate(middle) if ERROR_LINE.search(line)][:max_lines - head - tail]
+    yield from lines[:head]
+    previous = -1
+    for i in errors:
+        if i - previous > 1:
+            yield f"[... {i - previous - 1} lines omitted ...]"
+        yield middle[i]
+        previous = i
+    if len(middle) - previous > 1:
+        yield f"[... {len(middle) - previous - 1} lines omitted ...]"
+    yield from lines[len(lines) - tail:]
+
+
+STEPS = {
+    'frames': split_frames,
+    'ansi': strip_escape_sequences,
+    'carriage_returns': apply_carriage_returns,
+    'repeats': collapse_repeats,
+    'errors': prioritize_errors,
+}
+DEFAULT_STEPS = 'frames,ansi,carriage_returns,repeats,errors'
+
+
+class OutputCondenser:
+    """Pipeline of line generators that shrinks captured terminal output before it reaches the context.
+
+    Each step takes an iterable of lines and yields lines, so steps can be added, removed or
+    reordered with SHELLM_CONDENSE_STEPS or by registering new ones in STEPS.
+    """
+
+    def __init__(self, steps=None):
+        self.steps = list(steps) if steps is not None else self.steps_from_env()
+
+    @staticmethod
+    def steps_from_env():
+        if os.getenv('SHELLM_CONDENSE', 'true').lower() == 'false':
+            return []
+        steps = []
+        for name in os.getenv('SHELLM_CONDENSE_STEPS', DEFAULT_STEPS).split(','):
+            name = name.strip()
+            if not name:
+                continue
+            if name not in STEPS:
+                logger.warning(f"Unknown output condensation step: {name}")
+                continue
+            steps.append(STEPS[name])
+        return steps
+
+    def condense(self, text: str) -> str:
+        """Runs the output through every step."""
+        if not text or not self.steps:
+            return text
+        lines = iter(text.split('\n'))
+        for step in self.steps:
+            lines = step(lines)
+        return '\n'.join(lines).strip('\n')
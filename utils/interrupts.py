@@ -0,0 +1,16 @@
+import signal
+import threading
+from contextlib import contextmanager
+
+
+@contextmanager
+def interruptible():
+    """Lets CTRL+C raise KeyboardInterrupt inside the block, even when the REPL swallows SIGINT."""
+    if threading.current_thread() is not threading.main_thread():
+        yield
+        return
+    previous = signal.signal(signal.SIGINT, signal.default_int_handler)
+    try:
+        yield
+    finally:
+        signal.signal(signal.SIGINT, previous)
@@ -0,0 +1,229 @@
+import os
+import json
+import math
+import time
+import atexit
+import logging
+import threading
+from collections import Counter, deque
+
+logger = logging.getLogger(__name__)
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of numbers."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def prometheus_labels(**labels):
+    """Formats labels for the Prometheus text format."""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metrics:
+    """In-memory per-request metrics with optional JSONL and Prometheus textfile export.
+
+    Records are usually made on the event loop thread, so the JSONL log is kept open and the
+    Prometheus textfile is rewritten by a background thread, at most every prometheus_interval
+    seconds and once more at exit.
+    """
+
+    def __init__(self, enabled=None, max_records=10000, prometheus_interval=None):
+        self.enabled = enabled if enabled is not None else os.getenv('SHELLM_METRICS', 'true').lower() != 'false'
+        self.records = deque(maxlen=max_records)
+        self.counters = Counter()
+        self.jsonl_path = os.getenv('SHELLM_METRICS_JSONL') or None
+        self.prometheus_path = os.getenv('SHELLM_METRICS_PROM') or None
+        self.prometheus_interval = prometheus_interval if prometheus_interval is not None else float(
+            os.getenv('SHELLM_METRICS_PROM_INTERVAL', '15')
+        )
+        self.jsonl_file = None
+        self.exporter = None
+        self.stale = threading.Event()
+        self.jsonl_lock = threading.Lock()
+        self.export_lock = threading.Lock()
+        if self.enabled and (self.jsonl_path or self.prometheus_path):
+            atexit.register(self.close)
+
+    def increment(self, name, value=1):
+        """Increments a named counter."""
+        if self.enabled:
+            self.counters[name] += value
+
+    def record(self, provider, model, phase, latency_ms, prompt_tokens=None, completion_tokens=None,
+               ttft_ms=None, cache_hit=False, error=None, cached_tokens=None):
+        """Records one LLM request, this is a no-op when metrics are disabled."""
+        if not self.enabled:
+            return
+        record = {
+            'timestamp': time.time(),
+            'provider': provider,
+            'model': model,
+            'phase': phase,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cached_tokens': cached_tokens,
+            'ttft_ms': ttft_ms,
+            'latency_ms': latency_ms,
+            'cache_hit': cache_hit,
+            'error': error,
+        }
+        self.records.append(record)
+        if self.jsonl_path:
+            self.write_jsonl(record)
+        if self.prometheus_path:
+            self.schedule_prometheus_export()
+
+    def write_jsonl(self, record):
+        """Appends a record to the SHELLM_METRICS_JSONL log, opened once and line buffered."""
+        with self.jsonl_lock:
+            try:
+                if self.jsonl_file is None:
+                    self.jsonl_file = open(os.path.expanduser(self.jsonl_path), 'a', buffering=1)
+                self.jsonl_file.write(json.dumps(record) + '\n')
+            except OSError as e:
+                logger.warning(f"Could not write the metrics log {self.jsonl_path}: {e}")
+                self.jsonl_path = None
+
+    def schedule_prometheus_export(self):
+        """Marks the SHELLM_METRICS_PROM textfile stale, starting the thread that rewrites it if needed."""
+        self.stale.set()
+        if self.exporter is None:
+            with self.export_lock:
+                if self.exporter is None:
+                    self.exporter = threading.Thread(target=self.export_loop, name="shellm-metrics", daemon=True)
+                    self.exporter.start()
+
+    def export_loop(self):
+        while True:
+            self.stale.wait()
+            self.flush_prometheus()
+            time.sleep(self.prometheus_interval)
+
+    def flush_prometheus(self):
+        """Rewrites the SHELLM_METRICS_PROM textfile if records were made since the last export."""
+        with self.export_lock:
+            if not self.stale.is_set():
+                return
+            self.stale.clear()
+            try:
+                self.export_prometheus(self.prometheus_path)
+            except OSError as e:
+                logger.warning(f"Could not export the metrics to {self.prometheus_path}: {e}")
+
+    def close(self):
+        """Writes the last Prometheus export and closes the JSONL log, registered to run at exit."""
+        if self.prometheus_path:
+            self.flush_prometheus()
+        with self.jsonl_lock:
+            if self.jsonl_file is not None:
+                self.jsonl_file.close()
+                self.jsonl_file = None
+
+    def summary(self):
+        """Aggregates the records per (provider, model, phase)."""
+        groups = {}
+        for record in list(self.records):
+            key = (record['provider'], record['model'], record['phase'])
+            groups.setdefault(key, []).append(record)
+        rows = []
+        for (provider, model, phase), records in sorted(groups.items()):
+            # NOTE: Cancelled requests (prefetches, CTRL+C) are not errors, and neither they nor cache hits
+            # are representative provider latencies.
+            failed = [r for r in records if r['error'] and r['error'] != 'cancelled']
+            latencies = [r['latency_ms'] for r in records if not r['error'] and not r['cache_hit']]
+            ttfts = [r['ttft_ms'] for r in records if r['ttft_ms'] is not None]
+            rows.append({
+                'provider': provider,
+                'model': model,
+                'phase': phase,
+                'count': len(records),
+                'errors': len(failed),
+                'cache_hits': sum(1 for r in records if r['cache_hit']),
+                'p50_ms': percentile(latencies, 0.5),
+                'p95_ms': percentile(latencies, 0.95),
+                'ttft_p50_ms': percentile(ttfts, 0.5),
+                'successes': len(latencies),
+                'latency_sum_ms': sum(latencies),
+                'prompt_tokens': sum(r['prompt_tokens'] or 0 for r in records),
+                'completion_tokens': sum(r['completion_tokens'] or 0 for r in records),
+                'cached_tokens': sum(r.get('cached_tokens') or 0 for r in records),
+            })
+        return rows
+
+    def report(self, cache=None) -> list[str]:
+        """Human readable lines for the `stats` builtin."""
+        lines = []
+        for row in self.summary():
+            p50 = f"{row['p50_ms']:.0f}" if row['p50_ms'] is not None else "-"
+            p95 = f"{row['p95_ms']:.0f}" if row['p95_ms'] is not None else "-"
+            ttft = f"{row['ttft_p50_ms']:.0f}" if row['ttft_p50_ms'] is not None else "-"
+            lines.append(
+                f"{row['provider']}/{row['model']} {row['phase']}: {row['count']} requests, "
+                f"{row['errors']} errors, {row['cache_hits']} cache hits, p50 {p50} ms, p95 {p95} ms, "
+                f"ttft p50 {ttft} ms, tokens {row['prompt_tokens']} in ({row['cached_tokens']} cached) / {row['completion_tokens']} out"
+            )
+        total = self.counters['validation.local'] + self.counters['validation.llm']
+        for path in ('local', 'llm'):
+            share = self.counters[f'validation.{path}'] / total * 100 if total else 0
+            lines.append(f"validation.{path}: {self.counters[f'validation.{path}']} ({share:.0f}%)")
+        for phase in ('suggestion', 'qa'):
+            if self.counters[f'hedge.{phase}.started']:
+                lines.append(f"hedge.{phase}: {self.counters[f'hedge.{phase}.started']} hedged, {self.counters[f'hedge.{phase}.won']} won by the secondary")
+        if cache:
+            lines.append(f"cache.hits: {cache.hits} cache.misses: {cache.misses} ({cache.hit_rate() * 100:.0f}% hit rate)")
+        return lines
+
+    @staticmethod
+    def append_jsonl(path, records):
+        with open(os.path.expanduser(path), 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+
+    def export_jsonl(self, path):
+        """Appends all records to a JSONL file."""
+        self.append_jsonl(path, list(self.records))
+
+    def export_prometheus(self, path):
+        """Writes the metrics in the Prometheus textfile collector format, atomically."""
+        lines = []
+        rows = self.summary()
+        name = 'shellm_request_latency_seconds'
+        lines += [f"# HELP {name} LLM request latency.", f"# TYPE {name} summary"]
+        for row in rows:
+            labels = dict(provider=row['provider'], model=row['model'], phase=row['phase'])
+            for quantile, key in (('0.5', 'p50_ms'), ('0.95', 'p95_ms')):
+                if row[key] is not None:
+                    lines.append(f"{name}{prometheus_labels(**labels, quantile=quantile)} {row[key] / 1000:.6f}")
+            lines.append(f"{name}_sum{prometheus_labels(**labels)} {row['latency_sum_ms'] / 1000:.6f}")
+            lines.append(f"{name}_count{prometheus_labels(**labels)} {row['successes']}")
+        totals = (
+            ('shellm_requests_total', 'LLM requests.', 'count'),
+            ('shellm_request_errors_total', 'Failed LLM requests.', 'errors'),
+            ('shellm_cache_hits_total', 'Requests served from the suggestion cache.', 'cache_hits'),
+            ('shellm_prompt_tokens_total', 'Prompt tokens sent.', 'prompt_tokens'),
+            ('shellm_cached_prompt_tokens_total', 'Prompt tokens served from the provider prompt cache.', 'cached_tokens'),
+            ('shellm_completion_tokens_total', 'Completion tokens received.', 'completion_tokens'),
+        )
+        for name, help_text, key in totals:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            for row in rows:
+                labels = dict(provider=row['provider'], model=row['model'], phase=row['phase'])
+                lines.append(f"{name}{prometheus_labels(**labels)} {row[key]}")
+        lines += ["# HELP shellm_events_total SheLLM internal events.", "# TYPE shellm_events_total counter"]
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"shellm_events_total{prometheus_labels(event=name)} {value}")
+        path = os.path.expanduser(path)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(temporary_path, path)
+
+
+metrics = Metrics()
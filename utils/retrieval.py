@@ -0,0 +1,71 @@
+import re
+import math
+from collections import Counter, defaultdict
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Splits text into lowercase word tokens, paths and flags are split on punctuation."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Incremental BM25 index over short text chunks, updated as documents are added and removed."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lengths = {}
+        self.terms = {}
+        self.postings = defaultdict(dict)  # NOTE: term -> {doc_id: term frequency}
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def add(self, doc_id, text: str) -> None:
+        """Indexes a document, replacing any previous version with the same id."""
+        if doc_id in self.lengths:
+            self.remove(doc_id)
+        frequencies = Counter(tokenize(text))
+        length = sum(frequencies.values())
+        self.lengths[doc_id] = length
+        self.terms[doc_id] = list(frequencies)
+        self.total_length += length
+        for term, frequency in frequencies.items():
+            self.postings[term][doc_id] = frequency
+
+    def remove(self, doc_id) -> None:
+        """Drops a document from the index."""
+        length = self.lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.terms.pop(doc_id):
+            documents = self.postings[term]
+            documents.pop(doc_id, None)
+            if not documents:
+                del self.postings[term]
+
+    def search(self, query: str, k: int = 5, exclude=()) -> list[tuple]:
+        """Returns the top-k (doc_id, score) pairs for the query."""
+        if not self.lengths:
+            return []
+        count = len(self.lengths)
+        average_length = self.total_length / count or 1
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            documents = self.postings.get(term)
+            if not documents:
+                continue
+            idf = math.log(1 + (count - len(documents) + 0.5) / (len(documents) + 0.5))
+            for doc_id, frequency in documents.items():
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                scores[doc_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        ranked = sorted(
+            ((doc_id, score) for doc_id, score in scores.items() if doc_id not in exclude),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        return ranked[:k]
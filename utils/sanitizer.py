@@ -1,4 +1,11 @@
 import re
 
+CODE_BLOCK_PATTERN = re.compile(r"```[\w+-]*[ \t]*\n?(.*?)(?:```|$)", re.DOTALL)
+
+
 def remove_code_block(input_string):
-    return re.sub(r'```[a-zA-Z]*\n', '', input_string)
+    """Returns the contents of the first fenced code block, or the input without stray backticks."""
+    match = CODE_BLOCK_PATTERN.search(input_string)
+    if match:
+        input_string = match.group(1)
+    return input_string.strip().strip('`').strip()
@@ -1,11 +1,170 @@
-from pydantic import BaseModel
+import os
+import time
+from collections import deque
+from pydantic import BaseModel, Field, PrivateAttr
+
+from utils.retrieval import BM25Index
+from utils.tokens import compact_text, count_tokens
+
+
+class HistoryEntry(BaseModel):
+    id: int = 0
+    command: str
+    output: str
+    exit_code: int | None = None
+    timestamp: float = Field(default_factory=time.time)
+    tokens: int = 0
+    # NOTE: Tokens of the entry as a compacted snippet, counted once when the entry is added.
+    snippet_cost: int = 0
+
+    def render(self, max_tokens: int | None = None) -> str:
+        """Renders the entry, compacting the output into a head/tail snippet past max_tokens."""
+        output = self.output if max_tokens is None else compact_text(self.output, max_tokens)
+        status = f" (exit {self.exit_code})" if self.exit_code else ""
+        return f"> {self.command}{status}\n{output}\n"
+
+    def snippet(self, max_tokens: int) -> str:
+        """Renders the entry as is when it fits max_tokens, compacted otherwise."""
+        return self.render() if self.tokens <= max_tokens else self.render(max_tokens)
 
 
 class Context(BaseModel):
     last_command: str = "echo 'Hello, World!'"
     last_output: str = "Hello, World!\n"
-    session_history: str = ""
+    last_exit_code: int | None = None
+    background_jobs: list[dict] = Field(default_factory=list)
+    # NOTE: Where suggestions will run when that is not this process, e.g. a terminal served by the daemon.
+    shell_cwd: str | None = None
+    shell_path: str | None = None
+    entries: deque[HistoryEntry] = Field(default_factory=deque)
+    max_entries: int = 500
+    token_budget: int = Field(default_factory=lambda: int(os.getenv('SHELLM_CONTEXT_TOKENS', '4000')))
+    snippet_tokens: int = 150
+    stored_tokens: int = 0
+    window_tokens: int = 0
+    top_k: int = Field(default_factory=lambda: int(os.getenv('SHELLM_CONTEXT_TOP_K', '5')))
+    next_id: int = 0
+    _index: BM25Index = PrivateAttr(default_factory=BM25Index)
+    _past_commands: list[str] = PrivateAttr(default_factory=list)
+    _past_index: BM25Index = PrivateAttr(default_factory=BM25Index)
+    _window_start: int = PrivateAttr(default=0)
+
+    def update_session_history(self, command: str, output: str, exit_code: int | None = None) -> None:
+        """Appends the last command and output to the session ring and evicts the oldest entries."""
+        entry = HistoryEntry(id=self.next_id, command=command, output=output, exit_code=exit_code)
+        self.next_id += 1
+        entry.tokens = count_tokens(entry.render())
+        entry.snippet_cost = entry.tokens if entry.tokens <= self.snippet_tokens else count_tokens(entry.render(self.snippet_tokens))
+        # NOTE: The previous latest turn now joins the history window, whose size is kept as a running total.
+        if self.entries and self.entries[-1].id >= self._window_start:
+            self.window_tokens += self.entries[-1].snippet_cost
+        self.entries.append(entry)
+        self.stored_tokens += entry.tokens
+        self._index.add(entry.id, f"{command}\n{output}")
+        # NOTE: Keep a few budgets worth of history around for retrieval, the ring must stay bounded.
+        while len(self.entries) > 1 and (
+            len(self.entries) > self.max_entries or self.stored_tokens > 4 * self.token_budget
+        ):
+            evicted = self.entries.popleft()
+            self.stored_tokens -= evicted.tokens
+            if evicted.id >= self._window_start:
+                self.window_tokens -= evicted.snippet_cost
+            self._index.remove(evicted.id)
+        self.cut_history_window()
+
+    def cut_history_window(self) -> None:
+        """Cuts the history window down to half its budget (half the context budget) once it overflows.
+
+        The window only grows at the end and is cut at once, so its start, and therefore the prompt
+        prefix, stays the same for many requests instead of sliding by one turn every time. Only the
+        thread recording commands moves it, prompts built on other threads just read it.
+        """
+        budget = self.token_budget // 2
+        if self.window_tokens <= budget:
+            return
+        entries = [entry for entry in list(self.entries)[:-1] if entry.id >= self._window_start]
+        total = self.window_tokens
+        while entries and total > budget // 2:
+            total -= entries.pop(0).snippet_cost
+        self.window_tokens = total
+        self._window_start = entries[0].id if entries else self.next_id - 1
+
+    def load_past_commands(self, commands: list[str]) -> None:
+        """Indexes commands from previous sessions (e.g. ~/.shellm_history) for retrieval."""
+        seen = set(self._past_commands)
+        for command in commands:
+            command = command.strip()
+            if not command or command.startswith('#') or command in seen:
+                continue
+            seen.add(command)
+            self._past_index.add(len(self._past_commands), command)
+            self._past_commands.append(command)
+
+    def render_history(self, token_budget: int | None = None, query: str | None = None,
+                       include_latest: bool = True) -> str:
+        """Renders the entries that fit the token budget, oldest first.
+
+        Without a query the newest entries are used. With a query only the latest turn and
+        the top-k most relevant older turns are rendered.
+        """
+        budget = self.token_budget if token_budget is None else token_budget
+        entries = list(self.entries)
+        latest_ids = {entries[-1].id} if include_latest and entries else set()
+        latest = entries[-1:] if include_latest else []
+        if query is None:
+            candidates = entries if include_latest else entries[:-1]
+        else:
+            exclude = {entries[-1].id} if entries else set()
+            relevant = {doc_id for doc_id, _ in self._index.search(query, self.top_k, exclude)}
+            candidates = latest + [entry for entry in entries if entry.id in relevant]
+        rendered = []
+        for index, entry in enumerate(sorted(candidates, key=lambda e: e.id, reverse=True)):
+            if budget <= 0:
+                break
+            # NOTE: The last output gets up to half the budget, older turns are compacted to snippets.
+            limit = budget // 2 if entry.id in latest_ids else min(self.snippet_tokens, budget)
+            text = entry.render() if entry.tokens <= limit else entry.render(limit)
+            budget -= count_tokens(text)
+            rendered.append(text)
+        return ''.join(reversed(rendered))
+
+    def history_window(self) -> list[HistoryEntry]:
+        """Returns the older turns sent as prior messages, oldest first and without the latest turn.
+
+        Does not change the context, see cut_history_window for how the window moves.
+        """
+        start = self._window_start
+        return [entry for entry in list(self.entries)[:-1] if entry.id >= start]
+
+    def relevant_entries(self, query: str) -> list[HistoryEntry]:
+        """Returns the top-k older turns relevant to the query that fell out of the history window."""
+        entries = list(self.entries)
+        exclude = {entry.id for entry in entries if entry.id >= self._window_start}
+        if entries:
+            exclude.add(entries[-1].id)
+        relevant = {doc_id for doc_id, _ in self._index.search(query, self.top_k, exclude)}
+        return [entry for entry in entries if entry.id in relevant]
+
+    def relevant_past_commands(self, query: str, limit: int | None = None) -> list[str]:
+        """Returns the commands from previous sessions most relevant to the query."""
+        hits = self._past_index.search(query, limit or self.top_k)
+        return [self._past_commands[doc_id] for doc_id, _ in hits]
+
+    def latest_output(self, max_tokens: int | None = None) -> str:
+        """Returns the last output, compacted to at most half the token budget."""
+        return compact_text(self.last_output, max_tokens or self.token_budget // 2)
+
+    @property
+    def session_history(self) -> str:
+        """The session history rendered within the token budget."""
+        return self.render_history()
+
+    @property
+    def request_tokens(self) -> int:
+        """Estimated tokens the session adds to the next request: the history window and the latest output."""
+        latest = self.entries[-1].tokens if self.entries else count_tokens(self.last_output)
+        return self.window_tokens + min(latest, self.token_budget // 2)
 
-    def update_session_history(self, command: str, output: str) -> None:
-        """Updates session_history with the last command and output."""
-        self.session_history += f"> {command}\n{output}\n"
+    def recent_commands(self, limit: int = 5) -> list[str]:
+        """Returns the last commands of the session, oldest first."""
+        return [entry.command for entry in list(self.entries)[-limit:]]
@@ -0,0 +1,146 @@
+import os
+import logging
+import importlib
+import functools
+import threading
+
+logger = logging.getLogger(__name__)
+
+CHARS_PER_TOKEN = 4
+# NOTE: Chat formats add a few tokens per message for the role and separators.
+MESSAGE_OVERHEAD_TOKENS = 4
+# NOTE: The last message is not compacted below this, its tail must still hold the request itself.
+MIN_REQUEST_TOKENS = 64
+# NOTE: Context windows by model name prefix, the longest matching prefix wins. SHELLM_CONTEXT_LIMIT overrides them.
+MODEL_CONTEXT_LIMITS = {
+    'gpt-4o': 128000,
+    'gpt-4.1': 1047576,
+    'gpt-4-turbo': 128000,
+    'gpt-4-32k': 32768,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'o1': 200000,
+    'o3': 200000,
+    'o4': 200000,
+    'llama-3.1': 131072,
+    'llama-3.2': 131072,
+    'llama-3.3': 131072,
+    'llama3-': 8192,
+    'mixtral-8x7b-32768': 32768,
+    'gemma': 8192,
+}
+DEFAULT_CONTEXT_LIMIT = 8192
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Roughly estimates the number of tokens in a text."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def compact_text(text: str, max_tokens: int) -> str:
+    """Shrinks text to roughly max_tokens by keeping its head and tail."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    head = text[:max_chars // 2]
+    tail = text[-(max_chars // 2):]
+    # NOTE: Snap to line boundaries so snippets do not start or end mid-line.
+    if '\n' in head[:-1]:
+        head = head[:head.rindex('\n', 0, len(head) - 1)]
+    if '\n' in tail[:-1]:
+        tail = tail[tail.index('\n') + 1:]
+    omitted = text.count('\n', len(head) + 1, len(text) - len(tail))
+    if not omitted:
+        omitted_chars = len(text) - len(head) - len(tail)
+        return f"{head}\n[... {omitted_chars} characters omitted ...]\n{tail}"
+    return f"{head}\n[... {omitted} lines omitted ...]\n{tail}"
+
+
+def load_tokenizer(name: str):
+    """Returns a token counter for SHELLM_TOKENIZER: 'heuristic', 'tiktoken' or 'package.module:function'."""
+    if name == 'heuristic':
+        return estimate_tokens
+    if name == 'tiktoken':
+        import tiktoken
+        encoding = tiktoken.get_encoding(os.getenv('SHELLM_TIKTOKEN_ENCODING', 'o200k_base'))
+        counter = lambda text: len(encoding.encode(text, disallowed_special=()))  # noqa: E731
+    else:
+        module_name, _, function_name = name.partition(':')
+        if not function_name:
+            raise ValueError(f"Unknown tokenizer: {name}")
+        counter = getattr(importlib.import_module(module_name), function_name)
+    # NOTE: Exact tokenizers are slow, the history turns are the same texts request after request.
+    return functools.lru_cache(maxsize=4096)(counter)
+
+
+def set_tokenizer(counter) -> None:
+    """Plugs in an exact token counter (a callable taking a text), None restores SHELLM_TOKENIZER."""
+    global _counter
+    _counter = counter
+
+
+def count_tokens(text: str) -> int:
+    """Counts the tokens of a text with the configured tokenizer, the fast heuristic by default."""
+    global _counter
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                name = os.getenv('SHELLM_TOKENIZER', 'heuristic')
+                try:
+                    _counter = load_tokenizer(name)
+                except Exception as e:
+                    # NOTE: tiktoken is optional, an estimate is better than no count at all.
+                    logger.warning(f"Tokenizer {name} is not available ({e}), estimating token counts instead.")
+                    _counter = estimate_tokens
+    return _counter(text)
+
+
+def context_limit(model: str) -> int:
+    """The context window of a model in tokens."""
+    if os.getenv('SHELLM_CONTEXT_LIMIT'):
+        return int(os.getenv('SHELLM_CONTEXT_LIMIT'))
+    matches = [prefix for prefix in MODEL_CONTEXT_LIMITS if model.startswith(prefix)]
+    return MODEL_CONTEXT_LIMITS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_LIMIT
+
+
+def message_tokens(messages: list[dict]) -> int:
+    return sum(count_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def trim_messages(messages: list[dict], max_tokens: int) -> tuple[list[dict], int, int]:
+    """Fits chat messages into max_tokens, returns (messages, tokens before, tokens after).
+
+    The oldest turns between the system prompt and the last message are dropped first, then the
+    last message is compacted, keeping its tail where the request itself is. Raises ValueError
+    when the system prompt leaves no room for the request.
+    """
+    costs = [count_tokens(message['content']) + MESSAGE_OVERHEAD_TOKENS for message in messages]
+    before = total = sum(costs)
+    if total <= max_tokens:
+        return messages, before, total
+    messages = list(messages)
+    while total > max_tokens and len(messages) > 2:
+        total -= costs.pop(1)
+        messages.pop(1)
+    if total > max_tokens:
+        last = messages[-1]
+        fixed = total - costs[-1]
+        budget = max_tokens - fixed - MESSAGE_OVERHEAD_TOKENS
+        if budget < MIN_REQUEST_TOKENS:
+            raise ValueError(
+                f"The system prompt takes {fixed} of the {max_tokens} tokens the model accepts, "
+                f"leaving no room for the request."
+            )
+        target = budget
+        # NOTE: compact_text sizes by characters, shrink until the configured tokenizer agrees.
+        while True:
+            content = compact_text(last['content'], target)
+            if count_tokens(content) <= budget or target == MIN_REQUEST_TOKENS:
+                break
+            target = max(int(target * 0.8), MIN_REQUEST_TOKENS)
+        messages[-1] = {**last, 'content': content}
+        total += count_tokens(content) - costs[-1] + MESSAGE_OVERHEAD_TOKENS
+    return messages, before, total
@@ -0,0 +1,105 @@
+import os
+import shlex
+import shutil
+import logging
+import subprocess
+
+from utils.sanitizer import remove_code_block
+
+logger = logging.getLogger(__name__)
+
+SHELL_BUILTINS = {
+    '.', ':', '[', 'alias', 'bg', 'bind', 'break', 'builtin', 'caller', 'cd', 'command', 'compgen',
+    'complete', 'continue', 'declare', 'dirs', 'disown', 'echo', 'enable', 'eval', 'exec', 'exit',
+    'export', 'false', 'fc', 'fg', 'getopts', 'hash', 'help', 'history', 'jobs', 'kill', 'let',
+    'local', 'logout', 'mapfile', 'popd', 'printf', 'pushd', 'pwd', 'read', 'readarray', 'readonly',
+    'return', 'set', 'shift', 'shopt', 'source', 'suspend', 'test', 'times', 'trap', 'true', 'type',
+    'typeset', 'ulimit', 'umask', 'unalias', 'unset', 'wait',
+}
+SHELL_KEYWORDS = {
+    '!', '[[', ']]', '{', '}', 'case', 'do', 'done', 'elif', 'else', 'esac', 'fi', 'for',
+    'function', 'if', 'in', 'select', 'then', 'time', 'until', 'while',
+}
+# NOTE: Wrappers whose first non-option argument is the actual program to run.
+COMMAND_WRAPPERS = {'sudo', 'nohup', 'nice', 'env', 'exec', 'command', 'builtin', 'watch', 'timeout'}
+CONTROL_OPERATORS = {'|', '||', '&', '&&', ';', ';;', '(', ')', '|&', '\n'}
+
+
+def check_syntax(command: str) -> str | None:
+    """Runs `bash -n` on the command and returns the syntax error, if any."""
+    try:
+        result = subprocess.run(
+            ['bash', '-n', '-c', command],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            timeout=2
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return f"bash -n failed: {e}"
+    if result.returncode != 0:
+        return result.stderr.strip() or "invalid syntax"
+    return None
+
+
+def command_names(command: str) -> list[str]:
+    """Returns the program names invoked by each simple command of a shell line."""
+    lexer = shlex.shlex(command, posix=True, punctuation_chars=True)
+    lexer.whitespace_split = True
+    names = []
+    expect_name = True
+    for token in lexer:
+        if token in CONTROL_OPERATORS or set(token) <= set('|&;()'):
+            expect_name = True
+            continue
+        if not expect_name:
+            continue
+        if token in ('for', 'select', 'case'):
+            # NOTE: The next word is a loop variable or a case subject, not a program.
+            expect_name = False
+            continue
+        if token in SHELL_KEYWORDS or token.startswith('-') or '=' in token.split('/')[0]:
+            continue
+        if token.startswith(('$', '<', '>')) or token[0].isdigit() and token.rstrip('0123456789') in ('', '>', '<'):
+            expect_name = False
+            continue
+        names.append(token)
+        expect_name = token in COMMAND_WRAPPERS
+    return names
+
+
+def missing_binaries(names: list[str], cwd: str | None = None, path: str | None = None) -> list[str]:
+    """Returns the names that are neither shell builtins nor executables on PATH.
+
+    cwd and path are those of the shell that will run the command, this process's by default.
+    """
+    missing = []
+    for name in names:
+        if name in SHELL_BUILTINS:
+            continue
+        if os.sep in name:
+            if not os.access(os.path.join(cwd or os.getcwd(), os.path.expanduser(name)), os.X_OK):
+                missing.append(name)
+        elif shutil.which(name, path=path) is None:
+            missing.append(name)
+    return missing
+
+
+def validate_locally(command: str, cwd: str | None = None, path: str | None = None) -> tuple[str, str | None]:
+    """Cleans the command and checks it locally (in cwd, with PATH path), returning it with the first problem found."""
+    command = remove_code_block(command)
+    if not command:
+        return command, "empty command"
+    syntax_error = check_syntax(command)
+    if syntax_error:
+        return command, syntax_error
+    try:
+        names = command_names(command)
+    except ValueError as e:
+        return command, f"could not tokenize: {e}"
+    if not names:
+        return command, "no program to run"
+    missing = missing_binaries(names, cwd, path)
+    if missing:
+        return command, f"not found on PATH: {', '.join(missing)}"
+    return command, None